@@ -12,504 +12,593 @@ This is the main Python backend application that handles:
 - Image upload and hosting
 """
 
-from flask import Flask, request, jsonify, render_template, send_from_directory
+from flask import Flask, Response, g, request, jsonify, send_from_directory, has_request_context
+import click
 from flask_cors import CORS
-import sqlite3
 import json
 import datetime
 import os
+import time
 import logging
-import smtplib
-import uuid
-import base64
-from email.mime.text import MimeText
-from email.mime.multipart import MimeMultipart
-from email.mime.image import MimeImage
-from email.utils import formataddr
-import requests
-import mimetypes
+import math
+import shutil
+import hmac
+from functools import wraps
+
+import app_logging
+import attachments
+import broken_links
+import idempotency
+import mail_queue
+from email_templates import render_quote_email, render_quote_section
+from uploads import (IMAGE_UPLOAD_CONFIG, InvalidImage, UploadRequest, UploadTooLarge, request_too_large,
+                     store_upload, upload_digest)
+from batch_writer import WRITE_BEHIND_CONFIG, BatchWriter
+from database import Database, chain_hooks, open_database
+from static_assets import assets, build_assets
+from page_cache import pages
+import migrations
+import pricing
+import queries
+import search
+import stats
+import export
+from metrics import metrics
+from rate_limit import client_address, limiter
 
 
 # Initialize Flask application
-app = Flask(__name__, static_folder='static', template_folder='.')
+# static_folder=None so /static/ requests reach serve_static below
+app = Flask(__name__, static_folder=None, template_folder='.')
+app.request_class = UploadRequest  # attachments stream to disk under a size limit
+app.config['USE_X_SENDFILE'] = os.environ.get('USE_X_SENDFILE', '0') == '1'  # behind nginx/Apache
 CORS(app)  # Enable CORS for all routes
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Configure logging (JSON lines written from a background thread, see app_logging.py)
+app_logging.configure()
 logger = logging.getLogger(__name__)
 
-# Database configuration
-DATABASE = 'jlktran.db'
+# Database configuration: PostgreSQL when DATABASE_URL is set, else an SQLite file
+DATABASE = os.environ.get('DATABASE_PATH', 'jlktran.db')
+DATABASE_URL = os.environ.get('DATABASE_URL', '')
+
+# Per-thread pooled connections (WAL mode on SQLite) shared by all endpoints
+db = open_database(DATABASE_URL or DATABASE)
+
+# Quote/contact inserts go through the group-commit writer when WRITE_BEHIND=1
+store = BatchWriter(db) if WRITE_BEHIND_CONFIG['enabled'] else db
 
 # Email configuration
 EMAIL_CONFIG = {
-    'smtp_server': 'smtp.gmail.com',
-    'smtp_port': 587,
+    'smtp_server': os.environ.get('SMTP_SERVER', 'smtp.gmail.com'),
+    'smtp_port': int(os.environ.get('SMTP_PORT', '587')),
     'email': os.environ.get('EMAIL_ADDRESS', 'jlktransservice@gmail.com'),
     'password': os.environ.get('EMAIL_PASSWORD', ''),  # Use app password for Gmail
-    'from_name': 'JLK Transservice'
+    'from_name': 'JLK Transservice',
+    'use_tls': os.environ.get('EMAIL_USE_TLS', '1') != '0'
 }
 
-# Image hosting configuration (using a simple service like imgbb or similar)
-IMAGE_UPLOAD_CONFIG = {
-    'max_size': 5 * 1024 * 1024,  # 5MB
-    'allowed_extensions': {'png', 'jpg', 'jpeg', 'gif', 'webp'},
-    'upload_dir': 'static/uploads'
-}
+# Public address of the site, used for links in emails rendered outside a request
+PUBLIC_BASE_URL = os.environ.get('PUBLIC_BASE_URL', '')
 
-# Ensure upload directory exists
-os.makedirs(IMAGE_UPLOAD_CONFIG['upload_dir'], exist_ok=True)
+# Email delivery: 'queue' hands messages to the background senders,
+# 'inline' keeps the old behaviour of sending inside the request
+EMAIL_DELIVERY_MODE = os.environ.get('EMAIL_DELIVERY_MODE', 'queue')
 
-def init_database():
-    """Initialize the SQLite database with required tables"""
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    
-    # Create quotes table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS quotes (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            company_name TEXT NOT NULL,
-            contact_name TEXT NOT NULL,
-            email TEXT NOT NULL,
-            phone TEXT NOT NULL,
-            service_type TEXT NOT NULL,
-            origin TEXT,
-            destination TEXT,
-            cargo_type TEXT,
-            weight TEXT,
-            dimensions TEXT,
-            urgency TEXT,
-            additional_services TEXT,
-            description TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            status TEXT DEFAULT 'pending'
-        )
-    ''')
-    
-    # Create contacts table for contact form submissions
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS contacts (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            email TEXT NOT NULL,
-            subject TEXT,
-            message TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            status TEXT DEFAULT 'new'
-        )
-    ''')
-    
-    conn.commit()
-    conn.close()
+# Bearer token for the internal read APIs (/api/quotes, /api/contacts); unset disables them
+ADMIN_API_TOKEN = os.environ.get('ADMIN_API_TOKEN', '')
 
-def allowed_file(filename):
-    """Check if file extension is allowed"""
-    return '.' in filename and \
-           filename.rsplit('.', 1)[1].lower() in IMAGE_UPLOAD_CONFIG['allowed_extensions']
+# Background sender pool for queued quote emails
+outbox = mail_queue.MailQueue(EMAIL_CONFIG)
 
-def save_uploaded_image(file):
-    """Save uploaded image and return URL"""
-    if file and allowed_file(file.filename):
-        # Generate unique filename
-        file_extension = file.filename.rsplit('.', 1)[1].lower()
-        unique_filename = f"{uuid.uuid4().hex}.{file_extension}"
-        file_path = os.path.join(IMAGE_UPLOAD_CONFIG['upload_dir'], unique_filename)
-        
-        # Save file
-        file.save(file_path)
-        
-        # Return URL for accessing the image
-        return f"/static/uploads/{unique_filename}"
-    return None
+# Buffered counts of the 404 page's broken link beacons
+broken_link_log = broken_links.BrokenLinkLog()
 
-def format_quote_email(data, image_url=None):
-    """Format quote data into a nice HTML email"""
-    html_template = """
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <meta charset="UTF-8">
-        <style>
-            body { font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; line-height: 1.6; color: #333; margin: 0; padding: 20px; background-color: #f5f5f5; }
-            .container { max-width: 600px; margin: 0 auto; background: white; border-radius: 10px; box-shadow: 0 4px 6px rgba(0,0,0,0.1); overflow: hidden; }
-            .header { background: linear-gradient(135deg, #1e3a8a, #3b82f6); color: white; padding: 30px; text-align: center; }
-            .header h1 { margin: 0; font-size: 24px; }
-            .header p { margin: 10px 0 0 0; opacity: 0.9; }
-            .content { padding: 30px; }
-            .section { margin-bottom: 25px; }
-            .section h2 { color: #1e3a8a; border-bottom: 2px solid #3b82f6; padding-bottom: 5px; margin-bottom: 15px; font-size: 18px; }
-            .field { margin-bottom: 12px; }
-            .field-label { font-weight: bold; color: #555; margin-bottom: 5px; }
-            .field-value { background: #f8f9ff; padding: 8px 12px; border-radius: 5px; border-left: 3px solid #3b82f6; }
-            .grid { display: grid; grid-template-columns: 1fr 1fr; gap: 15px; }
-            .image-section { text-align: center; margin: 20px 0; }
-            .image-section img { max-width: 100%; height: auto; border-radius: 8px; box-shadow: 0 2px 8px rgba(0,0,0,0.1); }
-            .footer { background: #f1f5f9; padding: 20px; text-align: center; color: #666; font-size: 14px; }
-            .urgent { background: #fef3c7; border-left-color: #f59e0b; }
-            .important { background: #fecaca; border-left-color: #ef4444; }
-            @media (max-width: 600px) {
-                .grid { grid-template-columns: 1fr; }
-                .container { margin: 10px; }
-                .header, .content { padding: 20px; }
-            }
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <div class="header">
-                <h1>🚛 คำขอใบเสนอราคาใหม่</h1>
-                <p>JLK Transservice - บริการโลจิสติกส์มืออาชีพ</p>
-            </div>
-            
-            <div class="content">
-                <div class="section">
-                    <h2>📋 ข้อมูลผู้ติดต่อ</h2>
-                    <div class="grid">
-                        <div class="field">
-                            <div class="field-label">🏢 ชื่อบริษัท</div>
-                            <div class="field-value">{company_name}</div>
-                        </div>
-                        <div class="field">
-                            <div class="field-label">👤 ชื่อผู้ติดต่อ</div>
-                            <div class="field-value">{contact_name}</div>
-                        </div>
-                        <div class="field">
-                            <div class="field-label">✉️ อีเมล</div>
-                            <div class="field-value"><a href="mailto:{email}">{email}</a></div>
-                        </div>
-                        <div class="field">
-                            <div class="field-label">📞 เบอร์โทรศัพท์</div>
-                            <div class="field-value"><a href="tel:{phone}">{phone}</a></div>
-                        </div>
-                    </div>
-                </div>
-
-                <div class="section">
-                    <h2>🚚 ข้อมูลบริการ</h2>
-                    <div class="grid">
-                        <div class="field">
-                            <div class="field-label">🎯 ประเภทบริการ</div>
-                            <div class="field-value">{service_type_text}</div>
-                        </div>
-                        <div class="field">
-                            <div class="field-label">⚡ ความเร่งด่วน</div>
-                            <div class="field-value {urgency_class}">{urgency_text}</div>
-                        </div>
-                        <div class="field">
-                            <div class="field-label">📍 จุดต้นทาง</div>
-                            <div class="field-value">{origin}</div>
-                        </div>
-                        <div class="field">
-                            <div class="field-label">📍 จุดปลายทาง</div>
-                            <div class="field-value">{destination}</div>
-                        </div>
-                    </div>
-                </div>
-
-                <div class="section">
-                    <h2>📦 ข้อมูลสินค้า</h2>
-                    <div class="grid">
-                        <div class="field">
-                            <div class="field-label">📋 ประเภทสินค้า</div>
-                            <div class="field-value">{cargo_type}</div>
-                        </div>
-                        <div class="field">
-                            <div class="field-label">⚖️ น้ำหนัก</div>
-                            <div class="field-value">{weight}</div>
-                        </div>
-                    </div>
-                    <div class="field">
-                        <div class="field-label">📏 ขนาด</div>
-                        <div class="field-value">{dimensions}</div>
-                    </div>
-                </div>
-
-                {additional_services_section}
-
-                {image_section}
-
-                {description_section}
-            </div>
-
-            <div class="footer">
-                <p><strong>JLK Transservice</strong> - บริการโลจิสติกส์ นำเข้า-ส่งออก และพิธีการทางศุลกากร</p>
-                <p>📧 jlktransservice@gmail.com | 📱 ติดต่อกลับภายใน 24 ชั่วโมง</p>
-                <p><em>วันที่ส่งคำขอ: {date_time}</em></p>
-            </div>
-        </div>
-    </body>
-    </html>
-    """
+# Readiness thresholds for /api/health
+HEALTH_CONFIG = {
+    'min_free_bytes': int(os.environ.get('HEALTH_MIN_FREE_MB', '100')) * 1024 * 1024,  # in static/uploads
+}
 
-    # Service type mapping
-    service_types = {
-        'export': '📤 บริการส่งออก',
-        'import': '📥 บริการนำเข้า', 
-        'customs': '🏛️ พิธีการศุลกากร',
-        'domestic': '🚛 ขนส่งภายในประเทศ',
-        'consulting': '💼 ที่ปรึกษาโลจิสติกส์',
-        'other': '🔄 อื่นๆ'
-    }
+def init_database():
+    """Bring the database schema up to date (see migrations.py)"""
+    migrations.migrate(db)
 
-    # Urgency mapping and classes
-    urgency_types = {
-        'standard': 'ปกติ (7-14 วัน)',
-        'urgent': 'เร่งด่วน (3-7 วัน)',
-        'express': 'ด่วนพิเศษ (1-3 วัน)',
-        'same-day': 'ภายในวันเดียว'
-    }
+_started = False
 
-    urgency_classes = {
-        'express': 'important',
-        'same-day': 'important',
-        'urgent': 'urgent'
-    }
+def create_app():
+    """Run the one-time startup work and return the WSGI app
 
-    # Additional services section
-    additional_services_section = ""
-    if data.get('additionalServices'):
-        services_list = json.loads(data.get('additionalServices', '[]'))
-        if services_list:
-            services_html = "<ul>" + "".join([f"<li>{service}</li>" for service in services_list]) + "</ul>"
-            additional_services_section = f"""
-                <div class="section">
-                    <h2>➕ บริการเพิ่มเติม</h2>
-                    <div class="field">
-                        <div class="field-value">{services_html}</div>
-                    </div>
-                </div>
-            """
-
-    # Image section
-    image_section = ""
-    if image_url:
-        image_section = f"""
-            <div class="section">
-                <h2>🖼️ รูปภาพประกอบ</h2>
-                <div class="image-section">
-                    <img src="{request.url_root.rstrip('/')}{image_url}" alt="รูปภาพประกอบคำขอใบเสนอราคา" />
-                    <p style="margin-top: 10px; color: #666; font-size: 14px;">
-                        <a href="{request.url_root.rstrip('/')}{image_url}" target="_blank">ดูรูปภาพขนาดเต็ม</a>
-                    </p>
-                </div>
-            </div>
-        """
-
-    # Description section
-    description_section = ""
-    if data.get('description'):
-        description_section = f"""
-            <div class="section">
-                <h2>💬 รายละเอียดเพิ่มเติม</h2>
-                <div class="field">
-                    <div class="field-value">{data.get('description', '').replace('\n', '<br>')}</div>
-                </div>
-            </div>
-        """
-
-    return html_template.format(
-        company_name=data.get('companyName', '-'),
-        contact_name=data.get('contactName', '-'),
-        email=data.get('email', '-'),
-        phone=data.get('phone', '-'),
-        service_type_text=service_types.get(data.get('serviceType', ''), data.get('serviceType', '-')),
-        urgency_text=urgency_types.get(data.get('urgency', ''), data.get('urgency', '-') if data.get('urgency') else 'ไม่ระบุ'),
-        urgency_class=urgency_classes.get(data.get('urgency', ''), ''),
-        origin=data.get('origin', 'ไม่ระบุ'),
-        destination=data.get('destination', 'ไม่ระบุ'),
-        cargo_type=data.get('cargoType', 'ไม่ระบุ'),
-        weight=f"{data.get('weight', 'ไม่ระบุ')} กก." if data.get('weight') else 'ไม่ระบุ',
-        dimensions=f"{data.get('dimensions', 'ไม่ระบุ')} ซม." if data.get('dimensions') else 'ไม่ระบุ',
-        additional_services_section=additional_services_section,
-        image_section=image_section,
-        description_section=description_section,
-        date_time=datetime.datetime.now().strftime('%d/%m/%Y %H:%M:%S')
-    )
-
-def send_quote_email(data, image_url=None):
+    Creates the upload directory, migrates the schema, loads the asset
+    manifest and the rate table and renders the cached pages. gunicorn calls this once in the
+    master before it forks (see gunicorn.conf.py), so workers start with
+    all of it done and share those pages with the master. The database
+    connections opened here are closed again, since they must not cross
+    a fork.
+    """
+    global _started
+    if not _started:
+        os.makedirs(IMAGE_UPLOAD_CONFIG['upload_dir'], exist_ok=True)
+        init_database()
+        assets.load()
+        pricing.estimator.load()
+        with app.app_context():
+            pages.warm()
+        db.close_pool()
+        _started = True
+    return app
+
+def start_outbox():
+    """Start this process's email senders
+
+    They also deliver what is left in the outbox from before a restart or
+    crash and build due digests, so they run from worker start rather than
+    from the first quote. Called once per serving process (gunicorn's
+    post_worker_init, the ASGI lifespan, `python app.py`), never in one
+    that is about to fork.
+    """
+    if EMAIL_DELIVERY_MODE == 'queue' and EMAIL_CONFIG['password']:
+        outbox.start(db)
+        outbox.notify()
+
+def save_uploaded_image(file):
+    """Save uploaded image, queue its web/thumbnail variants and return a StoredImage"""
+    if file and file.filename:
+        return store_upload(file)
+    return None
+
+def format_quote_email(data, image_url=None, base_url=None, thumbnail_url=None):
+    """Format quote data into a nice HTML email"""
+    if base_url is None:
+        base_url = request.url_root if has_request_context() else PUBLIC_BASE_URL
+    with metrics.stage('email_render'):
+        return render_quote_email(data, image_url, base_url, thumbnail_url=thumbnail_url)
+
+def format_quote_section(data, image_url=None, base_url=None, thumbnail_url=None):
+    """Format quote data as one item of the email digest"""
+    if base_url is None:
+        base_url = request.url_root if has_request_context() else PUBLIC_BASE_URL
+    with metrics.stage('email_render'):
+        return render_quote_section(data, image_url, base_url, thumbnail_url=thumbnail_url)
+
+def quote_email_subject(data):
+    """Subject line for a quote notification"""
+    return f"คำขอใบเสนอราคา - {data.get('companyName', 'Unknown')} | JLK Transservice"
+
+def send_quote_email(data, image_url=None, thumbnail_url=None):
     """Send formatted quote email"""
     try:
-        # Create message
-        msg = MimeMultipart('alternative')
-        msg['Subject'] = f"คำขอใบเสนอราคา - {data.get('companyName', 'Unknown')} | JLK Transservice"
-        msg['From'] = formataddr((EMAIL_CONFIG['from_name'], EMAIL_CONFIG['email']))
-        msg['To'] = EMAIL_CONFIG['email']
-        msg['Reply-To'] = data.get('email', '')
-
         # Create HTML content
-        html_content = format_quote_email(data, image_url)
-        html_part = MimeText(html_content, 'html', 'utf-8')
-        msg.attach(html_part)
+        html_content = attachments.link_variants(format_quote_email(data, image_url, thumbnail_url=thumbnail_url))
+        msg = mail_queue.build_message(EMAIL_CONFIG, EMAIL_CONFIG['email'], quote_email_subject(data),
+                                       html_content, reply_to=data.get('email', ''))
 
         # Send email
         if EMAIL_CONFIG['password']:  # Only send if password is configured
-            with smtplib.SMTP(EMAIL_CONFIG['smtp_server'], EMAIL_CONFIG['smtp_port']) as server:
-                server.starttls()
-                server.login(EMAIL_CONFIG['email'], EMAIL_CONFIG['password'])
-                server.send_message(msg)
+            with metrics.stage('smtp_send'):
+                server = mail_queue.open_smtp_connection(EMAIL_CONFIG)
+                try:
+                    server.send_message(msg)
+                finally:
+                    server.quit()
             return True
         else:
             logger.warning("Email password not configured, skipping email send")
             return False
     except Exception as e:
-        logger.error(f"Failed to send email: {str(e)}")
+        logger.error("Failed to send email: %s", e)
         return False
 
+def queue_quote_email(data, image_url=None, thumbnail_url=None, base_url=None):
+    """Render the quote notification and return a hook that queues it for a quote row"""
+    if not EMAIL_CONFIG['password']:
+        logger.warning("Email password not configured, skipping email send")
+        return None
+    
+    # Under the 'digest' policy quotes that are not urgent wait for the next digest
+    hold = mail_queue.holds_for_digest(data.get('urgency', ''), outbox.config)
+    
+    # Render before the write transaction so the lock is held only for the INSERTs
+    subject = quote_email_subject(data)
+    render = format_quote_section if hold else format_quote_email
+    html_content = render(data, image_url, base_url, thumbnail_url=thumbnail_url)
+    
+    def enqueue(cursor, quote_id):
+        mail_queue.enqueue_email(
+            cursor,
+            to_addr=EMAIL_CONFIG['email'],
+            subject=subject,
+            html_body=html_content,
+            reply_to=data.get('email', ''),
+            quote_id=quote_id,
+            hold=hold
+        )
+    return enqueue
+
+# Fields a quote submission must include
+QUOTE_REQUIRED_FIELDS = ['companyName', 'contactName', 'email', 'phone', 'serviceType']
+
+# Fields a contact message must include
+CONTACT_REQUIRED_FIELDS = ['name', 'email', 'message']
+
+def missing_field(data, required_fields):
+    """First required field that is empty in data, or None"""
+    for field in required_fields:
+        if not data.get(field):
+            return field
+    return None
+
+def build_quote_record(data, stored_image=None):
+    """Map a submitted quote (form field names) to a quotes row"""
+    # Convert additional services list to JSON string
+    additional_services = data.get('additionalServices', [])
+    if isinstance(additional_services, str):
+        try:
+            additional_services = json.loads(additional_services)
+        except:
+            additional_services = []
+    additional_services_json = json.dumps(additional_services)
+    
+    return {
+        'company_name': data['companyName'],
+        'contact_name': data['contactName'],
+        'email': data['email'],
+        'phone': data['phone'],
+        'service_type': data['serviceType'],
+        'origin': data.get('origin', ''),
+        'destination': data.get('destination', ''),
+        'cargo_type': data.get('cargoType', ''),
+        'weight': data.get('weight', ''),
+        'dimensions': data.get('dimensions', ''),
+        'urgency': data.get('urgency', ''),
+        'additional_services': additional_services_json,
+        'description': data.get('description', ''),
+        'attachment_hash': stored_image.digest if stored_image else None
+    }
+
+def build_contact_record(data):
+    """Map a submitted contact message to a contacts row"""
+    return {
+        'name': data['name'],
+        'email': data['email'],
+        'subject': data.get('subject', ''),
+        'message': data['message']
+    }
+
+def attachment_reference_hook(stored_image):
+    """after_insert hook counting the quote's reference to its attachment, or None"""
+    if not stored_image:
+        return None
+    
+    def reference_attachment(cursor, quote_id):
+        attachments.add_reference(cursor, stored_image.digest, stored_image.extension, stored_image.size)
+    return reference_attachment
+
+# Reply to a client over its rate limit
+RATE_LIMIT_MESSAGE = 'ส่งข้อมูลบ่อยเกินไป กรุณาลองใหม่อีกครั้งในภายหลัง'
+
+def retry_after_header(seconds):
+    """Retry-After value (whole seconds, at least 1)"""
+    return str(max(1, math.ceil(seconds)))
+
+def too_many_requests(retry_after):
+    """429 response for a rate-limited form post"""
+    response = jsonify({
+        'success': False,
+        'message': RATE_LIMIT_MESSAGE
+    })
+    response.status_code = 429
+    response.headers['Retry-After'] = retry_after_header(retry_after)
+    return response
+
+def request_client_address():
+    """Client address the rate limiter keys on"""
+    return client_address(request.remote_addr, request.headers.get('X-Forwarded-For'))
+
+def duplicate_quote_payload(quote_id, response):
+    """Reply to a repeated quote: the original submission's id and email outcome"""
+    return {
+        'success': True,
+        'message': quote_response_message(response.get('email_sent', True)),
+        'quote_id': quote_id,
+        'image_url': response.get('image_url'),
+        'estimate': response.get('estimate'),
+        'duplicate': True
+    }
+
+def duplicate_contact_payload(contact_id, response):
+    """Reply to a repeated contact message: the original message's id"""
+    return {
+        'success': True,
+        'message': 'ส่งข้อความสำเร็จ',
+        'contact_id': contact_id,
+        'duplicate': True
+    }
+
+def quote_response_message(email_sent):
+    """Success message for a stored quote"""
+    response_message = 'ส่งคำขอใบเสนอราคาสำเร็จ'
+    if not email_sent:
+        response_message += ' (บันทึกข้อมูลแล้ว แต่ไม่สามารถส่งอีเมลได้)'
+    return response_message
+
+def quote_estimate(data):
+    """Indicative price for quote form data, or None; counted by result"""
+    try:
+        estimate = pricing.estimator.estimate(data)
+    except pricing.InvalidEstimate:
+        metrics.inc('jlk_estimates_total', (('result', 'invalid'),))
+        raise
+    metrics.inc('jlk_estimates_total', (('result', 'priced' if estimate else 'unpriced'),))
+    return estimate
+
+def health_status():
+    """Readiness payload: the database answers and static/uploads has room left"""
+    checks = {}
+    try:
+        began = time.perf_counter()
+        db.connection().execute('SELECT 1').fetchone()
+        checks['database'] = {'status': 'ok', 'latency_ms': round((time.perf_counter() - began) * 1000, 2)}
+    except db.Error as e:
+        checks['database'] = {'status': 'error', 'error': str(e)}
+    try:
+        free = shutil.disk_usage(IMAGE_UPLOAD_CONFIG['upload_dir']).free
+        checks['uploads_disk'] = {
+            'status': 'ok' if free >= HEALTH_CONFIG['min_free_bytes'] else 'low',
+            'free_bytes': free
+        }
+    except OSError as e:
+        checks['uploads_disk'] = {'status': 'error', 'error': str(e)}
+    
+    healthy = all(check['status'] == 'ok' for check in checks.values())
+    return {
+        'status': 'healthy' if healthy else 'unhealthy',
+        'timestamp': datetime.datetime.now().isoformat(),
+        'service': 'JLK Transservice Backend',
+        'checks': checks
+    }
+
+def health_http_status(status):
+    """HTTP status for a health payload: 503 takes the instance out of rotation"""
+    return 200 if status['status'] == 'healthy' else 503
+
+# Gauges read when /api/metrics is scraped
+metrics.gauge('jlk_email_queue_depth', 'Messages waiting in the email outbox',
+              lambda: mail_queue.count_pending(db.connection()))
+metrics.gauge('jlk_email_digest_held', 'Quotes waiting for the next email digest',
+              lambda: mail_queue.count_held(db.connection()))
+metrics.gauge('jlk_uploads_free_bytes', 'Free disk space for static/uploads',
+              lambda: shutil.disk_usage(IMAGE_UPLOAD_CONFIG['upload_dir']).free)
+
+@app.before_request
+def start_request_metrics():
+    g.metrics_started = metrics.begin_request()
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    app_logging.bind_request(app_logging.request_id_from(request.headers.get('X-Request-ID')),
+                             request.method, route)
+
+@app.teardown_request
+def end_request_logging(error):
+    app_logging.clear_request()
+
+@app.teardown_appcontext
+def release_database(error):
+    # Hands a pooled PostgreSQL connection back; SQLite keeps its per-thread connection
+    db.release()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.get('metrics_started')
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.end_request(request.method, route, response.status_code, started)
+    request_id = app_logging.current_request_id()
+    if request_id:
+        response.headers['X-Request-ID'] = request_id
+    return response
+
 @app.route('/')
 def index():
     """Serve the main index page"""
-    return render_template('index.html')
+    return pages.respond('index.html')
 
 @app.route('/<path:filename>')
 def serve_pages(filename):
     """Serve HTML pages"""
     if filename.endswith('.html'):
-        return render_template(filename)
+        return pages.respond(filename)
+    response = assets.serve(filename) if filename.startswith('public/') else None
+    if response is not None:
+        return response
     return send_from_directory('.', filename)
 
 @app.route('/static/<path:filename>')
 def serve_static(filename):
     """Serve static files"""
-    return send_from_directory('static', filename)
+    response = assets.serve('static/' + filename)
+    if response is not None:
+        return response
+    response = send_from_directory('static', filename)
+    if attachments.is_blob_url_path(filename):
+        # Blob URLs are named by content hash, so they never change
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = attachments.ATTACHMENT_CONFIG['cache_max_age']
+        response.cache_control.immutable = True
+    return response
 
 @app.route('/api/quote', methods=['POST'])
 def submit_quote():
     """Handle quote form submission with image upload and improved email formatting"""
     try:
+        # Turn floods away by client address before reading the body
+        retry_after = limiter.check('quote', 'ip', request_client_address())
+        if retry_after:
+            return too_many_requests(retry_after)
+        
+        # Reject oversized posts from the Content-Length header before parsing anything
+        if request_too_large(request.content_length):
+            return jsonify({
+                'success': False,
+                'message': 'ไฟล์รูปภาพใหญ่เกินไป (สูงสุด 5MB)'
+            }), 400
+        
         # Handle both JSON and form data
         if request.content_type and 'application/json' in request.content_type:
             data = request.get_json()
             image_file = None
         else:
-            # Form data with possible file upload
-            data = request.form.to_dict()
-            image_file = request.files.get('attachment')
-        
-        # Validate required fields
-        required_fields = ['companyName', 'contactName', 'email', 'phone', 'serviceType']
-        for field in required_fields:
-            if not data.get(field):
-                return jsonify({
-                    'success': False,
-                    'message': f'กรุณากรอก {field} ให้ครบถ้วน'
-                }), 400
-        
-        # Handle image upload
-        image_url = None
-        if image_file and image_file.filename:
-            # Validate file size
-            image_file.seek(0, 2)  # Seek to end
-            file_size = image_file.tell()
-            image_file.seek(0)  # Reset to beginning
-            
-            if file_size > IMAGE_UPLOAD_CONFIG['max_size']:
+            # Form data with possible file upload (streamed to disk while parsing)
+            try:
+                data = request.form.to_dict()
+                image_file = request.files.get('attachment')
+            except UploadTooLarge:
                 return jsonify({
                     'success': False,
                     'message': 'ไฟล์รูปภาพใหญ่เกินไป (สูงสุด 5MB)'
                 }), 400
-            
-            if not allowed_file(image_file.filename):
-                return jsonify({
-                    'success': False,
-                    'message': 'รูปแบบไฟล์ไม่ถูกต้อง (รองรับเฉพาะ jpg, png, gif, webp)'
-                }), 400
-            
-            # Save image
-            image_url = save_uploaded_image(image_file)
         
-        # Convert additional services list to JSON string
-        additional_services = data.get('additionalServices', [])
-        if isinstance(additional_services, str):
-            try:
-                additional_services = json.loads(additional_services)
-            except:
-                additional_services = []
-        additional_services_json = json.dumps(additional_services)
+        # A repeat of a stored submission (double-click, retry) gets the original id
+        digest = upload_digest(image_file) if image_file and image_file.filename else None
+        key = idempotency.submission_key('quotes', data, digest, request.headers.get('Idempotency-Key'))
+        duplicate = idempotency.find_duplicate(db, key)
+        if duplicate:
+            return jsonify(duplicate_quote_payload(*duplicate))
+        
+        retry_after = limiter.check('quote', 'email', data.get('email'))
+        if retry_after:
+            return too_many_requests(retry_after)
+        
+        # Validate required fields
+        with metrics.stage('validation'):
+            field = missing_field(data, QUOTE_REQUIRED_FIELDS)
+        if field:
+            return jsonify({
+                'success': False,
+                'message': f'กรุณากรอก {field} ให้ครบถ้วน'
+            }), 400
         
-        # Insert into database
-        conn = sqlite3.connect(DATABASE)
-        cursor = conn.cursor()
+        # Handle image upload (type checked from the file content, not its name)
+        stored_image = None
+        try:
+            with metrics.stage('image_save'):
+                stored_image = save_uploaded_image(image_file)
+        except InvalidImage:
+            return jsonify({
+                'success': False,
+                'message': 'รูปแบบไฟล์ไม่ถูกต้อง (รองรับเฉพาะ jpg, png, gif, webp)'
+            }), 400
         
-        cursor.execute('''
-            INSERT INTO quotes (
-                company_name, contact_name, email, phone, service_type,
-                origin, destination, cargo_type, weight, dimensions,
-                urgency, additional_services, description
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            data['companyName'],
-            data['contactName'],
-            data['email'],
-            data['phone'],
-            data['serviceType'],
-            data.get('origin', ''),
-            data.get('destination', ''),
-            data.get('cargoType', ''),
-            data.get('weight', ''),
-            data.get('dimensions', ''),
-            data.get('urgency', ''),
-            additional_services_json,
-            data.get('description', '')
-        ))
+        image_url = stored_image.url if stored_image else None
         
-        quote_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        # Insert into database (and queue the notification in the same transaction)
+        record = build_quote_record(data, stored_image)
         
-        # Send formatted email
-        email_sent = send_quote_email(data, image_url)
+        # Indicative price from the rate table; a value it cannot read just means no estimate
+        try:
+            estimate = quote_estimate(data)
+        except pricing.InvalidEstimate:
+            estimate = None
         
-        response_message = 'ส่งคำขอใบเสนอราคาสำเร็จ'
-        if not email_sent:
-            response_message += ' (บันทึกข้อมูลแล้ว แต่ไม่สามารถส่งอีเมลได้)'
+        # Count the quote's reference to its attachment and record its key in the same transaction
+        # (with the response fields a repeated post is answered with)
+        reference_attachment = attachment_reference_hook(stored_image)
+        response_fields = {'image_url': image_url, 'estimate': estimate}
+        
+        if EMAIL_DELIVERY_MODE == 'queue':
+            # Rendered with the original upload; the variants are linked when it is sent
+            enqueue_email = queue_quote_email(data, image_url)
+            response_fields['email_sent'] = enqueue_email is not None
+            remember = idempotency.remember_hook(key, response_fields)
+            with metrics.stage('db_insert'):
+                quote_id = store.save_quote(record, after_insert=chain_hooks(reference_attachment, remember,
+                                                                             enqueue_email))
+            email_sent = enqueue_email is not None
+            if email_sent:
+                outbox.start(db)
+                outbox.notify()
+        else:
+            remember = idempotency.remember_hook(key, response_fields)
+            with metrics.stage('db_insert'):
+                quote_id = store.save_quote(record, after_insert=chain_hooks(reference_attachment, remember))
+            # Send formatted email
+            email_sent = send_quote_email(data, image_url)
+            if not email_sent:
+                idempotency.update_response(db, key, quote_id, dict(response_fields, email_sent=False))
         
         return jsonify({
             'success': True,
-            'message': response_message,
+            'message': quote_response_message(email_sent),
             'quote_id': quote_id,
-            'image_url': image_url
+            'image_url': image_url,
+            'estimate': estimate
         })
         
+    except idempotency.DuplicateSubmission as e:
+        # An identical post was stored while this one was being processed
+        return jsonify(duplicate_quote_payload(e.record_id, e.response))
     except Exception as e:
-        logger.error(f"Error submitting quote: {str(e)}")
+        logger.error("Error submitting quote: %s", e)
         return jsonify({
             'success': False,
             'message': 'เกิดข้อผิดพลาดในการส่งข้อมูล'
         }), 500
 
+@app.route('/api/estimate', methods=['GET'])
+def estimate_price():
+    """Instant indicative price; serviceType, origin, destination, weight, dimensions, urgency"""
+    try:
+        estimate = quote_estimate(request.args)
+    except pricing.InvalidEstimate as e:
+        return jsonify({
+            'success': False,
+            'message': f'พารามิเตอร์ไม่ถูกต้อง: {str(e)}'
+        }), 400
+    if estimate is None:
+        return jsonify({
+            'success': True,
+            'estimate': None,
+            'message': 'ยังไม่มีราคาประเมินสำหรับข้อมูลนี้ ทีมงานจะแจ้งราคาในใบเสนอราคา'
+        })
+    return jsonify({'success': True, 'estimate': estimate})
+
+@app.route('/api/404-log', methods=['POST'])
+def log_broken_link():
+    """Beacon from 404.html; counted in memory and written in batches, always 204"""
+    body = request.stream.read(broken_links.BROKEN_LINKS_CONFIG['max_body'] + 1)
+    broken_link_log.start(db)
+    broken_link_log.record(body)
+    return '', 204
+
 @app.route('/api/contact', methods=['POST'])
 def submit_contact():
     """Handle contact form submission - saves to database"""
     try:
+        retry_after = limiter.check('contact', 'ip', request_client_address())
+        if retry_after:
+            return too_many_requests(retry_after)
+        
         data = request.get_json()
         
-        # Validate required fields
-        required_fields = ['name', 'email', 'message']
-        for field in required_fields:
-            if not data.get(field):
-                return jsonify({
-                    'success': False,
-                    'message': f'กรุณากรอก {field} ให้ครบถ้วน'
-                }), 400
+        # A repeat of a stored message gets the original id
+        key = idempotency.submission_key('contacts', data, header_key=request.headers.get('Idempotency-Key'))
+        duplicate = idempotency.find_duplicate(db, key)
+        if duplicate:
+            return jsonify(duplicate_contact_payload(*duplicate))
         
-        # Insert into database
-        conn = sqlite3.connect(DATABASE)
-        cursor = conn.cursor()
+        retry_after = limiter.check('contact', 'email', data.get('email'))
+        if retry_after:
+            return too_many_requests(retry_after)
         
-        cursor.execute('''
-            INSERT INTO contacts (name, email, subject, message)
-            VALUES (?, ?, ?, ?)
-        ''', (
-            data['name'],
-            data['email'],
-            data.get('subject', ''),
-            data['message']
-        ))
+        # Validate required fields
+        field = missing_field(data, CONTACT_REQUIRED_FIELDS)
+        if field:
+            return jsonify({
+                'success': False,
+                'message': f'กรุณากรอก {field} ให้ครบถ้วน'
+            }), 400
         
-        contact_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        # Insert into database (with the message's key, in the same transaction)
+        contact_id = store.save_contact(build_contact_record(data), after_insert=idempotency.remember_hook(key))
         
         return jsonify({
             'success': True,
@@ -517,39 +606,254 @@ def submit_contact():
             'contact_id': contact_id
         })
         
+    except idempotency.DuplicateSubmission as e:
+        return jsonify(duplicate_contact_payload(e.record_id, e.response))
     except Exception as e:
-        logger.error(f"Error submitting contact: {str(e)}")
+        logger.error("Error submitting contact: %s", e)
         return jsonify({
             'success': False,
             'message': 'เกิดข้อผิดพลาดในการส่งข้อมูล'
         }), 500
 
+def require_admin_token(view):
+    """Allow a view only with 'Authorization: Bearer <ADMIN_API_TOKEN>'"""
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        supplied = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+        if not ADMIN_API_TOKEN or not hmac.compare_digest(supplied, ADMIN_API_TOKEN):
+            return jsonify({
+                'success': False,
+                'message': 'ไม่มีสิทธิ์เข้าถึงข้อมูล'
+            }), 403
+        return view(*args, **kwargs)
+    return wrapped
+
+def list_records(table):
+    """Stream one keyset-paginated page of a table as JSON"""
+    try:
+        body = queries.stream_page(db, table, request.args)
+    except queries.InvalidQuery as e:
+        return jsonify({
+            'success': False,
+            'message': f'พารามิเตอร์ไม่ถูกต้อง: {str(e)}'
+        }), 400
+    return Response(body, mimetype='application/json')
+
+@app.route('/api/quotes', methods=['GET'])
+@require_admin_token
+def list_quotes():
+    """List quotes newest first; filters: status, service_type, urgency, created_from, created_to"""
+    return list_records('quotes')
+
+@app.route('/api/contacts', methods=['GET'])
+@require_admin_token
+def list_contacts():
+    """List contact messages newest first; filters: status, created_from, created_to"""
+    return list_records('contacts')
+
+@app.route('/api/search', methods=['GET'])
+@require_admin_token
+def search_records():
+    """Ranked full-text search; q=text, type=quotes|contacts (default both), limit"""
+    kind = request.args.get('type', '')
+    try:
+        hits = search.search(db, request.args.get('q', ''),
+                             tables=(kind,) if kind else None,
+                             limit=request.args.get('limit'))
+    except search.InvalidSearch as e:
+        return jsonify({
+            'success': False,
+            'message': f'คำค้นหาไม่ถูกต้อง: {str(e)}'
+        }), 400
+    return jsonify({
+        'success': True,
+        'count': len(hits),
+        'results': hits
+    })
+
+@app.route('/api/broken-links', methods=['GET'])
+@require_admin_token
+def list_broken_links():
+    """Missing paths reported by the 404 page, most hit first; limit"""
+    try:
+        links = broken_links.top_links(db, request.args.get('limit'))
+    except queries.InvalidQuery as e:
+        return jsonify({
+            'success': False,
+            'message': f'พารามิเตอร์ไม่ถูกต้อง: {str(e)}'
+        }), 400
+    return jsonify({
+        'success': True,
+        'count': len(links),
+        'links': links
+    })
+
+@app.route('/api/stats', methods=['GET'])
+@require_admin_token
+def quote_stats():
+    """Quotes per hour/day from the rollups; granularity=day|hour,
+    dimension=all|service_type|urgency|lane, from, to, top"""
+    try:
+        result = stats.quote_stats(db, request.args)
+    except stats.InvalidStats as e:
+        return jsonify({
+            'success': False,
+            'message': f'พารามิเตอร์ไม่ถูกต้อง: {str(e)}'
+        }), 400
+    return jsonify({'success': True, **result})
+
+@app.route('/api/export', methods=['GET'])
+@require_admin_token
+def export_records():
+    """Download a whole table; table=quotes|contacts, format=csv|jsonl|parquet,
+    compression=none|gzip|zstd, created_from, created_to"""
+    table = request.args.get('table', 'quotes')
+    fmt = request.args.get('format', 'csv')
+    compression = request.args.get('compression', 'none')
+    try:
+        body = export.export_stream(db, table, fmt, compression,
+                                    created_from=request.args.get('created_from'),
+                                    created_to=request.args.get('created_to'))
+    except export.InvalidExport as e:
+        return jsonify({
+            'success': False,
+            'message': f'พารามิเตอร์ไม่ถูกต้อง: {str(e)}'
+        }), 400
+    filename = export.export_filename(table, fmt, compression)
+    return Response(body, content_type=export.export_media_type(fmt, compression),
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
-    return jsonify({
-        'status': 'healthy',
-        'timestamp': datetime.datetime.now().isoformat(),
-        'service': 'JLK Transservice Backend'
-    })
+    status = health_status()
+    return jsonify(status), health_http_status(status)
+
+@app.route('/api/metrics', methods=['GET'])
+@require_admin_token
+def metrics_endpoint():
+    """Prometheus metrics, totals across all workers"""
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.cli.command('gc-attachments')
+@click.option('--grace-hours', default=24.0, show_default=True,
+              help='Keep blobs touched more recently than this.')
+@click.option('--dry-run', is_flag=True, help='Only report what would be removed.')
+def gc_attachments(grace_hours, dry_run):
+    """Remove attachment blobs that no quote references"""
+    stats = attachments.collect_garbage(db, grace_seconds=grace_hours * 3600, dry_run=dry_run)
+    click.echo(f"unreferenced={stats['unreferenced']} orphaned={stats['orphaned']} "
+               f"files_removed={stats['files_removed']}{' (dry run)' if dry_run else ''}")
+
+@app.cli.command('build-assets')
+def build_assets_command():
+    """Fingerprint and precompress static/ and public/ into the asset build directory"""
+    manifest = build_assets()
+    compressed = sum(1 for entry in manifest.values() if entry['encodings'])
+    click.echo(f"assets={len(manifest)} compressed={compressed}")
+
+@app.cli.command('rebuild-search')
+def rebuild_search_command():
+    """Rebuild the full-text search indexes from the quotes and contacts tables"""
+    try:
+        search.rebuild_search(db)
+    except search.InvalidSearch as e:
+        raise click.ClickException(str(e))
+    click.echo('search indexes rebuilt')
+
+@app.cli.command('rebuild-stats')
+def rebuild_stats_command():
+    """Recompute the quote rollups behind /api/stats from the quotes table"""
+    stats.rebuild_stats(db)
+    click.echo('quote rollups rebuilt')
+
+@app.cli.command('migrate')
+@click.option('--to', 'target', type=int, help='Stop after this schema version.')
+@click.option('--status', is_flag=True, help='Only list the migrations not yet applied.')
+def migrate_command(target, status):
+    """Apply pending schema migrations"""
+    if status:
+        for version, name in migrations.pending(db):
+            click.echo(f"pending {version}: {name}")
+        return
+    applied = migrations.migrate(db, target)
+    click.echo(f"{db.dialect}: applied={applied or 'none'}")
+
+@app.cli.command('copy-to-postgres')
+@click.option('--source', default=DATABASE, show_default=True, help='SQLite database to copy from.')
+@click.option('--batch-size', type=int, help='Rows per COPY transaction.')
+def copy_to_postgres_command(source, batch_size):
+    """Copy an SQLite database into the PostgreSQL database at DATABASE_URL"""
+    if db.dialect != 'postgresql':
+        raise click.ClickException('set DATABASE_URL to the target PostgreSQL database')
+    import postgres
+    migrations.migrate(db)
+    copied = postgres.copy_from_sqlite(Database(source), db, batch_size=batch_size,
+                                       progress=lambda table, rows: click.echo(f"{table}: {rows}", err=True))
+    for table, rows in copied.items():
+        click.echo(f"{table}={rows}")
+
+@app.cli.command('export')
+@click.argument('table', type=click.Choice(['quotes', 'contacts']))
+@click.option('--format', 'fmt', type=click.Choice(export.FORMATS), default='csv', show_default=True)
+@click.option('--compression', type=click.Choice(export.COMPRESSIONS), default='none', show_default=True)
+@click.option('--from', 'created_from', help='Only rows created at or after this date/time.')
+@click.option('--to', 'created_to', help='Only rows created before this date/time.')
+@click.option('--output', '-o', help='File to write (default: <table>.<format>[.gz|.zst]; - for stdout).')
+def export_command(table, fmt, compression, created_from, created_to, output):
+    """Export a table to CSV, JSONL or Parquet"""
+    try:
+        chunks = export.export_stream(db, table, fmt, compression, created_from, created_to)
+    except export.InvalidExport as e:
+        raise click.BadParameter(str(e))
+    output = output or export.export_filename(table, fmt, compression)
+    stream = click.get_binary_stream('stdout') if output == '-' else open(output, 'wb')
+    written = 0
+    try:
+        for chunk in chunks:
+            stream.write(chunk)
+            written += len(chunk)
+    finally:
+        if output != '-':
+            stream.close()
+    if output != '-':
+        click.echo(f"{table} -> {output} ({written} bytes)")
+
+@app.cli.command('send-digest')
+@click.option('--timeout', default=60.0, show_default=True, help='Seconds to wait for delivery.')
+def send_digest_command(timeout):
+    """Send the quotes held for the email digest now instead of at the next interval"""
+    digest_id = outbox.build_digest(db.connection(), force=True)
+    if digest_id is None:
+        click.echo('no quotes waiting for a digest')
+        return
+    outbox.start(db)
+    outbox.notify()
+    delivered = outbox.wait_idle(timeout)
+    outbox.stop()
+    click.echo(f"digest={digest_id} {'sent' if delivered else 'queued (not delivered yet)'}")
 
 @app.errorhandler(404)
 def not_found(error):
     """Handle 404 errors"""
-    return render_template('404.html'), 404
+    return pages.respond('404.html', status=404)
 
 @app.errorhandler(500)
 def internal_error(error):
     """Handle 500 errors"""
-    logger.error(f"Internal server error: {str(error)}")
+    logger.error("Internal server error: %s", error)
     return jsonify({
         'success': False,
         'message': 'เกิดข้อผิดพลาดภายในเซิร์ฟเวอร์'
     }), 500
 
 if __name__ == '__main__':
-    # Initialize database
-    init_database()
+    # Initialize database and render the HTML pages before the first request
+    create_app()
+    
+    # With the reloader only the child process serves (and sends mail)
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_outbox()
     
     # Start the Flask development server
     print("🚀 Starting JLK Transservice Backend Server...")
@@ -0,0 +1,234 @@
+"""
+JLK Transservice - Structured, non-blocking logging
+
+configure() puts one handler on the root logger. Request threads only run
+its filters and put the record on an in-memory queue; a QueueListener
+thread per process formats it and writes it to stderr. A slow disk or log
+collector then holds up the listener, not the requests. If the queue is
+full (`queue_size` records) the record is dropped and counted in
+jlk_log_records_dropped_total instead of waiting.
+
+Records are JSON lines: time, level, logger, message and, when logged
+while a request is being handled, its request_id, method, route and
+elapsed_ms. Messages use %-style arguments (logger.info("... %s", value)),
+which are only formatted on the listener thread, and only for records
+that are actually written. Arguments should therefore be values that
+do not change after the call.
+
+Each message template is rate-limited per process: `rate_limit_burst`
+records at once, then `rate_limit_per_minute`. The first record let
+through after a quiet spell carries the number suppressed before it.
+
+LOG_FORMAT=text writes plain lines instead of JSON; LOG_QUEUE=0 writes
+each record synchronously from the thread that logs it.
+"""
+
+import contextvars
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import re
+import threading
+import time
+import uuid
+
+from metrics import metrics
+
+# Logging configuration
+LOGGING_CONFIG = {
+    'level': os.environ.get('LOG_LEVEL', 'INFO').upper(),
+    'format': os.environ.get('LOG_FORMAT', 'json'),  # json or text
+    'queue': os.environ.get('LOG_QUEUE', '1') != '0',
+    'queue_size': int(os.environ.get('LOG_QUEUE_SIZE', '10000')),  # records waiting for the listener
+    'rate_limit_burst': int(os.environ.get('LOG_RATE_LIMIT_BURST', '20')),  # per message template
+    'rate_limit_per_minute': float(os.environ.get('LOG_RATE_LIMIT_PER_MINUTE', '60')),
+    'rate_limit_templates': 1024,  # templates tracked per process
+}
+
+TEXT_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+
+# Fields copied from the request context onto each record
+CONTEXT_FIELDS = ('request_id', 'method', 'route')
+
+# X-Request-ID values accepted from a proxy; anything else gets a new id
+_REQUEST_ID = re.compile(r'[A-Za-z0-9._-]{1,128}')
+
+_context = contextvars.ContextVar('log_context', default=None)
+
+_installed = []
+
+
+# -- request context ------------------------------------------------------
+
+def request_id_from(header):
+    """The proxy's X-Request-ID if it is a plausible id, else a new one"""
+    if header and _REQUEST_ID.fullmatch(header):
+        return header
+    return uuid.uuid4().hex
+
+
+def bind_request(request_id, method, route):
+    """Tag records logged from now on in this context with the request's fields"""
+    _context.set({'request_id': request_id, 'method': method, 'route': route,
+                  'started': time.perf_counter()})
+
+
+def clear_request():
+    """End of request: later records carry no request fields"""
+    _context.set(None)
+
+
+def current_request_id():
+    """Id of the request being handled in this context, or None"""
+    context = _context.get()
+    return context['request_id'] if context else None
+
+
+class RequestContextFilter(logging.Filter):
+    """Adds the request fields and elapsed_ms to records logged during a request"""
+
+    def filter(self, record):
+        context = _context.get()
+        if context is not None:
+            for field in CONTEXT_FIELDS:
+                setattr(record, field, context[field])
+            record.elapsed_ms = round((time.perf_counter() - context['started']) * 1000, 2)
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """Token bucket per (logger, level, message template); counts what it suppresses"""
+
+    def __init__(self, burst, per_minute, max_templates=1024):
+        super().__init__()
+        self.burst = burst
+        self.rate = per_minute / 60.0
+        self.max_templates = max_templates
+        self._buckets = {}  # key -> [tokens, last refill, suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        key = (record.name, record.levelno, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.max_templates:
+                    self._buckets.clear()
+                bucket = self._buckets[key] = [float(self.burst), now, 0]
+            else:
+                bucket[0] = min(float(self.burst), bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] < 1.0:
+                bucket[2] += 1
+                suppressed = None
+            else:
+                bucket[0] -= 1.0
+                suppressed, bucket[2] = bucket[2], 0
+        if suppressed is None:
+            metrics.inc('jlk_log_records_dropped_total', (('reason', 'rate_limited'),))
+            return False
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+# -- output ---------------------------------------------------------------
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc)
+                    .isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS + ('elapsed_ms', 'suppressed'):
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _Listener(logging.handlers.QueueListener):
+
+    def enqueue_sentinel(self):
+        # Blocks until there is room, so stop() still works with a full queue
+        self.queue.put(self._sentinel)
+
+
+class QueueHandler(logging.handlers.QueueHandler):
+    """Hands records to a listener thread; never blocks and never formats"""
+
+    def __init__(self, target, queue_size):
+        super().__init__(queue.Queue(queue_size))
+        self.target = target
+        self.queue_size = queue_size
+        self._listener = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_listener(self):
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            # After a fork the parent's listener thread is gone and its queue lock may be held
+            self.queue = queue.Queue(self.queue_size)
+            self._listener = _Listener(self.queue, self.target, respect_handler_level=True)
+            self._listener.start()
+            self._pid = os.getpid()
+
+    def prepare(self, record):
+        # The message is formatted by the target handler on the listener thread
+        return record
+
+    def enqueue(self, record):
+        self._ensure_listener()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.inc('jlk_log_records_dropped_total', (('reason', 'queue_full'),))
+
+    def stop(self):
+        """Write out the queued records and stop the listener thread"""
+        if self._listener is not None and self._pid == os.getpid():
+            self._listener.stop()
+        self._listener = None
+        self._pid = None
+
+
+def configure(config=None, stream=None):
+    """Install the logging handler on the root logger (replacing an earlier one); returns it"""
+    config = dict(LOGGING_CONFIG, **(config or {}))
+    shutdown()
+    target = logging.StreamHandler(stream)
+    target.setFormatter(JsonFormatter() if config['format'] == 'json' else logging.Formatter(TEXT_FORMAT))
+    handler = QueueHandler(target, config['queue_size']) if config['queue'] else target
+    handler.addFilter(RateLimitFilter(config['rate_limit_burst'], config['rate_limit_per_minute'],
+                                      config['rate_limit_templates']))
+    handler.addFilter(RequestContextFilter())
+    root = logging.getLogger()
+    root.setLevel(config['level'])
+    root.addHandler(handler)
+    _installed.append(handler)
+    return handler
+
+
+def shutdown():
+    """Remove the installed handler, writing out anything still queued"""
+    root = logging.getLogger()
+    while _installed:
+        handler = _installed.pop()
+        root.removeHandler(handler)
+        if isinstance(handler, QueueHandler):
+            handler.stop()
@@ -0,0 +1,372 @@
+"""
+JLK Transservice - ASGI entry point
+
+An alternative to the WSGI app for deployments where slow I/O would
+otherwise pin a worker per request. /api/quote, /api/contact and
+/api/health run as async handlers on the event loop; every other route is
+the existing Flask app, mounted underneath and run in a thread pool.
+
+In the async handlers nothing blocks the loop:
+
+- SQLite work runs on a small thread pool; each of its threads keeps its
+  own pooled connection (database.Database is per-thread). With
+  WRITE_BEHIND=1 the batch writer's future is awaited directly.
+- Uploads are parsed from the request stream with a byte limit enforced
+  as the body arrives, and hashing/validation/storing runs on an I/O
+  thread pool.
+- Inline SMTP delivery uses aiosmtplib when it is installed (falling back
+  to smtplib on the I/O pool); queued delivery only writes the outbox row.
+
+Run with:  uvicorn asgi:app --host 0.0.0.0 --port 8000 --workers 4
+"""
+
+import asyncio
+import contextlib
+import contextvars
+import functools
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Mount, Route, request_response
+from werkzeug.datastructures import FileStorage
+
+try:
+    import aiosmtplib
+except ImportError:  # optional; inline SMTP then runs on the I/O thread pool
+    aiosmtplib = None
+
+import app as wsgi
+import app_logging
+import attachments
+import idempotency
+import mail_queue
+import pricing
+from batch_writer import BatchWriter
+from database import chain_hooks, contact_row, quote_row
+from metrics import metrics
+from rate_limit import client_address, limiter
+from uploads import IMAGE_UPLOAD_CONFIG, InvalidImage, UploadTooLarge, request_too_large, upload_digest
+
+logger = logging.getLogger(__name__)
+
+# ASGI serving configuration
+ASGI_CONFIG = {
+    'db_threads': int(os.environ.get('ASGI_DB_THREADS', '4')),
+    'io_threads': int(os.environ.get('ASGI_IO_THREADS', '8')),
+    'wsgi_threads': int(os.environ.get('ASGI_WSGI_THREADS', '10')),  # for the mounted Flask routes
+    'smtp_timeout': float(os.environ.get('ASGI_SMTP_TIMEOUT', '30')),  # seconds
+}
+
+db_executor = ThreadPoolExecutor(max_workers=ASGI_CONFIG['db_threads'], thread_name_prefix='asgi-db')
+io_executor = ThreadPoolExecutor(max_workers=ASGI_CONFIG['io_threads'], thread_name_prefix='asgi-io')
+
+
+async def run_in(executor, function, *args, **kwargs):
+    """Await a blocking call on one of the thread pools (in the caller's context)"""
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()  # keeps the request's metrics sampling decision
+    return await loop.run_in_executor(executor, functools.partial(context.run, function, *args, **kwargs))
+
+
+class AsyncStore:
+    """Awaitable save_quote/save_contact over app.store (Database or BatchWriter)"""
+
+    async def _save(self, table, method, record, *hooks):
+        store = wsgi.store
+        if isinstance(store, BatchWriter):
+            # The writer thread resolves a future per row; await it without a thread
+            params = {'quotes': quote_row, 'contacts': contact_row}[table](record)
+            future = store.submit(table, params, *hooks)
+            return await asyncio.wait_for(asyncio.wrap_future(future), store.config['result_timeout'])
+        return await run_in(db_executor, getattr(store, method), record, *hooks)
+
+    async def save_quote(self, record, after_insert=None):
+        return await self._save('quotes', 'save_quote', record, after_insert)
+
+    async def save_contact(self, record, after_insert=None):
+        return await self._save('contacts', 'save_contact', record, after_insert)
+
+
+store = AsyncStore()
+
+
+def limit_body(receive, limit):
+    """Wrap an ASGI receive callable so the body fails once it passes limit bytes"""
+    received = 0
+
+    async def limited():
+        nonlocal received
+        message = await receive()
+        if message['type'] == 'http.request':
+            received += len(message.get('body', b''))
+            if received > limit:
+                raise UploadTooLarge()
+        return message
+    return limited
+
+
+def _send_blocking(message):
+    server = mail_queue.open_smtp_connection(wsgi.EMAIL_CONFIG, timeout=ASGI_CONFIG['smtp_timeout'])
+    try:
+        server.send_message(message)
+    finally:
+        server.quit()
+
+
+async def send_quote_email(data, image_url=None, thumbnail_url=None, base_url=''):
+    """Send the quote notification without blocking the event loop"""
+    config = wsgi.EMAIL_CONFIG
+    if not config['password']:  # Only send if password is configured
+        logger.warning("Email password not configured, skipping email send")
+        return False
+    try:
+        html_content = attachments.link_variants(
+            wsgi.format_quote_email(data, image_url, base_url, thumbnail_url=thumbnail_url))
+        message = mail_queue.build_message(config, config['email'], wsgi.quote_email_subject(data),
+                                           html_content, reply_to=data.get('email', ''))
+        with metrics.stage('smtp_send'):
+            if aiosmtplib is None:
+                await run_in(io_executor, _send_blocking, message)
+            else:
+                await aiosmtplib.send(
+                    message,
+                    hostname=config['smtp_server'],
+                    port=config['smtp_port'],
+                    start_tls=config['use_tls'],
+                    username=config['email'],
+                    password=config['password'],
+                    timeout=ASGI_CONFIG['smtp_timeout'],
+                )
+        return True
+    except Exception as e:
+        logger.error("Failed to send email: %s", e)
+        return False
+
+
+def error(message, status):
+    return JSONResponse({'success': False, 'message': message}, status_code=status)
+
+
+def too_many_requests(retry_after):
+    return JSONResponse({'success': False, 'message': wsgi.RATE_LIMIT_MESSAGE}, status_code=429,
+                        headers={'Retry-After': wsgi.retry_after_header(retry_after)})
+
+
+def request_client_address(request):
+    return client_address(request.client.host if request.client else '', request.headers.get('x-forwarded-for'))
+
+
+async def submit_quote(request):
+    """Async /api/quote: same contract as the Flask view"""
+    form = None
+    try:
+        # Turn floods away by client address before reading the body
+        retry_after = limiter.check('quote', 'ip', request_client_address(request))
+        if retry_after:
+            return too_many_requests(retry_after)
+
+        # Reject oversized posts from the Content-Length header before parsing anything
+        content_length = request.headers.get('content-length')
+        if request_too_large(int(content_length) if content_length and content_length.isdigit() else None):
+            return error('ไฟล์รูปภาพใหญ่เกินไป (สูงสุด 5MB)', 400)
+
+        upload = None
+        if 'application/json' in request.headers.get('content-type', ''):
+            data = await request.json()
+        else:
+            # Count body bytes as they arrive so a missing or false Content-Length cannot get past the limit
+            limit = IMAGE_UPLOAD_CONFIG['max_size'] + IMAGE_UPLOAD_CONFIG['max_form_overhead']
+            limited = Request(request.scope, limit_body(request.receive, limit))
+            try:
+                form = await limited.form(max_files=1)
+            except UploadTooLarge:
+                return error('ไฟล์รูปภาพใหญ่เกินไป (สูงสุด 5MB)', 400)
+            data = {key: value for key, value in form.items() if isinstance(value, str)}
+            attachment = form.get('attachment')
+            upload = None if isinstance(attachment, str) else attachment
+
+        # A repeat of a stored submission (double-click, retry) gets the original id
+        image_file = None
+        if upload is not None and upload.filename:
+            image_file = FileStorage(stream=upload.file, filename=upload.filename)
+        digest = await run_in(io_executor, upload_digest, image_file) if image_file else None
+        key = idempotency.submission_key('quotes', data, digest, request.headers.get('idempotency-key'))
+        duplicate = await run_in(db_executor, idempotency.find_duplicate, wsgi.db, key) if key else None
+        if duplicate:
+            return JSONResponse(wsgi.duplicate_quote_payload(*duplicate))
+
+        retry_after = limiter.check('quote', 'email', data.get('email'))
+        if retry_after:
+            return too_many_requests(retry_after)
+
+        # Validate required fields
+        with metrics.stage('validation'):
+            field = wsgi.missing_field(data, wsgi.QUOTE_REQUIRED_FIELDS)
+        if field:
+            return error(f'กรุณากรอก {field} ให้ครบถ้วน', 400)
+
+        # Validate and store the image off the event loop
+        stored_image = None
+        if image_file:
+            try:
+                with metrics.stage('image_save'):
+                    stored_image = await run_in(io_executor, wsgi.save_uploaded_image, image_file)
+            except InvalidImage:
+                return error('รูปแบบไฟล์ไม่ถูกต้อง (รองรับเฉพาะ jpg, png, gif, webp)', 400)
+            except UploadTooLarge:
+                return error('ไฟล์รูปภาพใหญ่เกินไป (สูงสุด 5MB)', 400)
+
+        image_url = stored_image.url if stored_image else None
+        base_url = str(request.base_url)
+
+        # Indicative price from the rate table; a value it cannot read just means no estimate
+        try:
+            estimate = wsgi.quote_estimate(data)
+        except pricing.InvalidEstimate:
+            estimate = None
+
+        record = wsgi.build_quote_record(data, stored_image)
+        reference_attachment = wsgi.attachment_reference_hook(stored_image)
+        response_fields = {'image_url': image_url, 'estimate': estimate}
+
+        if wsgi.EMAIL_DELIVERY_MODE == 'queue':
+            # Rendered with the original upload; the variants are linked when it is sent
+            enqueue_email = wsgi.queue_quote_email(data, image_url, base_url=base_url)
+            response_fields['email_sent'] = enqueue_email is not None
+            remember = idempotency.remember_hook(key, response_fields)
+            with metrics.stage('db_insert'):
+                quote_id = await store.save_quote(record, after_insert=chain_hooks(reference_attachment, remember,
+                                                                                   enqueue_email))
+            email_sent = enqueue_email is not None
+            if email_sent:
+                wsgi.outbox.start(wsgi.db)
+                wsgi.outbox.notify()
+        else:
+            remember = idempotency.remember_hook(key, response_fields)
+            with metrics.stage('db_insert'):
+                quote_id = await store.save_quote(record, after_insert=chain_hooks(reference_attachment, remember))
+            email_sent = await send_quote_email(data, image_url, base_url=base_url)
+            if not email_sent:
+                await run_in(db_executor, idempotency.update_response, wsgi.db, key, quote_id,
+                             dict(response_fields, email_sent=False))
+
+        return JSONResponse({
+            'success': True,
+            'message': wsgi.quote_response_message(email_sent),
+            'quote_id': quote_id,
+            'image_url': image_url,
+            'estimate': estimate
+        })
+
+    except idempotency.DuplicateSubmission as e:
+        # An identical post was stored while this one was being processed
+        return JSONResponse(wsgi.duplicate_quote_payload(e.record_id, e.response))
+    except Exception as e:
+        logger.error("Error submitting quote: %s", e)
+        return error('เกิดข้อผิดพลาดในการส่งข้อมูล', 500)
+    finally:
+        if form is not None:
+            await form.close()
+
+
+async def submit_contact(request):
+    """Async /api/contact: same contract as the Flask view"""
+    try:
+        retry_after = limiter.check('contact', 'ip', request_client_address(request))
+        if retry_after:
+            return too_many_requests(retry_after)
+
+        data = await request.json()
+
+        # A repeat of a stored message gets the original id
+        key = idempotency.submission_key('contacts', data, header_key=request.headers.get('idempotency-key'))
+        duplicate = await run_in(db_executor, idempotency.find_duplicate, wsgi.db, key) if key else None
+        if duplicate:
+            return JSONResponse(wsgi.duplicate_contact_payload(*duplicate))
+
+        retry_after = limiter.check('contact', 'email', data.get('email'))
+        if retry_after:
+            return too_many_requests(retry_after)
+
+        # Validate required fields
+        field = wsgi.missing_field(data, wsgi.CONTACT_REQUIRED_FIELDS)
+        if field:
+            return error(f'กรุณากรอก {field} ให้ครบถ้วน', 400)
+
+        contact_id = await store.save_contact(wsgi.build_contact_record(data),
+                                              after_insert=idempotency.remember_hook(key))
+
+        return JSONResponse({
+            'success': True,
+            'message': 'ส่งข้อความสำเร็จ',
+            'contact_id': contact_id
+        })
+
+    except idempotency.DuplicateSubmission as e:
+        return JSONResponse(wsgi.duplicate_contact_payload(e.record_id, e.response))
+    except Exception as e:
+        logger.error("Error submitting contact: %s", e)
+        return error('เกิดข้อผิดพลาดในการส่งข้อมูล', 500)
+
+
+async def health_check(request):
+    """Health check endpoint"""
+    status = await run_in(db_executor, wsgi.health_status)
+    return JSONResponse(status, status_code=wsgi.health_http_status(status))
+
+
+def _instrumented(route, endpoint):
+    """Record latency of an async handler under the same route label Flask would use"""
+    @functools.wraps(endpoint)
+    async def timed(request):
+        started = metrics.begin_request()
+        request_id = app_logging.request_id_from(request.headers.get('x-request-id'))
+        app_logging.bind_request(request_id, request.method, route)
+        status = 500
+        try:
+            response = await endpoint(request)
+            status = response.status_code
+            response.headers['X-Request-ID'] = request_id
+            return response
+        finally:
+            metrics.end_request(request.method, route, status, started)
+            app_logging.clear_request()
+    return timed
+
+
+def _cors(endpoint):
+    # Same open CORS policy Flask-CORS applies to the Flask routes
+    return CORSMiddleware(request_response(endpoint), allow_origins=['*'], allow_methods=['*'],
+                          allow_headers=['*'])
+
+
+@contextlib.asynccontextmanager
+async def lifespan(application):
+    await run_in(db_executor, wsgi.create_app)
+    wsgi.start_outbox()
+    yield
+    if isinstance(wsgi.store, BatchWriter):
+        wsgi.store.stop()
+    wsgi.outbox.stop()
+    wsgi.broken_link_log.stop()
+    app_logging.shutdown()
+    db_executor.shutdown(wait=False)
+    io_executor.shutdown(wait=False)
+
+
+app = Starlette(
+    routes=[
+        Route('/api/quote', _cors(_instrumented('/api/quote', submit_quote)), methods=['POST', 'OPTIONS']),
+        Route('/api/contact', _cors(_instrumented('/api/contact', submit_contact)), methods=['POST', 'OPTIONS']),
+        Route('/api/health', _cors(_instrumented('/api/health', health_check)), methods=['GET', 'OPTIONS']),
+        # Everything else (pages, static assets, read APIs) is the Flask app
+        Mount('/', app=WSGIMiddleware(wsgi.app, workers=ASGI_CONFIG['wsgi_threads'])),
+    ],
+    lifespan=lifespan,
+)
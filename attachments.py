@@ -0,0 +1,215 @@
+"""
+JLK Transservice - Content-addressed attachment storage
+
+Uploaded images are stored once per distinct content, named by the SHA-256
+of their bytes, in a directory tree sharded by hash prefix
+(blobs/ab/cd/abcd...). A customer who resubmits the same cargo photo reuses
+the existing blob and its variants instead of writing another copy.
+
+The `attachments` table keeps a reference count per blob: quotes point at
+a blob through `quotes.attachment_hash`, the count goes up when a quote is
+stored and down (via trigger) when one is deleted. collect_garbage()
+removes blobs nobody references any more. Because a blob's URL changes
+whenever its content does, blob URLs can be served with far-future,
+immutable cache headers.
+"""
+
+import logging
+import os
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+# Blob storage configuration
+ATTACHMENT_CONFIG = {
+    'blob_dir': 'static/uploads/blobs',
+    'url_prefix': '/static/uploads/blobs',
+    'shard_depth': 2,  # directory levels
+    'shard_width': 2,  # hex characters per level
+    'gc_grace_seconds': 24 * 3600,
+    'cache_max_age': 365 * 24 * 3600,  # seconds, for immutable blob URLs
+}
+
+VARIANT_SUFFIXES = ('_web.jpg', '_thumb.jpg')
+
+# An email's img src / link href pointing at an original blob, and the variant each should show
+_EMAIL_BLOB_LINK = re.compile(r'(src|href)="([^"]*' + re.escape(ATTACHMENT_CONFIG['url_prefix'])
+                              + r'/[0-9a-f/]*?)([0-9a-f]{64})(\.[a-z]+)"')
+_EMAIL_VARIANTS = {'src': '_thumb.jpg', 'href': '_web.jpg'}
+
+
+def init_attachments(cursor):
+    """Create the attachments table, the quote reference column and triggers"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS attachments (
+            hash TEXT PRIMARY KEY,
+            extension TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            ref_count INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at REAL NOT NULL
+        )
+    ''')
+    columns = {row[1] for row in cursor.execute('PRAGMA table_info(quotes)')}
+    if 'attachment_hash' not in columns:
+        cursor.execute('ALTER TABLE quotes ADD COLUMN attachment_hash TEXT')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_quotes_attachment_hash ON quotes (attachment_hash)
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS quotes_release_attachment
+        AFTER DELETE ON quotes
+        WHEN OLD.attachment_hash IS NOT NULL
+        BEGIN
+            UPDATE attachments
+            SET ref_count = ref_count - 1, updated_at = (julianday('now') - 2440587.5) * 86400.0
+            WHERE hash = OLD.attachment_hash;
+        END
+    ''')
+
+
+def shard_path(digest):
+    """Relative directory for a digest, e.g. 'ab/cd'"""
+    width = ATTACHMENT_CONFIG['shard_width']
+    return '/'.join(digest[i * width:(i + 1) * width] for i in range(ATTACHMENT_CONFIG['shard_depth']))
+
+
+def blob_path(digest, suffix):
+    """Filesystem path of a blob (suffix is '.jpg', '_thumb.jpg', ...)"""
+    return os.path.join(ATTACHMENT_CONFIG['blob_dir'], *shard_path(digest).split('/'), digest + suffix)
+
+
+def blob_url(digest, suffix):
+    """Public, immutable URL of a blob"""
+    return f"{ATTACHMENT_CONFIG['url_prefix']}/{shard_path(digest)}/{digest}{suffix}"
+
+
+def variants_exist(digest):
+    """Whether both image variants of a blob have been written"""
+    return all(os.path.exists(blob_path(digest, suffix)) for suffix in VARIANT_SUFFIXES)
+
+
+def link_variants(html):
+    """Point an email rendered with an original blob at its thumbnail and web variants, if written
+
+    Called when the email is sent, so the request that stored the upload
+    never waits for its variants; without them the original stays linked.
+    """
+    if ATTACHMENT_CONFIG['url_prefix'] not in html:
+        return html
+
+    def replace(match):
+        attribute, prefix, digest, _ = match.groups()
+        if not variants_exist(digest):
+            return match.group(0)
+        return f'{attribute}="{prefix}{digest}{_EMAIL_VARIANTS[attribute]}"'
+    return _EMAIL_BLOB_LINK.sub(replace, html)
+
+
+def is_blob_url_path(path):
+    """True for static paths (relative to /static/) that point into the blob store"""
+    prefix = ATTACHMENT_CONFIG['url_prefix'].split('/static/', 1)[-1]
+    return path.startswith(prefix + '/')
+
+
+def store_blob(source_path, digest, extension):
+    """Link a validated upload into the blob store; returns True if it was new"""
+    path = blob_path(digest, '.' + extension)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        os.link(source_path, path)
+        return True
+    except FileExistsError:
+        # Same bytes already stored; refresh mtime so GC's grace period restarts
+        os.utime(path)
+        return False
+
+
+def add_reference(cursor, digest, extension, size):
+    """Count one more quote referencing a blob (runs in the quote's transaction)"""
+    cursor.execute('''
+        INSERT INTO attachments (hash, extension, size, ref_count, updated_at)
+        VALUES (?, ?, ?, 1, ?)
+        ON CONFLICT(hash) DO UPDATE SET ref_count = attachments.ref_count + 1, updated_at = excluded.updated_at
+    ''', (digest, extension, size, time.time()))
+
+
+def _remove_blob_files(digest, extension):
+    removed = 0
+    for suffix in ('.' + extension,) + VARIANT_SUFFIXES:
+        try:
+            os.remove(blob_path(digest, suffix))
+            removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+def _stored_digests():
+    """Yield (digest, extension, mtime) for every original blob file on disk"""
+    for root, _, files in os.walk(ATTACHMENT_CONFIG['blob_dir']):
+        for name in files:
+            digest, _, extension = name.partition('.')
+            if not extension or name.endswith(VARIANT_SUFFIXES):
+                continue
+            path = os.path.join(root, name)
+            try:
+                yield digest, extension, os.stat(path).st_mtime
+            except FileNotFoundError:
+                continue
+
+
+def collect_garbage(db, grace_seconds=None, dry_run=False):
+    """Delete blobs no quote references; returns counts of what was (or would be) removed"""
+    if grace_seconds is None:
+        grace_seconds = ATTACHMENT_CONFIG['gc_grace_seconds']
+    cutoff = time.time() - grace_seconds
+    stats = {'unreferenced': 0, 'orphaned': 0, 'files_removed': 0}
+
+    # Recount from the quotes table so manual edits cannot leave counts stale
+    # (a dry run only reads the recount and leaves the table as it is)
+    recount_sql = '''
+        SELECT hash, extension, (
+            SELECT COUNT(*) FROM quotes WHERE quotes.attachment_hash = attachments.hash
+        ), updated_at FROM attachments
+    '''
+    if dry_run:
+        known = {row[0]: (row[1], row[2], row[3]) for row in db.connection().execute(recount_sql)}
+    else:
+        with db.transaction() as cursor:
+            cursor.execute('''
+                UPDATE attachments SET ref_count = (
+                    SELECT COUNT(*) FROM quotes WHERE quotes.attachment_hash = attachments.hash
+                )
+            ''')
+            known = {row[0]: (row[1], row[2], row[3]) for row in cursor.execute(
+                'SELECT hash, extension, ref_count, updated_at FROM attachments')}
+
+    for digest, (extension, ref_count, updated_at) in known.items():
+        if ref_count > 0 or updated_at > cutoff:
+            continue
+        try:
+            if os.stat(blob_path(digest, '.' + extension)).st_mtime > cutoff:
+                continue  # re-uploaded recently; a quote for it may be in flight
+        except FileNotFoundError:
+            pass
+        stats['unreferenced'] += 1
+        if dry_run:
+            continue
+        with db.transaction() as cursor:
+            cursor.execute('DELETE FROM attachments WHERE hash = ? AND ref_count <= 0', (digest,))
+            if cursor.rowcount == 0:
+                continue
+        stats['files_removed'] += _remove_blob_files(digest, extension)
+
+    # Files without a row: uploads whose quote never committed
+    for digest, extension, mtime in _stored_digests():
+        if digest in known or mtime > cutoff:
+            continue
+        stats['orphaned'] += 1
+        if not dry_run:
+            stats['files_removed'] += _remove_blob_files(digest, extension)
+
+    logger.info("Attachment GC: %s", stats)
+    return stats
@@ -0,0 +1,169 @@
+"""
+JLK Transservice - Group-commit batch writer
+
+Opt-in write-behind mode for quote and contact inserts. Requests hand their
+row to an in-process buffer and wait on a future; a single writer thread
+flushes the buffer with executemany() in one transaction every `max_rows`
+rows or `max_delay_ms` milliseconds, whichever comes first, then resolves
+each future with the row id it was given. Many small fsyncs become a few
+large ones.
+
+BatchWriter exposes the same save_quote/save_contact API as
+database.Database, so the endpoints do not care which one they talk to.
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from database import INSERT_SQL, contact_row, quote_row
+
+logger = logging.getLogger(__name__)
+
+# Write-behind configuration
+WRITE_BEHIND_CONFIG = {
+    'enabled': os.environ.get('WRITE_BEHIND', '0') == '1',
+    'max_rows': int(os.environ.get('WRITE_BEHIND_MAX_ROWS', '200')),
+    'max_delay_ms': float(os.environ.get('WRITE_BEHIND_MAX_DELAY_MS', '5')),
+    # Durability of each group commit: FULL, NORMAL or OFF (see PRAGMA synchronous)
+    'synchronous': os.environ.get('WRITE_BEHIND_SYNCHRONOUS', 'FULL'),
+    'result_timeout': float(os.environ.get('WRITE_BEHIND_RESULT_TIMEOUT', '30')),  # seconds
+}
+
+_STOP = object()
+
+
+class _PendingRow:
+    __slots__ = ('table', 'params', 'after_insert', 'future')
+
+    def __init__(self, table, params, after_insert):
+        self.table = table
+        self.params = params
+        self.after_insert = after_insert
+        self.future = Future()
+
+
+class BatchWriter:
+    """Buffers inserts and commits them in groups from a single writer thread"""
+
+    def __init__(self, db, config=None):
+        self.db = db
+        self.config = dict(WRITE_BEHIND_CONFIG, **(config or {}))
+        self._queue = queue.Queue()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    # -- repository API --------------------------------------------------
+
+    def save_quote(self, record, after_insert=None):
+        """Store a quote; after_insert(cursor, quote_id) runs in the batch transaction"""
+        return self.submit('quotes', quote_row(record), after_insert).result(self.config['result_timeout'])
+
+    def save_contact(self, record, after_insert=None):
+        """Store a contact message; after_insert(cursor, contact_id) runs in the batch transaction"""
+        return self.submit('contacts', contact_row(record), after_insert).result(self.config['result_timeout'])
+
+    def submit(self, table, params, after_insert=None):
+        """Buffer a row for the next group commit and return a Future of its id"""
+        self._ensure_started()
+        pending = _PendingRow(table, params, after_insert)
+        self._queue.put(pending)
+        return pending.future
+
+    # -- lifecycle -------------------------------------------------------
+
+    def _ensure_started(self):
+        if self._pid == os.getpid() and self._thread is not None:
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None:
+                return
+            # A writer thread does not survive fork; each worker gets its own
+            self._queue = queue.Queue()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='batch-writer', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5):
+        """Flush buffered rows and stop the writer thread"""
+        if self._thread is None or self._pid != os.getpid():
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        self._thread = None
+
+    # -- writer thread ---------------------------------------------------
+
+    def _collect(self):
+        """Block for the first row, then gather more until the batch is full or due"""
+        first = self._queue.get()
+        if first is _STOP:
+            return [], True
+        batch = [first]
+        deadline = time.monotonic() + self.config['max_delay_ms'] / 1000.0
+        while len(batch) < self.config['max_rows']:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _write(self, batch):
+        """Insert a whole batch in one transaction; returns ids aligned with batch"""
+        groups = {}
+        for row in batch:
+            groups.setdefault(row.table, []).append(row)
+        ids = {}
+        with self.db.transaction() as cursor:
+            for table, rows in groups.items():
+                row_ids = self.db.insert_many(cursor, table, [row.params for row in rows])
+                for row, row_id in zip(rows, row_ids):
+                    ids[id(row)] = row_id
+            for row in batch:
+                if row.after_insert is not None:
+                    row.after_insert(cursor, ids[id(row)])
+        return [ids[id(row)] for row in batch]
+
+    def _write_one(self, row):
+        with self.db.transaction() as cursor:
+            cursor.execute(INSERT_SQL[row.table], row.params)
+            row_id = cursor.lastrowid
+            if row.after_insert is not None:
+                row.after_insert(cursor, row_id)
+        return row_id
+
+    def _flush(self, batch):
+        try:
+            row_ids = self._write(batch)
+        except Exception as e:
+            # Isolate the bad row(s) instead of failing everyone in the batch
+            logger.warning("Group commit of %s rows failed, retrying individually: %s", len(batch), e)
+            for row in batch:
+                try:
+                    row.future.set_result(self._write_one(row))
+                except Exception as row_error:
+                    row.future.set_exception(row_error)
+            return
+        for row, row_id in zip(batch, row_ids):
+            row.future.set_result(row_id)
+
+    def _run(self):
+        if self.config['synchronous'] and self.db.dialect == 'sqlite':
+            self.db.connection().execute(f"PRAGMA synchronous = {self.config['synchronous']}")
+        try:
+            while True:
+                batch, stopping = self._collect()
+                if batch:
+                    self._flush(batch)
+                if stopping:
+                    return
+        finally:
+            self.db.close()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Load test: WSGI (gunicorn sync workers) vs ASGI (uvicorn) for /api/quote
+
+Starts a local fake SMTP server with artificial latency, then runs each
+server as a subprocess with the same number of workers, inline email
+delivery and a throwaway database, and fires concurrent POST /api/quote
+requests from a pool of client connections.
+
+Reported per server:
+  rps          completed requests per second
+  p50/p99      request latency
+  in flight    peak number of requests the server was working on at once,
+               measured as concurrent SMTP sessions (each inline quote holds one)
+
+Usage: python benchmarks/bench_asgi.py [--requests 400] [--concurrency 64] [--workers 2]
+"""
+
+import argparse
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import common
+from fake_smtp import FakeSMTPServer
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_up(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/api/health')
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f'server on port {port} did not come up')
+
+
+def server_command(kind, port, workers):
+    if kind == 'wsgi':
+        return [sys.executable, '-m', 'gunicorn', '--workers', str(workers), '--worker-class', 'sync',
+                '--bind', f'127.0.0.1:{port}', '--log-level', 'warning', 'app:app']
+    return [sys.executable, '-m', 'uvicorn', '--workers', str(workers), '--host', '127.0.0.1',
+            '--port', str(port), '--log-level', 'warning', 'asgi:app']
+
+
+def load(port, requests, concurrency):
+    body = json.dumps(common.SAMPLE_QUOTE).encode('utf-8')
+    local = threading.local()
+    failures = []
+
+    def one(_):
+        conn = getattr(local, 'conn', None)
+        if conn is None:
+            conn = local.conn = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+        began = time.perf_counter()
+        try:
+            conn.request('POST', '/api/quote', body=body, headers={'Content-Type': 'application/json'})
+            response = conn.getresponse()
+            response.read()
+            if response.status != 200:
+                failures.append(response.status)
+        except (OSError, http.client.HTTPException) as e:
+            failures.append(str(e))
+            local.conn = None
+        return time.perf_counter() - began
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(one, range(requests)))
+    return latencies, time.perf_counter() - started, failures
+
+
+def run(kind, args, smtp):
+    database = os.path.join(tempfile.mkdtemp(prefix='jlk-bench-'), 'bench.db')
+    common.load_app(database)  # create the schema before the workers start
+    port = free_port()
+    env = dict(os.environ, DATABASE_PATH=database, EMAIL_DELIVERY_MODE='inline', EMAIL_PASSWORD='bench',
+               EMAIL_USE_TLS='0', SMTP_SERVER='127.0.0.1', SMTP_PORT=str(smtp.port))
+    server = subprocess.Popen(server_command(kind, port, args.workers), cwd=common.ROOT, env=env)
+    try:
+        wait_until_up(port)
+        smtp.max_active = 0
+        latencies, elapsed, failures = load(port, args.requests, args.concurrency)
+        common.summarize(f'{kind} x{args.workers} workers', latencies, elapsed)
+        print(f"{'':<28} in flight (peak)={smtp.max_active}  client connections={args.concurrency}  "
+              f"failures={len(failures)}")
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--connect-delay', type=float, default=0.02)
+    parser.add_argument('--auth-delay', type=float, default=0.05)
+    parser.add_argument('--data-delay', type=float, default=0.01)
+    args = parser.parse_args()
+
+    smtp = FakeSMTPServer(connect_delay=args.connect_delay, auth_delay=args.auth_delay,
+                          data_delay=args.data_delay).start()
+    try:
+        for kind in ('wsgi', 'asgi'):
+            run(kind, args, smtp)
+    finally:
+        smtp.stop()
+
+
+if __name__ == '__main__':
+    main()
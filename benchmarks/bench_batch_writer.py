@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Benchmark: sustained inserts per second, direct commits vs. group commit
+
+Many threads store quotes and contacts concurrently (like a campaign burst).
+The direct path commits every row on its own; the batch writer buffers rows
+and commits them together. Both runs use the same synchronous level so the
+difference is the number of fsyncs.
+
+Usage: python benchmarks/bench_batch_writer.py [--threads 32] [--rows 200] [--synchronous FULL]
+"""
+
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from common import SAMPLE_QUOTE, load_app, summarize
+
+from batch_writer import BatchWriter
+from database import Database
+
+QUOTE_RECORD = {
+    'company_name': SAMPLE_QUOTE['companyName'],
+    'contact_name': SAMPLE_QUOTE['contactName'],
+    'email': SAMPLE_QUOTE['email'],
+    'phone': SAMPLE_QUOTE['phone'],
+    'service_type': SAMPLE_QUOTE['serviceType'],
+    'description': SAMPLE_QUOTE['description'],
+}
+
+CONTACT_RECORD = {'name': 'ทดสอบ', 'email': 'test@example.com', 'subject': '', 'message': 'hello'}
+
+
+def run(label, store, threads, rows):
+    latencies = []
+    lock = threading.Lock()
+    ids = []
+
+    def work():
+        local, local_ids = [], []
+        for i in range(rows):
+            t0 = time.perf_counter()
+            if i % 4 == 3:
+                local_ids.append(('contacts', store.save_contact(CONTACT_RECORD)))
+            else:
+                local_ids.append(('quotes', store.save_quote(QUOTE_RECORD)))
+            local.append(time.perf_counter() - t0)
+        with lock:
+            latencies.extend(local)
+            ids.extend(local_ids)
+
+    pool = [threading.Thread(target=work) for _ in range(threads)]
+    started = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    summarize(label, latencies, elapsed)
+    # Every caller must have received a distinct id
+    assert len(set(ids)) == len(ids), 'duplicate row ids returned'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--rows', type=int, default=200, help='rows per thread')
+    parser.add_argument('--synchronous', default='FULL')
+    parser.add_argument('--max-rows', type=int, default=200)
+    parser.add_argument('--max-delay-ms', type=float, default=5)
+    args = parser.parse_args()
+
+    for label in ('direct', 'group commit'):
+        database = os.path.join(tempfile.mkdtemp(prefix='jlk-batch-'), 'batch.db')
+        load_app(database)
+        db = Database(database, {'synchronous': args.synchronous})
+        if label == 'direct':
+            store = db
+        else:
+            store = BatchWriter(db, {'synchronous': args.synchronous, 'max_rows': args.max_rows,
+                                     'max_delay_ms': args.max_delay_ms})
+        run(label, store, args.threads, args.rows)
+        if store is not db:
+            store.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Load test: concurrent /api/quote and /api/contact submissions
+
+Forks several worker processes (like gunicorn workers), each running a few
+threads that post to both endpoints through the Flask test client against
+one shared SQLite file. Runs twice: the old per-request sqlite3.connect()
+with the rollback journal, then the pooled WAL connection layer. With
+BENCH_DATABASE_URL=postgresql://... a third run ('postgres') posts to that
+database through the connection pool instead of the SQLite file. Reports
+throughput and how many requests failed with "database is locked".
+
+Usage: python benchmarks/bench_db_load.py [--workers 4] [--threads 4] [--requests 200]
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from common import SAMPLE_QUOTE, load_app
+
+from database import Database
+
+SAMPLE_CONTACT = {
+    'name': 'สมหญิง ทดสอบ',
+    'email': 'somying@example.com',
+    'subject': 'สอบถามบริการ',
+    'message': 'ต้องการทราบราคาขนส่งไปญี่ปุ่น',
+}
+
+
+class PerRequestDatabase(Database):
+    """The previous behaviour: a new connection per request, default journal mode"""
+
+    @contextmanager
+    def transaction(self):
+        conn = sqlite3.connect(self.path)
+        cursor = conn.cursor()
+        try:
+            yield cursor
+            conn.commit()
+        finally:
+            conn.close()
+
+
+class LockCounter(logging.Handler):
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.locked = 0
+
+    def emit(self, record):
+        if 'locked' in record.getMessage():
+            self.locked += 1
+
+
+def worker(mode, database, threads, requests, results):
+    app_module = load_app(database)
+    if mode == 'before':
+        app_module.db = PerRequestDatabase(database)
+    counter = LockCounter()
+    logging.getLogger('app').addHandler(counter)
+    ok, failed = [0], [0]
+    lock = threading.Lock()
+
+    def run():
+        client = app_module.app.test_client()
+        for i in range(requests):
+            if i % 2:
+                response = client.post('/api/contact', json=SAMPLE_CONTACT)
+            else:
+                response = client.post('/api/quote', json=SAMPLE_QUOTE)
+            with lock:
+                if response.status_code == 200:
+                    ok[0] += 1
+                else:
+                    failed[0] += 1
+
+    pool = [threading.Thread(target=run) for _ in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    results.put((ok[0], failed[0], counter.locked))
+
+
+def run(mode, args):
+    if mode == 'postgres':
+        database = os.environ['BENCH_DATABASE_URL']
+    else:
+        database = os.path.join(tempfile.mkdtemp(prefix='jlk-load-'), 'load.db')
+    if mode == 'before':
+        sqlite3.connect(database).execute('PRAGMA journal_mode = DELETE').fetchone()
+    app_module = load_app(database)
+    if mode == 'before':
+        app_module.db = PerRequestDatabase(database)
+        app_module.init_database()
+
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=worker, args=(mode, database, args.threads, args.requests, results))
+                 for _ in range(args.workers)]
+    started = time.perf_counter()
+    for process in processes:
+        process.start()
+    totals = [0, 0, 0]
+    for _ in processes:
+        for i, value in enumerate(results.get()):
+            totals[i] += value
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - started
+    ok, failed, locked = totals
+    print(f"{mode:<8} ok={ok:<6} failed={failed:<5} locked={locked:<5} "
+          f"elapsed={elapsed:6.2f}s throughput={ok / elapsed:8.1f} req/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=200, help='requests per thread')
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    multiprocessing.set_start_method('fork')
+    run('before', args)
+    run('after', args)
+    if os.environ.get('BENCH_DATABASE_URL'):
+        run('postgres', args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Benchmark: /api/quote latency with inline SMTP vs. the background email queue
+
+A local fake SMTP server adds artificial connect/auth latency to mimic Gmail.
+The inline path pays that cost on every request; the queued path only commits
+the quote and its outbox row, then the senders deliver over pooled connections.
+
+Usage: python benchmarks/bench_email_queue.py [--requests 200] [--auth-delay 0.05]
+"""
+
+import argparse
+import time
+
+from common import SAMPLE_QUOTE, load_app, summarize
+from fake_smtp import FakeSMTPServer
+
+
+def run(app_module, mode, count):
+    app_module.EMAIL_DELIVERY_MODE = mode
+    client = app_module.app.test_client()
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(count):
+        t0 = time.perf_counter()
+        response = client.post('/api/quote', json=SAMPLE_QUOTE)
+        latencies.append(time.perf_counter() - t0)
+        assert response.status_code == 200, response.get_data(as_text=True)
+    elapsed = time.perf_counter() - started
+    summarize(f'{mode} (request)', latencies, elapsed)
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--connect-delay', type=float, default=0.02)
+    parser.add_argument('--auth-delay', type=float, default=0.05)
+    parser.add_argument('--data-delay', type=float, default=0.01)
+    args = parser.parse_args()
+
+    smtp = FakeSMTPServer(connect_delay=args.connect_delay, auth_delay=args.auth_delay,
+                          data_delay=args.data_delay).start()
+    app_module = load_app()
+    app_module.EMAIL_CONFIG.update({
+        'smtp_server': '127.0.0.1',
+        'smtp_port': smtp.port,
+        'password': 'bench',
+        'use_tls': False,
+    })
+    app_module.outbox.config['poll_interval'] = 0.1
+
+    run(app_module, 'inline', args.requests)
+    inline_connections = smtp.connections
+
+    started = time.perf_counter()
+    run(app_module, 'queue', args.requests)
+    app_module.outbox.wait_idle(timeout=120)
+    drained = time.perf_counter() - started
+    print(f"queue drained {args.requests} messages in {drained:.2f}s")
+    print(f"SMTP connections: inline={inline_connections} queue={smtp.connections - inline_connections}")
+
+    app_module.outbox.stop()
+    smtp.stop()
+
+
+if __name__ == '__main__':
+    main()
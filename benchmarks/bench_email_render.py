@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: quote email renders per second
+
+Compares the original format_quote_email (template literal and lookup
+dicts rebuilt on every call, str.format plus f-string sections) with the
+precompiled format plans in email_templates, which additionally
+HTML-escape every value.
+
+Usage: python benchmarks/bench_email_render.py [--renders 20000]
+"""
+
+import argparse
+import time
+
+import common
+import legacy_email
+
+from email_templates import render_quote_email
+
+BASE_URL = 'http://localhost:5000/'
+IMAGE_URL = '/static/uploads/example.jpg'
+
+
+def measure(label, render, count):
+    render()  # warm up
+    started = time.perf_counter()
+    for _ in range(count):
+        render()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<24} {count / elapsed:10.0f} renders/s  {elapsed / count * 1e6:8.1f} us/render")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--renders', type=int, default=20000)
+    args = parser.parse_args()
+
+    data = common.SAMPLE_QUOTE
+    measure('legacy str.format', lambda: legacy_email.format_quote_email(data, IMAGE_URL, BASE_URL), args.renders)
+    measure('precompiled plan', lambda: render_quote_email(data, IMAGE_URL, BASE_URL), args.renders)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Benchmark: instant price estimates per second
+
+Prices quote form inputs against the repository's rates.json:
+
+  uncached   every call has a new weight, so each one parses the form
+             values, resolves both places, finds the lane and bisects its
+             tiers (a cache miss)
+  cached     a handful of inputs repeated, as while someone types the same
+             form again (LRU hits)
+  http       GET /api/estimate through the Flask test client, the same
+             handful of inputs
+
+Reported per mode: p50/p99 per estimate and estimates per second.
+
+Usage: python benchmarks/bench_estimate.py [--estimates 100000] [--http-requests 5000]
+"""
+
+import argparse
+import random
+import time
+from urllib.parse import urlencode
+
+import common
+
+FORMS = [
+    {'serviceType': 'export', 'origin': 'กรุงเทพฯ, ประเทศไทย', 'destination': 'โตเกียว, ญี่ปุ่น',
+     'weight': '1000', 'dimensions': '100×80×60', 'urgency': 'urgent'},
+    {'serviceType': 'import', 'origin': 'Shanghai, China', 'destination': 'Bangkok',
+     'weight': '250', 'dimensions': '', 'urgency': 'standard'},
+    {'serviceType': 'export', 'origin': 'Laem Chabang', 'destination': 'Rotterdam, Netherlands',
+     'weight': '30', 'dimensions': '120x100x150', 'urgency': 'express'},
+    {'serviceType': 'domestic', 'origin': 'เชียงใหม่', 'destination': 'กรุงเทพ', 'weight': '1,200 kg'},
+    {'serviceType': 'customs', 'origin': 'Singapore', 'destination': 'Bangkok', 'weight': '80'},
+]
+
+
+def timed(label, call, count):
+    latencies = []
+    started = time.perf_counter()
+    for i in range(count):
+        began = time.perf_counter()
+        call(i)
+        latencies.append(time.perf_counter() - began)
+    elapsed = time.perf_counter() - started
+    print(f"{label:<12} n={count:<8} p50={common.percentile(latencies, 50) * 1e6:8.2f}us "
+          f"p99={common.percentile(latencies, 99) * 1e6:8.2f}us estimates/s={count / elapsed:12.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--estimates', type=int, default=100000)
+    parser.add_argument('--http-requests', type=int, default=5000)
+    args = parser.parse_args()
+
+    app_module = common.load_app()
+    import pricing
+    index = pricing.estimator.current()
+    if index is None:
+        raise SystemExit('rates.json not found')
+
+    rng = random.Random(5)
+    # Distinct weights so every call misses the cache
+    uncached = [dict(rng.choice(FORMS), weight=f'{rng.uniform(1, 5000):.3f}') for _ in range(args.estimates)]
+    timed('uncached', lambda i: pricing.estimator.estimate(uncached[i]), args.estimates)
+    timed('cached', lambda i: pricing.estimator.estimate(FORMS[i % len(FORMS)]), args.estimates)
+    print(f"{'':<12} cache: {index.cache_info()}")
+
+    client = app_module.app.test_client()
+    urls = [f'/api/estimate?{urlencode(form)}' for form in FORMS]
+    timed('http', lambda i: client.get(urls[i % len(urls)]).get_data(), args.http_requests)
+
+
+if __name__ == '__main__':
+    main()
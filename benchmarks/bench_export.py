@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Benchmark: bulk export throughput and peak memory
+
+Fills a throwaway database with synthetic quotes (5M rows by default),
+then exports the whole table once per format/compression, each run in a
+fresh child process so its peak RSS is its own:
+
+  rows/s     rows exported per second (output written to a temp file)
+  peak RSS   the child's maximum resident set size, which includes
+             SQLite's page cache and mmap window (SQLITE_MMAP_SIZE)
+
+For comparison, `fetchall` loads every row with fetchall() and writes CSV,
+the way the old report scripts did; its peak RSS grows with the table
+while the streaming exports stay the same at any --rows.
+
+Usage: python benchmarks/bench_export.py [--rows 5000000] [--database path]
+                                         [--cases fetchall,csv,csv:gzip,jsonl:zstd,parquet:zstd]
+"""
+
+import argparse
+import csv
+import datetime
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import common
+
+SERVICE_TYPES = ('import', 'export', 'freight', 'customs', 'warehousing')
+URGENCIES = ('normal', 'urgent', 'express')
+STATUSES = ('pending', 'quoted', 'closed')
+ADDITIONAL = ('insurance', 'packaging', 'customs_clearance', 'warehousing', 'door_to_door')
+
+DEFAULT_CASES = 'fetchall,csv,csv:gzip,csv:zstd,jsonl,jsonl:gzip,parquet,parquet:zstd'
+
+
+def fill_quotes(db, rows, batch=50000):
+    """Insert synthetic quotes spread over roughly ten years, with a few additional services each"""
+    rng = random.Random(5)
+    start = datetime.datetime(2016, 1, 1)
+    inserted = 0
+    while inserted < rows:
+        count = min(batch, rows - inserted)
+        params = []
+        for i in range(inserted, inserted + count):
+            created = start + datetime.timedelta(seconds=i * 60 + rng.randrange(60))
+            services = json.dumps(rng.sample(ADDITIONAL, rng.randrange(0, 3)))
+            params.append((f'Company {i}', 'Contact', f'c{i}@example.com', '080-000-0000',
+                           rng.choice(SERVICE_TYPES), 'Bangkok', 'Tokyo', 'general', f'{rng.randrange(1, 20000)} kg',
+                           rng.choice(URGENCIES), services, 'Monthly shipment of machine parts',
+                           rng.choice(STATUSES), created.strftime('%Y-%m-%d %H:%M:%S')))
+        with db.transaction() as cursor:
+            cursor.executemany('''
+                INSERT INTO quotes (company_name, contact_name, email, phone, service_type, origin,
+                                    destination, cargo_type, weight, urgency, additional_services,
+                                    description, status, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', params)
+        inserted += count
+
+
+def max_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on Linux
+
+
+def child(database, case, output):
+    """Run one export in this process and print its numbers as JSON"""
+    app_module = common.load_app(database)
+    import export
+    conn = app_module.db.connection()
+    rows = conn.execute('SELECT COUNT(*) FROM quotes').fetchone()[0]
+    started = time.perf_counter()
+    if case == 'fetchall':
+        import queries
+        columns = queries.LIST_COLUMNS['quotes']
+        everything = conn.execute(f"SELECT {', '.join(columns)} FROM quotes ORDER BY created_at, id").fetchall()
+        with open(output, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            writer.writerows(everything)
+    else:
+        fmt, _, compression = case.partition(':')
+        with open(output, 'wb') as f:
+            for chunk in export.export_stream(app_module.db, 'quotes', fmt, compression or None):
+                f.write(chunk)
+    elapsed = time.perf_counter() - started
+    print(json.dumps({'rows': rows, 'seconds': elapsed, 'peak_mb': max_rss_mb(),
+                      'bytes': os.path.getsize(output)}))
+
+
+def run_case(database, case):
+    output = os.path.join(os.path.dirname(database), 'export.out')
+    result = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', case, '--database', database,
+                             '--output', output], capture_output=True, text=True, check=True)
+    os.remove(output)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=5000000)
+    parser.add_argument('--database', help='Reuse (or create and keep) this database file.')
+    parser.add_argument('--cases', default=DEFAULT_CASES)
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--output', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.database, args.child, args.output)
+        return
+
+    database = args.database or os.path.join(tempfile.mkdtemp(prefix='jlk-bench-'), 'bench.db')
+    app_module = common.load_app(database)
+    existing = app_module.db.connection().execute('SELECT COUNT(*) FROM quotes').fetchone()[0]
+    if existing < args.rows:
+        started = time.perf_counter()
+        fill_quotes(app_module.db, args.rows - existing)
+        print(f"filled {args.rows - existing} quotes in {time.perf_counter() - started:.1f}s")
+
+    print(f"{'case':<16} {'rows/s':>10} {'seconds':>8} {'output MB':>10} {'peak RSS MB':>12}")
+    for case in args.cases.split(','):
+        numbers = run_case(database, case)
+        print(f"{case:<16} {numbers['rows'] / numbers['seconds']:>10.0f} {numbers['seconds']:>8.1f} "
+              f"{numbers['bytes'] / 1e6:>10.1f} {numbers['peak_mb']:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
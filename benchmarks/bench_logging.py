@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Benchmark: request latency with synchronous vs queued logging
+
+Calls the Flask app directly from a pool of threads (enough to keep
+every thread busy, i.e. saturating) on a route that logs a few INFO
+records per request. The log output goes to a sink that takes
+--sink-delay-ms per write, standing in for a slow disk or a log
+collector pushing back. Modes:
+
+  off     records below the configured level, nothing is written (baseline)
+  sync    LOG_QUEUE=0: the request thread formats and writes each record
+  queue   the default: the request thread enqueues, a listener writes
+
+Reported per mode: request p50/p99 and throughput, plus how many records
+reached the sink. In queue mode a sink slower than the request rate makes
+the queue fill up; what does not fit is dropped rather than waited for.
+
+Usage: python benchmarks/bench_logging.py [--requests 4000] [--concurrency 16]
+                                          [--records 2] [--sink-delay-ms 0.2]
+"""
+
+import argparse
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import common
+
+logger = logging.getLogger('bench')
+
+
+class SlowSink:
+    """Write-only stream that takes a fixed time per write, one writer at a time"""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.lines = 0
+        self._lock = threading.Lock()
+
+    def write(self, text):
+        with self._lock:
+            time.sleep(self.delay)
+            self.lines += text.count('\n')
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+def measure(label, app, args):
+    environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/bench/log', 'SERVER_NAME': 'localhost',
+               'SERVER_PORT': '80', 'wsgi.url_scheme': 'http', 'wsgi.input': None}
+
+    def start_response(status, headers, exc_info=None):
+        pass
+
+    def one(_):
+        began = time.perf_counter()
+        body = app(dict(environ), start_response)
+        b''.join(body)
+        if hasattr(body, 'close'):
+            body.close()
+        return time.perf_counter() - began
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        latencies = list(pool.map(one, range(args.requests)))
+    common.summarize(label, latencies, time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=4000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--records', type=int, default=2, help='INFO records logged per request')
+    parser.add_argument('--sink-delay-ms', type=float, default=0.2)
+    args = parser.parse_args()
+
+    app_module = common.load_app()
+    import app_logging
+
+    def log_view():
+        for i in range(args.records):
+            logger.info("bench record %s of %s", i, args.records)
+        return 'ok'
+
+    app_module.app.add_url_rule('/bench/log', 'bench_log', log_view)
+    # Every record uses the same template; measure the handlers, not the rate limiter
+    unlimited = {'rate_limit_burst': 10 ** 9}
+
+    for label, config in (('off', {'level': 'WARNING'}),
+                          ('sync', {'queue': False}),
+                          ('queue', {'queue': True})):
+        sink = SlowSink(args.sink_delay_ms / 1000.0)
+        app_logging.configure(dict(unlimited, **config), stream=sink)
+        measure(label, app_module.app, args)
+        drain_started = time.perf_counter()
+        app_logging.shutdown()
+        drained = time.perf_counter() - drain_started
+        expected = args.requests * args.records if label != 'off' else 0
+        print(f"{'':<28} records written={sink.lines}/{expected}  drain after load={drained:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Benchmark: HTML page requests per second, rendered vs cached
+
+Cycles through the site's pages in one worker, calling the WSGI app
+directly so test-client overhead does not hide the difference:
+
+  render per hit     render_template + asset URL rewrite on every request
+  cached             bytes from the page cache (identity and gzip)
+  cached, 304        If-None-Match revalidation of a cached page
+
+Usage: python benchmarks/bench_page_cache.py [--requests 5000]
+"""
+
+import argparse
+import time
+
+import common
+
+from werkzeug.test import EnvironBuilder
+
+PAGES = ('/', '/services.html', '/about.html', '/quote.html', '/contact.html')
+
+
+def start_response(status, headers, exc_info=None):
+    pass
+
+
+def measure(label, app, count, headers=None, etags=None):
+    environs = []
+    for path in PAGES:
+        request_headers = dict(headers or {})
+        if etags is not None:
+            request_headers['If-None-Match'] = etags[path]
+        environs.append(EnvironBuilder(path=path, headers=request_headers).get_environ())
+
+    latencies = []
+    started = time.perf_counter()
+    for i in range(count):
+        environ = dict(environs[i % len(environs)])
+        began = time.perf_counter()
+        body = app(environ, start_response)
+        b''.join(body)
+        if hasattr(body, 'close'):
+            body.close()
+        latencies.append(time.perf_counter() - began)
+    common.summarize(label, latencies, time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=5000)
+    args = parser.parse_args()
+
+    app_module = common.load_app()
+    app = app_module.app
+    client = app.test_client()
+    pages = app_module.pages
+    gzip_headers = {'Accept-Encoding': 'gzip'}
+
+    pages.config['enabled'] = False
+    measure('render per hit', app, args.requests)
+
+    pages.config['enabled'] = True
+    with app.app_context():
+        pages.warm()
+    measure('cached, identity', app, args.requests)
+    measure('cached, gzip', app, args.requests, gzip_headers)
+    etags = {path: client.get(path, headers=gzip_headers).headers['ETag'] for path in PAGES}
+    measure('cached, 304', app, args.requests, gzip_headers, etags)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Benchmark: /api/quotes page latency against page depth
+
+Fills a throwaway database with a synthetic quotes table (1M rows by
+default), then fetches one page at increasing depths:
+
+  keyset   GET /api/quotes?cursor=... (what the API does)
+  offset   the same page with LIMIT/OFFSET, for comparison
+
+Keyset latency should stay flat; OFFSET grows with depth because SQLite
+walks every skipped row.
+
+Usage: python benchmarks/bench_read_api.py [--rows 1000000] [--limit 100] [--repeat 20]
+"""
+
+import argparse
+import datetime
+import random
+import time
+
+import common
+
+import queries
+
+SERVICE_TYPES = ('import', 'export', 'freight', 'customs', 'warehousing')
+URGENCIES = ('normal', 'urgent', 'express')
+STATUSES = ('pending', 'quoted', 'closed')
+
+
+def fill_quotes(db, rows, batch=50000):
+    """Insert synthetic quotes spread over roughly two years, a few per minute"""
+    rng = random.Random(7)
+    start = datetime.datetime(2024, 1, 1)
+    inserted = 0
+    while inserted < rows:
+        count = min(batch, rows - inserted)
+        params = []
+        for i in range(inserted, inserted + count):
+            created = start + datetime.timedelta(seconds=i * 60 + rng.randrange(60))
+            params.append((f'Company {i}', 'Contact', f'c{i}@example.com', '080-000-0000',
+                           rng.choice(SERVICE_TYPES), 'Bangkok', 'Tokyo', rng.choice(URGENCIES),
+                           rng.choice(STATUSES), created.strftime('%Y-%m-%d %H:%M:%S')))
+        with db.transaction() as cursor:
+            cursor.executemany('''
+                INSERT INTO quotes (company_name, contact_name, email, phone, service_type,
+                                    origin, destination, urgency, status, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', params)
+        inserted += count
+    db.connection().execute('ANALYZE')
+
+
+def median_ms(samples):
+    return common.percentile(samples, 50) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--limit', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    app_module = common.load_app()
+    app_module.ADMIN_API_TOKEN = 'bench'
+    client = app_module.app.test_client()
+    headers = {'Authorization': 'Bearer bench'}
+    db = app_module.db
+
+    started = time.perf_counter()
+    fill_quotes(db, args.rows)
+    print(f"filled {args.rows} quotes in {time.perf_counter() - started:.1f}s")
+
+    conn = db.connection()
+    offset_sql = (f"SELECT {', '.join(queries.LIST_COLUMNS['quotes'])} FROM quotes "
+                  'ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?')
+    print(f"{'depth':>10} {'keyset (API)':>14} {'offset (SQL)':>14}")
+    for depth in (0, 1000, 10000, 100000, 500000, args.rows - args.limit):
+        if depth >= args.rows:
+            continue
+        url = f'/api/quotes?limit={args.limit}'
+        if depth:
+            # Cursor of the row just before the page, as a client walking the pages would hold
+            row = conn.execute('SELECT created_at, id FROM quotes ORDER BY created_at DESC, id DESC '
+                               'LIMIT 1 OFFSET ?', (depth - 1,)).fetchone()
+            url += '&cursor=' + queries.encode_cursor(row['created_at'], row['id'])
+
+        keyset, offset = [], []
+        for _ in range(args.repeat):
+            began = time.perf_counter()
+            response = client.get(url, headers=headers)
+            response.get_data()
+            keyset.append(time.perf_counter() - began)
+
+            began = time.perf_counter()
+            conn.execute(offset_sql, (args.limit, depth)).fetchall()
+            offset.append(time.perf_counter() - began)
+        print(f"{depth:>10} {median_ms(keyset):>12.2f}ms {median_ms(offset):>12.2f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Benchmark: FTS5 trigram search vs LIKE scans
+
+Fills a throwaway database with synthetic quotes in Thai and English
+(2M rows by default), backfills the FTS index the way init_database does
+for existing data, and times the same searches two ways:
+
+  like     WHERE company_name LIKE '%term%' OR ... over the searched columns
+  fts5     search.search(), i.e. quotes_fts MATCH with bm25 ranking and snippets
+
+Common words match a large share of rows, which LIKE with LIMIT finds
+quickly among the newest rows; selective terms (a name, an email, a word
+that is not there) make LIKE scan the whole table.
+
+Usage: python benchmarks/bench_search.py [--rows 2000000] [--repeat 5] [--database PATH]
+"""
+
+import argparse
+import random
+import time
+
+import common
+
+import search
+
+COMPANY_WORDS = ('บริษัท', 'ขนส่ง', 'โลจิสติกส์', 'สยาม', 'ไทย', 'เอเชีย', 'Global', 'Express',
+                 'Trading', 'Cargo', 'Siam', 'Freight', 'อินเตอร์', 'พัฒนา', 'รุ่งเรือง')
+CARGO_TYPES = ('อิเล็กทรอนิกส์', 'เฟอร์นิเจอร์', 'อาหารแช่แข็ง', 'Electronics', 'Machinery',
+               'Textiles', 'ชิ้นส่วนรถยนต์', 'เครื่องสำอาง', 'Chemicals', 'ผลไม้สด')
+PLACES = ('กรุงเทพ', 'เชียงใหม่', 'ชลบุรี', 'ระยอง', 'Bangkok', 'Tokyo', 'Shanghai',
+          'Singapore', 'Ho Chi Minh', 'แหลมฉบัง', 'Los Angeles', 'Rotterdam')
+DESCRIPTION_WORDS = ('สินค้า', 'เปราะบาง', 'ระวัง', 'แตก', 'ด่วน', 'ตู้คอนเทนเนอร์', 'พาเลท',
+                     'handle', 'with', 'care', 'fragile', 'urgent', 'container', 'pallet',
+                     'ประกันภัย', 'บรรจุภัณฑ์', 'temperature', 'controlled', 'ห้องเย็น')
+
+QUERIES = (
+    # common
+    'ขนส่ง', 'Freight', 'อาหารแช่แข็ง ชลบุรี',
+    # selective
+    'ผู้ติดต่อ 1234567', '"ผู้ติดต่อ 1234567"', 'c777777@example.com', 'Rotterdam 1999', 'ไม่มีคำนี้',
+)
+
+
+def fill_quotes(db, rows, batch=50000):
+    rng = random.Random(11)
+    inserted = 0
+    while inserted < rows:
+        count = min(batch, rows - inserted)
+        params = []
+        for i in range(inserted, inserted + count):
+            company = ' '.join(rng.sample(COMPANY_WORDS, 3)) + f' {i}'
+            description = ' '.join(rng.choice(DESCRIPTION_WORDS) for _ in range(rng.randrange(4, 16)))
+            params.append((company, f'ผู้ติดต่อ {i}', f'c{i}@example.com', '080-000-0000', 'export',
+                           rng.choice(PLACES), rng.choice(PLACES), rng.choice(CARGO_TYPES), description))
+        with db.transaction() as cursor:
+            cursor.executemany('''
+                INSERT INTO quotes (company_name, contact_name, email, phone, service_type,
+                                    origin, destination, cargo_type, description)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', params)
+        inserted += count
+
+
+def drop_search_index(cursor):
+    """Remove the FTS tables and triggers so the bulk fill runs without them"""
+    for table in search.SEARCH_COLUMNS:
+        for action in ('insert', 'delete', 'update'):
+            cursor.execute(f'DROP TRIGGER IF EXISTS {table}_fts_{action}')
+        cursor.execute(f'DROP TABLE IF EXISTS {table}_fts')
+
+
+def like_search(conn, text, limit=20):
+    """The LIKE scan staff run today: every term somewhere in the searched columns"""
+    columns = [column for column, _ in search.SEARCH_COLUMNS['quotes']]
+    where, params = [], []
+    indexed, short = search.parse_terms(text)
+    for term in indexed + short:
+        where.append('(' + ' OR '.join(f'{column} LIKE ?' for column in columns) + ')')
+        params.extend([f'%{term}%'] * len(columns))
+    sql = f"SELECT id FROM quotes WHERE {' AND '.join(where)} ORDER BY id DESC LIMIT ?"
+    return conn.execute(sql, params + [limit]).fetchall()
+
+
+def timed(function, repeat):
+    samples = []
+    for _ in range(repeat):
+        began = time.perf_counter()
+        result = function()
+        samples.append(time.perf_counter() - began)
+    return common.percentile(samples, 50) * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=2000000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--database', help='reuse a database filled by an earlier run')
+    args = parser.parse_args()
+
+    app_module = common.load_app(args.database)
+    db = app_module.db
+
+    existing = db.connection().execute('SELECT COUNT(*) FROM quotes').fetchone()[0]
+    if existing < args.rows:
+        with db.transaction() as cursor:
+            drop_search_index(cursor)
+        started = time.perf_counter()
+        fill_quotes(db, args.rows - existing)
+        print(f"filled {args.rows} quotes in {time.perf_counter() - started:.1f}s")
+        started = time.perf_counter()
+        with db.transaction() as cursor:
+            search.init_search(cursor)  # backfills, as for a database that predates the index
+            cursor.execute("INSERT INTO quotes_fts (quotes_fts) VALUES ('optimize')")
+        print(f"backfilled the FTS index in {time.perf_counter() - started:.1f}s")
+
+    conn = db.connection()
+    print(f"{'query':<26} {'like':>10} {'fts5':>10}  hits")
+    for text in QUERIES:
+        like_ms, _ = timed(lambda: like_search(conn, text), args.repeat)
+        fts_ms, hits = timed(lambda: search.search(db, text, tables=('quotes',)), args.repeat)
+        print(f"{text:<26} {like_ms:>8.1f}ms {fts_ms:>8.1f}ms  {len(hits)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Benchmark: worker boot time and per-worker memory under gunicorn
+
+First times `import app` and create_app() in fresh interpreters. Then
+starts gunicorn (with the repository's gunicorn.conf.py) against a
+throwaway database, once with the app preloaded in the master and once
+with GUNICORN_PRELOAD=0, and reports per mode:
+
+  boot       fork-to-ready time of each worker at startup, from the
+             "Worker <pid> ready in <ms> ms" lines gunicorn.conf.py logs
+  recycle    the same for replacement workers after killing one worker
+             at a time, i.e. what autoscaling and max_requests pay
+  RSS        resident memory of a worker after serving a few requests
+  PSS        RSS with pages shared between processes split among them
+  USS        memory private to the worker, what each extra worker costs
+
+Memory figures come from /proc/<pid>/smaps_rollup (Linux only).
+
+Usage: python benchmarks/bench_startup.py [--workers 4] [--recycles 5] [--imports 5]
+"""
+
+import argparse
+import http.client
+import os
+import queue
+import re
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import common
+
+READY_LINE = re.compile(r'Worker (\d+) ready in ([0-9.]+) ms')
+
+IMPORT_SNIPPET = '''
+import sys, time
+sys.path.insert(0, {root!r})
+began = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.create_app()
+print(imported - began, time.perf_counter() - imported, len(sys.modules))
+'''
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def memory_kb(pid):
+    """Rss, Pss and Private (USS) of a process in KiB"""
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as smaps:
+        for line in smaps:
+            name, _, rest = line.partition(':')
+            if name in ('Rss', 'Pss', 'Private_Clean', 'Private_Dirty'):
+                values[name] = int(rest.split()[0])
+    return {'rss': values['Rss'], 'pss': values['Pss'],
+            'uss': values['Private_Clean'] + values['Private_Dirty']}
+
+
+def measure_imports(env, runs):
+    imports, starts, modules = [], [], 0
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, '-c', IMPORT_SNIPPET.format(root=common.ROOT)],
+                                cwd=common.ROOT, env=env, capture_output=True, text=True, check=True)
+        imported, started, modules = result.stdout.split()
+        imports.append(float(imported))
+        starts.append(float(started))
+    print(f"import app          median={statistics.median(imports) * 1000:8.1f}ms  modules={modules}")
+    print(f"create_app()        median={statistics.median(starts) * 1000:8.1f}ms")
+
+
+class Server:
+    """A gunicorn master whose "worker ready" log lines are collected as they arrive"""
+
+    def __init__(self, env, workers):
+        self.port = free_port()
+        self.ready = queue.Queue()
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '--workers', str(workers), '--bind', f'127.0.0.1:{self.port}',
+             '--log-level', 'info'],
+            cwd=common.ROOT, env=env, stderr=subprocess.PIPE, text=True)
+        threading.Thread(target=self._read_log, daemon=True).start()
+
+    def _read_log(self):
+        for line in self.process.stderr:
+            match = READY_LINE.search(line)
+            if match:
+                self.ready.put((int(match.group(1)), float(match.group(2))))
+
+    def wait_ready(self, count, timeout=60):
+        """(pid, ms) of the next `count` workers to become ready"""
+        deadline = time.monotonic() + timeout
+        return [self.ready.get(timeout=max(0.1, deadline - time.monotonic())) for _ in range(count)]
+
+    def warm(self, requests):
+        for i in range(requests):
+            conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=10)
+            conn.request('GET', '/' if i % 2 else '/api/health')
+            conn.getresponse().read()
+            conn.close()
+
+    def stop(self):
+        self.process.terminate()
+        self.process.wait(timeout=30)
+
+
+def run(label, env, args):
+    started = time.perf_counter()
+    server = Server(env, args.workers)
+    try:
+        booted = server.wait_ready(args.workers)
+        all_ready = time.perf_counter() - started
+        server.warm(args.workers * 20)
+        workers = [pid for pid, _ in booted]
+        memory = [memory_kb(pid) for pid in workers]
+        master = memory_kb(server.process.pid)
+
+        recycled = []
+        for _ in range(args.recycles):
+            victim = workers.pop(0)
+            os.kill(victim, signal.SIGKILL)
+            pid, ms = server.wait_ready(1)[0]
+            workers.append(pid)
+            recycled.append(ms)
+    finally:
+        server.stop()
+
+    boot_ms = [ms for _, ms in booted]
+    average = {key: sum(m[key] for m in memory) / len(memory) / 1024 for key in ('rss', 'pss', 'uss')}
+    print(f"{label:<10} boot median={statistics.median(boot_ms):7.1f}ms max={max(boot_ms):7.1f}ms  "
+          f"all up in {all_ready:5.2f}s  recycle median={statistics.median(recycled) if recycled else 0:7.1f}ms")
+    print(f"{'':<10} per worker RSS={average['rss']:6.1f}MB PSS={average['pss']:6.1f}MB "
+          f"USS={average['uss']:6.1f}MB  master RSS={master['rss'] / 1024:6.1f}MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--recycles', type=int, default=5)
+    parser.add_argument('--imports', type=int, default=5)
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp(prefix='jlk-bench-')
+    env = dict(os.environ, METRICS_DIR=os.path.join(scratch, 'metrics'))
+    if os.environ.get('BENCH_DATABASE_URL'):
+        env['DATABASE_URL'] = os.environ['BENCH_DATABASE_URL']
+    else:
+        env['DATABASE_PATH'] = os.path.join(scratch, 'bench.db')
+
+    measure_imports(env, args.imports)
+    run('preload', dict(env, GUNICORN_PRELOAD='1'), args)
+    run('no preload', dict(env, GUNICORN_PRELOAD='0'), args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Benchmark: bytes transferred and throughput for a full page load
+
+A page load fetches the HTML page and every static/ and public/ asset it
+references, the way a browser would. Compared:
+
+  before  no asset build: send_from_directory, uncompressed, no-cache
+  after   fingerprinted URLs, precompressed bodies, immutable caching
+
+Each is measured for a first visit (empty browser cache) and a repeat
+visit (browser sends If-None-Match for what it has cached, and skips
+fresh immutable URLs entirely). Bytes are response bodies only.
+
+Usage: python benchmarks/bench_static_assets.py [--loads 300] [--page quote.html]
+"""
+
+import argparse
+import re
+import tempfile
+import time
+
+import common
+
+from static_assets import build_assets
+
+ACCEPT_ENCODING = 'gzip, deflate, br'
+REFERENCE = re.compile(r'''(?:src|href)=["']/?((?:static|public)/[^"'?#]+)''')
+
+
+def page_load(client, page, cache):
+    """Fetch a page and its assets; returns (requests, body bytes)"""
+    requests_made, transferred = 1, 0
+    response = client.get('/' + page, headers={'Accept-Encoding': ACCEPT_ENCODING})
+    transferred += len(response.data)
+    for url in REFERENCE.findall(response.get_data(as_text=True)):
+        cached = cache.get(url)
+        if cached is not None and 'immutable' in cached['cache_control']:
+            continue  # still fresh; the browser does not ask at all
+        headers = {'Accept-Encoding': ACCEPT_ENCODING}
+        if cached is not None:
+            headers['If-None-Match'] = cached['etag']
+        asset = client.get('/' + url, headers=headers)
+        requests_made += 1
+        transferred += len(asset.data)
+        if asset.status_code == 200:
+            cache[url] = {'etag': asset.headers.get('ETag', ''),
+                          'cache_control': asset.headers.get('Cache-Control', '')}
+    return requests_made, transferred
+
+
+def measure(label, client, page, loads, warm):
+    cache = {}
+    if warm:
+        page_load(client, page, cache)
+    total_requests = total_bytes = 0
+    started = time.perf_counter()
+    for _ in range(loads):
+        visit_cache = dict(cache) if warm else {}
+        made, transferred = page_load(client, page, visit_cache)
+        total_requests += made
+        total_bytes += transferred
+    elapsed = time.perf_counter() - started
+    print(f"{label:<24} {total_bytes / loads / 1024:8.1f} KiB/load  {total_requests / loads:5.1f} req/load  "
+          f"{loads / elapsed:8.1f} loads/s  {total_requests / elapsed:8.1f} req/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--loads', type=int, default=300)
+    parser.add_argument('--page', default='quote.html')
+    args = parser.parse_args()
+
+    app_module = common.load_app()
+    client = app_module.app.test_client()
+    assets = app_module.assets
+
+    assets.config['build_dir'] = tempfile.mkdtemp(prefix='jlk-assets-empty-')
+    assets.load()
+    measure('before, first visit', client, args.page, args.loads, warm=False)
+    measure('before, repeat visit', client, args.page, args.loads, warm=True)
+
+    assets.config['build_dir'] = tempfile.mkdtemp(prefix='jlk-assets-')
+    build_assets({'build_dir': assets.config['build_dir']})
+    assets.load()
+    measure('after, first visit', client, args.page, args.loads, warm=False)
+    measure('after, repeat visit', client, args.page, args.loads, warm=True)
+
+
+if __name__ == '__main__':
+    main()
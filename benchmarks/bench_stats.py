@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Benchmark: /api/stats from the rollups against GROUP BY over quotes
+
+Fills a throwaway database with synthetic quotes (1M rows by default,
+about two years at one per minute; the rollup triggers count each one),
+then answers the same dashboard questions three ways:
+
+  group by   COUNT(*) ... GROUP BY bucket, value, status over the quotes
+             in the range, what a dashboard query without rollups runs
+  rollups    stats.py reading quote_rollups (cache bypassed)
+  api        GET /api/stats end to end, answered from the TTL cache after
+             the first call
+
+and finally the price of keeping the rollups current: single-quote
+save_quote() calls per second with the triggers, then without them.
+
+Usage: python benchmarks/bench_stats.py [--rows 1000000] [--repeat 20] [--inserts 2000]
+"""
+
+import argparse
+import datetime
+import random
+import time
+
+import common
+
+import stats
+from database import QUOTE_COLUMNS
+
+SERVICE_TYPES = ('import', 'export', 'freight', 'customs', 'warehousing')
+URGENCIES = ('normal', 'urgent', 'express')
+STATUSES = ('pending', 'quoted', 'closed')
+PLACES = ('Bangkok', 'Laem Chabang', 'Tokyo', 'Shanghai', 'Singapore', 'Rotterdam', 'Los Angeles')
+
+START = datetime.datetime(2024, 1, 1)
+
+# (label, /api/stats arguments); the ranges end inside the synthetic data
+QUESTIONS = (
+    ('48h by urgency', {'granularity': 'hour', 'dimension': 'urgency',
+                        'from': '2025-09-01 00:00:00', 'to': '2025-09-03 00:00:00'}),
+    ('30d by service', {'granularity': 'day', 'dimension': 'service_type',
+                        'from': '2025-08-01', 'to': '2025-08-31'}),
+    ('1y by lane', {'granularity': 'day', 'dimension': 'lane', 'from': '2024-09-01', 'to': '2025-09-01'}),
+)
+
+
+def fill_quotes(db, rows, batch=50000):
+    """Insert synthetic quotes from START, one a minute, over a few dozen lanes"""
+    rng = random.Random(11)
+    inserted = 0
+    while inserted < rows:
+        count = min(batch, rows - inserted)
+        params = []
+        for i in range(inserted, inserted + count):
+            created = START + datetime.timedelta(seconds=i * 60 + rng.randrange(60))
+            params.append((f'Company {i}', 'Contact', f'c{i}@example.com', '080-000-0000',
+                           rng.choice(SERVICE_TYPES), rng.choice(PLACES), rng.choice(PLACES),
+                           rng.choice(URGENCIES), rng.choice(STATUSES), created.strftime('%Y-%m-%d %H:%M:%S')))
+        with db.transaction() as cursor:
+            cursor.executemany('''
+                INSERT INTO quotes (company_name, contact_name, email, phone, service_type,
+                                    origin, destination, urgency, status, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', params)
+        inserted += count
+    db.connection().execute('ANALYZE')
+
+
+def group_by_sql(dialect, granularity, dimension):
+    bucket = stats._BUCKET_SQL[dialect][granularity].format(ts='created_at')
+    value = stats._VALUE_SQL[dimension].format(row='')
+    return (f"SELECT {bucket}, {value}, coalesce(status, ''), COUNT(*) FROM quotes "
+            'WHERE created_at >= ? AND created_at < ? GROUP BY 1, 2, 3')
+
+
+def drop_rollup_triggers(db):
+    conn = db.connection()
+    if db.dialect == 'postgresql':
+        names = {row[0] for row in conn.execute(
+            "SELECT trigger_name FROM information_schema.triggers "
+            "WHERE event_object_table = 'quotes' AND trigger_name LIKE 'quotes_rollup%'")}
+        for name in names:
+            conn.execute(f'DROP TRIGGER {name} ON quotes')
+    else:
+        names = [row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'quotes_rollup%'")]
+        for name in names:
+            conn.execute(f'DROP TRIGGER {name}')
+
+
+def inserts_per_second(db, count):
+    record = {column: '' for column in QUOTE_COLUMNS}
+    record.update(company_name='Bench', contact_name='Contact', email='bench@example.com', phone='080-000-0000',
+                  service_type='export', origin='Bangkok', destination='Tokyo', urgency='normal')
+    started = time.perf_counter()
+    for _ in range(count):
+        db.save_quote(record)
+    return count / (time.perf_counter() - started)
+
+
+def median_ms(samples):
+    return common.percentile(samples, 50) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--inserts', type=int, default=2000)
+    args = parser.parse_args()
+
+    app_module = common.load_app()
+    app_module.ADMIN_API_TOKEN = 'bench'
+    client = app_module.app.test_client()
+    headers = {'Authorization': 'Bearer bench'}
+    db = app_module.db
+
+    started = time.perf_counter()
+    fill_quotes(db, args.rows)
+    print(f"filled {args.rows} quotes in {time.perf_counter() - started:.1f}s")
+
+    conn = db.connection()
+    print(f"{'question':<16} {'group by':>12} {'rollups':>12} {'api':>12}")
+    for label, question in QUESTIONS:
+        key = stats.parse_request(question)
+        granularity, dimension, start, end, _ = key
+        sql = group_by_sql(db.dialect, granularity, dimension)
+        bounds = (start.strftime('%Y-%m-%d %H:%M:%S'), end.strftime('%Y-%m-%d %H:%M:%S'))
+        grouped, rolled, api = [], [], []
+        for _ in range(args.repeat):
+            began = time.perf_counter()
+            conn.execute(sql, bounds).fetchall()
+            grouped.append(time.perf_counter() - began)
+
+            began = time.perf_counter()
+            stats._query(db, *key)
+            rolled.append(time.perf_counter() - began)
+
+            began = time.perf_counter()
+            client.get('/api/stats', query_string=question, headers=headers).get_data()
+            api.append(time.perf_counter() - began)
+        print(f"{label:<16} {median_ms(grouped):>10.2f}ms {median_ms(rolled):>10.2f}ms {median_ms(api):>10.2f}ms")
+
+    with_triggers = inserts_per_second(db, args.inserts)
+    drop_rollup_triggers(db)
+    without_triggers = inserts_per_second(db, args.inserts)
+    print(f"save_quote/s   with rollup triggers {with_triggers:8.0f}   without {without_triggers:8.0f}")
+
+
+if __name__ == '__main__':
+    main()
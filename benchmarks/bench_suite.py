@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite: end-to-end throughput, latency and memory of the Flask app
+
+Runs the main request paths against a seeded synthetic database, with
+email going to a local fake SMTP server, so nothing leaves the machine:
+
+  page          GET  /services.html
+  static        GET  /static/css/style.css
+  quote_json    POST /api/quote (JSON)
+  quote_image   POST /api/quote (multipart form with a JPEG attachment)
+  contact       POST /api/contact
+
+Two modes:
+
+  micro   each scenario in its own child process through the Flask test
+          client, one request at a time; peak RSS is the child's
+  load    gunicorn (the repository's gunicorn.conf.py, restarted per
+          scenario) driven by several client processes with a few
+          threads each over real sockets; peak RSS is the largest
+          worker's VmHWM
+
+Each scenario reports requests/s, p50/p95/p99 latency and peak RSS.
+--save writes the results as JSON; --baseline compares a run with such a
+file and exits with status 1 if any number is worse than the baseline
+by more than --tolerance (rps lower, latency or memory higher). Keep
+baselines per machine: the numbers only compare like with like.
+
+Usage: python benchmarks/bench_suite.py [--modes micro,load] [--scenarios page,quote_json,...]
+                                        [--requests 300] [--load-requests 2000] [--workers 4]
+                                        [--clients 4] [--threads 8] [--seed-rows 20000]
+                                        [--save results.json] [--baseline results.json] [--tolerance 0.25]
+"""
+
+import argparse
+import datetime
+import http.client
+import io
+import json
+import multiprocessing
+import os
+import random
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import common
+from fake_smtp import FakeSMTPServer
+
+SCENARIOS = ('page', 'static', 'quote_json', 'quote_image', 'contact')
+
+SAMPLE_CONTACT = {
+    'name': 'สมหญิง ทดสอบ',
+    'email': 'somying@example.com',
+    'subject': 'สอบถามบริการ',
+    'message': 'ต้องการทราบราคาขนส่งไปญี่ปุ่น',
+}
+
+SERVICE_TYPES = ('import', 'export', 'freight', 'customs', 'warehousing')
+URGENCIES = ('normal', 'urgent', 'express')
+STATUSES = ('pending', 'quoted', 'closed')
+BOUNDARY = 'jlk-bench-boundary'
+
+# Metric -> whether a larger value is better, for the baseline comparison
+COMPARED = {'rps': True, 'p50_ms': False, 'p95_ms': False, 'p99_ms': False, 'peak_rss_mb': False}
+
+
+# -- fixtures ---------------------------------------------------------------
+
+def seed_database(db, quotes, contacts, seed=11):
+    """Fill a fresh database with synthetic quotes and contacts spread over a year"""
+    rng = random.Random(seed)
+    start = datetime.datetime(2025, 1, 1)
+    quote_rows, contact_rows = [], []
+    for i in range(quotes):
+        created = start + datetime.timedelta(seconds=i * 600 + rng.randrange(600))
+        quote_rows.append((f'Company {i}', 'Contact', f'c{i}@example.com', '080-000-0000',
+                           rng.choice(SERVICE_TYPES), 'Bangkok', 'Tokyo', rng.choice(URGENCIES),
+                           rng.choice(STATUSES), created.strftime('%Y-%m-%d %H:%M:%S')))
+    for i in range(contacts):
+        created = start + datetime.timedelta(seconds=i * 3600 + rng.randrange(3600))
+        contact_rows.append((f'Person {i}', f'p{i}@example.com', 'สอบถามบริการ', 'ขอราคาขนส่ง',
+                             created.strftime('%Y-%m-%d %H:%M:%S')))
+    with db.transaction() as cursor:
+        cursor.executemany('''
+            INSERT INTO quotes (company_name, contact_name, email, phone, service_type,
+                                origin, destination, urgency, status, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', quote_rows)
+        cursor.executemany('''
+            INSERT INTO contacts (name, email, subject, message, created_at) VALUES (?, ?, ?, ?, ?)
+        ''', contact_rows)
+
+
+def sample_jpeg(seed=3):
+    """A 1024x768 noisy JPEG, roughly the size of a phone photo scaled down"""
+    from PIL import Image
+    random.seed(seed)
+    image = Image.effect_noise((1024, 768), 48).convert('RGB')
+    output = io.BytesIO()
+    image.save(output, 'JPEG', quality=85)
+    return output.getvalue()
+
+
+def multipart_body(fields, filename, data):
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'
+                     .encode('utf-8'))
+    parts.append(f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="attachment"; filename="{filename}"\r\n'
+                 'Content-Type: image/jpeg\r\n\r\n'.encode('utf-8') + data + b'\r\n')
+    parts.append(f'--{BOUNDARY}--\r\n'.encode('utf-8'))
+    return b''.join(parts)
+
+
+def scenario_request(name, image=None):
+    """(method, path, body, content type) of one request of a scenario"""
+    if name == 'page':
+        return 'GET', '/services.html', b'', None
+    if name == 'static':
+        return 'GET', '/static/css/style.css', b'', None
+    if name == 'quote_json':
+        return 'POST', '/api/quote', json.dumps(common.SAMPLE_QUOTE).encode('utf-8'), 'application/json'
+    if name == 'quote_image':
+        return ('POST', '/api/quote', multipart_body(common.SAMPLE_QUOTE, 'cargo.jpg', image),
+                f'multipart/form-data; boundary={BOUNDARY}')
+    if name == 'contact':
+        return 'POST', '/api/contact', json.dumps(SAMPLE_CONTACT).encode('utf-8'), 'application/json'
+    raise ValueError(f'unknown scenario {name!r}')
+
+
+def summary(latencies, elapsed, peak_rss_mb, failures):
+    return {
+        'requests': len(latencies),
+        'rps': len(latencies) / elapsed if elapsed else 0.0,
+        'p50_ms': common.percentile(latencies, 50) * 1000,
+        'p95_ms': common.percentile(latencies, 95) * 1000,
+        'p99_ms': common.percentile(latencies, 99) * 1000,
+        'peak_rss_mb': peak_rss_mb,
+        'failures': failures,
+    }
+
+
+# -- micro: Flask test client ----------------------------------------------------
+
+def micro_child(scenario, database, requests, image_path):
+    """Run one scenario through the test client in this process and print its summary as JSON"""
+    app_module = common.load_app(database)
+    client = app_module.app.test_client()
+    image = open(image_path, 'rb').read() if image_path else None
+    method, path, body, content_type = scenario_request(scenario, image)
+    for _ in range(min(20, requests)):  # warm caches, pools and the image worker
+        client.open(path, method=method, data=body, content_type=content_type)
+    latencies, failures = [], 0
+    started = time.perf_counter()
+    for _ in range(requests):
+        began = time.perf_counter()
+        response = client.open(path, method=method, data=body, content_type=content_type)
+        response.get_data()
+        latencies.append(time.perf_counter() - began)
+        if response.status_code >= 400:
+            failures += 1
+    elapsed = time.perf_counter() - started
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on Linux
+    print(json.dumps(summary(latencies, elapsed, peak, failures)))
+
+
+def run_micro(scenario, args, env):
+    command = [sys.executable, os.path.abspath(__file__), '--micro-child', scenario,
+               '--database', args.database, '--requests', str(args.requests), '--image', args.image]
+    result = subprocess.run(command, cwd=common.ROOT, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f'micro {scenario} failed:\n{result.stderr[-2000:]}')
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+# -- load: gunicorn and client processes ------------------------------------------
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_up(port, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/api/health')
+            if conn.getresponse().status in (200, 503):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f'server on port {port} did not come up')
+
+
+def worker_pids(master):
+    pids = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as stat:
+                # ppid is the 2nd field after the parenthesised command name
+                if int(stat.read().rpartition(')')[2].split()[1]) == master:
+                    pids.append(int(entry))
+        except (OSError, ValueError, IndexError):
+            continue
+    return pids
+
+
+def peak_rss_mb(pid):
+    with open(f'/proc/{pid}/status') as status:
+        for line in status:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def client_process(port, request, count, threads, results):
+    """Send `count` requests from `threads` threads; puts (latencies, failures) on results"""
+    method, path, body, content_type = request
+    headers = {'Content-Type': content_type} if content_type else {}
+    latencies, failures = [], [0]
+    lock = threading.Lock()
+    remaining = [count]
+
+    def run():
+        while True:
+            with lock:
+                if remaining[0] == 0:
+                    return
+                remaining[0] -= 1
+            began = time.perf_counter()
+            try:
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+                conn.request(method, path, body=body or None, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                conn.close()
+                ok = response.status < 400
+            except (OSError, http.client.HTTPException):
+                ok = False
+            elapsed = time.perf_counter() - began
+            with lock:
+                latencies.append(elapsed)
+                if not ok:
+                    failures[0] += 1
+
+    pool = [threading.Thread(target=run) for _ in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    results.put((latencies, failures[0]))
+
+
+def run_load(scenario, args, env, image):
+    port = free_port()
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '--workers', str(args.workers),
+                               '--bind', f'127.0.0.1:{port}', '--log-level', 'warning'],
+                              cwd=common.ROOT, env=env, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_up(port)
+        request = scenario_request(scenario, image)
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        # Warm every worker before timing
+        warm = context.Process(target=client_process, args=(port, request, args.workers * 10, args.workers, results))
+        warm.start()
+        results.get()
+        warm.join()
+
+        per_client = args.load_requests // args.clients
+        clients = [context.Process(target=client_process, args=(port, request, per_client, args.threads, results))
+                   for _ in range(args.clients)]
+        started = time.perf_counter()
+        for client in clients:
+            client.start()
+        latencies, failures = [], 0
+        for _ in clients:
+            client_latencies, client_failures = results.get()
+            latencies.extend(client_latencies)
+            failures += client_failures
+        elapsed = time.perf_counter() - started
+        for client in clients:
+            client.join()
+        peak = max((peak_rss_mb(pid) for pid in worker_pids(server.pid)), default=0.0)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+    return summary(latencies, elapsed, peak, failures)
+
+
+# -- reporting --------------------------------------------------------------------
+
+def print_table(mode, results):
+    print(f"\n{mode}")
+    print(f"{'scenario':<14} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'peak RSS MB':>12} {'failed':>7}")
+    for scenario, numbers in results.items():
+        print(f"{scenario:<14} {numbers['rps']:>9.1f} {numbers['p50_ms']:>9.2f} {numbers['p95_ms']:>9.2f} "
+              f"{numbers['p99_ms']:>9.2f} {numbers['peak_rss_mb']:>12.1f} {numbers['failures']:>7}")
+
+
+def compare(results, baseline, tolerance):
+    """Lines describing every number worse than the baseline by more than tolerance"""
+    regressions = []
+    for mode, scenarios in results.items():
+        for scenario, numbers in scenarios.items():
+            reference = baseline.get(mode, {}).get(scenario)
+            if reference is None:
+                continue
+            for metric, higher_is_better in COMPARED.items():
+                old, new = reference.get(metric), numbers.get(metric)
+                if not old or new is None:
+                    continue
+                change = (new - old) / old
+                worse = change < -tolerance if higher_is_better else change > tolerance
+                if worse:
+                    regressions.append(f"{mode}/{scenario} {metric}: {old:.2f} -> {new:.2f} ({change:+.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--modes', default='micro,load')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--requests', type=int, default=300, help='Requests per scenario in micro mode.')
+    parser.add_argument('--load-requests', type=int, default=2000, help='Requests per scenario in load mode.')
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn workers.')
+    parser.add_argument('--clients', type=int, default=4, help='Load generator processes.')
+    parser.add_argument('--threads', type=int, default=8, help='Threads per load generator process.')
+    parser.add_argument('--seed-rows', type=int, default=20000, help='Synthetic quotes in the database.')
+    parser.add_argument('--save', help='Write the results to this JSON file.')
+    parser.add_argument('--baseline', help='Compare with results saved earlier; exit 1 on regressions.')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed relative change (0.25 = 25%%).')
+    parser.add_argument('--micro-child', help=argparse.SUPPRESS)
+    parser.add_argument('--database', help=argparse.SUPPRESS)
+    parser.add_argument('--image', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.micro_child:
+        micro_child(args.micro_child, args.database, args.requests, args.image)
+        return
+
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    scratch = tempfile.mkdtemp(prefix='jlk-bench-')
+    args.database = os.path.join(scratch, 'bench.db')
+    app_module = common.load_app(args.database)
+    seed_database(app_module.db, args.seed_rows, args.seed_rows // 10)
+    image = sample_jpeg()
+    args.image = os.path.join(scratch, 'cargo.jpg')
+    with open(args.image, 'wb') as f:
+        f.write(image)
+
+    smtp = FakeSMTPServer().start()
+    env = dict(os.environ, DATABASE_PATH=args.database, METRICS_DIR=os.path.join(scratch, 'metrics'),
+               RATE_LIMIT_FILE=os.path.join(scratch, 'rate_limit.bin'),
+               EMAIL_PASSWORD='bench', EMAIL_USE_TLS='0', SMTP_SERVER='127.0.0.1', SMTP_PORT=str(smtp.port))
+    scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    results = {}
+    try:
+        for mode in args.modes.split(','):
+            results[mode] = {}
+            for scenario in scenarios:
+                results[mode][scenario] = (run_micro(scenario, args, env) if mode == 'micro'
+                                           else run_load(scenario, args, env, image))
+            print_table(mode, results[mode])
+    finally:
+        smtp.stop()
+    print(f"\nemails delivered to the fake SMTP server: {smtp.messages}")
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(dict(results, meta={'seed_rows': args.seed_rows, 'workers': args.workers,
+                                          'clients': args.clients, 'threads': args.threads,
+                                          'requests': args.requests, 'load_requests': args.load_requests}),
+                      f, indent=2)
+        print(f"results saved to {args.save}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\nREGRESSIONS against {args.baseline} (tolerance {args.tolerance:.0%}):")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"\nno regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == '__main__':
+    main()
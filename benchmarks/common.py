@@ -0,0 +1,74 @@
+"""
+Shared helpers for the benchmark scripts
+
+Benchmarks import the Flask app from the repository root and point it at a
+throwaway SQLite database so jlktran.db is never touched. With
+BENCH_DATABASE_URL=postgresql://... they run against that PostgreSQL
+database instead (it should be an empty scratch database).
+"""
+
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# Benchmarks post the same sample form many times from one address; measure the
+# full submission path rather than the rate limiter and duplicate suppression
+os.environ.setdefault('RATE_LIMIT', '0')
+os.environ.setdefault('IDEMPOTENCY', '0')
+
+
+def load_app(database=None):
+    """Import app.py with a temporary database and return the module"""
+    import app as app_module
+    if database is None:
+        database = os.environ.get('BENCH_DATABASE_URL') or os.path.join(
+            tempfile.mkdtemp(prefix='jlk-bench-'), 'bench.db')
+    from batch_writer import BatchWriter
+    from database import open_database
+    app_module.DATABASE = database
+    app_module.db = open_database(database)
+    if isinstance(app_module.store, BatchWriter):
+        app_module.store = BatchWriter(app_module.db)
+    else:
+        app_module.store = app_module.db
+    app_module.create_app()
+    return app_module
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def summarize(label, latencies, elapsed):
+    """Print a one-line latency/throughput summary (latencies in seconds)"""
+    count = len(latencies)
+    print(f"{label:<28} n={count:<6} "
+          f"p50={percentile(latencies, 50) * 1000:8.2f}ms "
+          f"p99={percentile(latencies, 99) * 1000:8.2f}ms "
+          f"rps={count / elapsed if elapsed else 0:9.1f}")
+
+
+SAMPLE_QUOTE = {
+    'companyName': 'บริษัท ทดสอบ จำกัด',
+    'contactName': 'สมชาย ใจดี',
+    'email': 'somchai@example.com',
+    'phone': '081-234-5678',
+    'serviceType': 'export',
+    'origin': 'Bangkok',
+    'destination': 'Tokyo',
+    'cargoType': 'Electronics',
+    'weight': '1200',
+    'dimensions': '120x80x100',
+    'urgency': 'urgent',
+    'additionalServices': '["insurance", "packaging"]',
+    'description': 'Fragile goods\nHandle with care',
+}
@@ -0,0 +1,110 @@
+"""
+Minimal local SMTP server for benchmarks
+
+Speaks just enough ESMTP (EHLO, AUTH, MAIL, RCPT, DATA, NOOP, RSET, QUIT)
+for smtplib to log in and deliver messages. Configurable delays let the
+benchmarks simulate a slow remote provider such as Gmail.
+"""
+
+import socketserver
+import threading
+import time
+
+
+class FakeSMTPServer(socketserver.ThreadingTCPServer):
+    """Threaded fake SMTP server that counts delivered messages"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 256  # listen backlog; the default of 5 drops connects under load
+
+    def __init__(self, host='127.0.0.1', port=0, connect_delay=0.0, auth_delay=0.0, data_delay=0.0):
+        super().__init__((host, port), _SMTPHandler)
+        self.connect_delay = connect_delay
+        self.auth_delay = auth_delay
+        self.data_delay = data_delay
+        self.connections = 0
+        self.messages = 0
+        self.active = 0  # sessions open right now
+        self.max_active = 0
+        self._count_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def count(self, attr):
+        with self._count_lock:
+            setattr(self, attr, getattr(self, attr) + 1)
+
+    def session(self, delta):
+        with self._count_lock:
+            self.active += delta
+            self.max_active = max(self.max_active, self.active)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+
+    def reply(self, line):
+        self.wfile.write(line.encode('ascii') + b'\r\n')
+        self.wfile.flush()
+
+    def handle(self):
+        server = self.server
+        server.count('connections')
+        server.session(1)
+        try:
+            self._converse(server)
+        except (ConnectionResetError, BrokenPipeError):
+            # A benchmark process exited with a pooled connection still open
+            pass
+        finally:
+            server.session(-1)
+
+    def _converse(self, server):
+        time.sleep(server.connect_delay)
+        self.reply('220 fake-smtp ready')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('utf-8', 'replace').strip()
+            verb = command.split(' ', 1)[0].upper()
+            if verb in ('EHLO', 'HELO'):
+                self.wfile.write(b'250-fake-smtp\r\n250-AUTH PLAIN LOGIN\r\n250 8BITMIME\r\n')
+                self.wfile.flush()
+            elif verb == 'AUTH':
+                time.sleep(server.auth_delay)
+                parts = command.split()
+                if len(parts) == 2 and parts[1].upper() == 'LOGIN':
+                    self.reply('334 VXNlcm5hbWU6')
+                    self.rfile.readline()
+                    self.reply('334 UGFzc3dvcmQ6')
+                    self.rfile.readline()
+                self.reply('235 authenticated')
+            elif verb in ('MAIL', 'RCPT', 'RSET', 'NOOP'):
+                self.reply('250 ok')
+            elif verb == 'DATA':
+                self.reply('354 end with .')
+                while True:
+                    data = self.rfile.readline()
+                    if not data or data in (b'.\r\n', b'.\n'):
+                        break
+                time.sleep(server.data_delay)
+                server.count('messages')
+                self.reply('250 queued')
+            elif verb == 'QUIT':
+                self.reply('221 bye')
+                return
+            else:
+                self.reply('502 not implemented')
@@ -0,0 +1,213 @@
+"""
+Frozen copy of the original format_quote_email, kept only as the baseline
+for bench_email_render.py. Do not use it in the application.
+"""
+
+import datetime
+import json
+
+
+def format_quote_email(data, image_url=None, base_url='http://localhost:5000/'):
+    """Pre-template-engine implementation (request.url_root replaced by base_url)"""
+    html_template = """
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <meta charset="UTF-8">
+        <style>
+            body {{ font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; line-height: 1.6; color: #333; margin: 0; padding: 20px; background-color: #f5f5f5; }}
+            .container {{ max-width: 600px; margin: 0 auto; background: white; border-radius: 10px; box-shadow: 0 4px 6px rgba(0,0,0,0.1); overflow: hidden; }}
+            .header {{ background: linear-gradient(135deg, #1e3a8a, #3b82f6); color: white; padding: 30px; text-align: center; }}
+            .header h1 {{ margin: 0; font-size: 24px; }}
+            .header p {{ margin: 10px 0 0 0; opacity: 0.9; }}
+            .content {{ padding: 30px; }}
+            .section {{ margin-bottom: 25px; }}
+            .section h2 {{ color: #1e3a8a; border-bottom: 2px solid #3b82f6; padding-bottom: 5px; margin-bottom: 15px; font-size: 18px; }}
+            .field {{ margin-bottom: 12px; }}
+            .field-label {{ font-weight: bold; color: #555; margin-bottom: 5px; }}
+            .field-value {{ background: #f8f9ff; padding: 8px 12px; border-radius: 5px; border-left: 3px solid #3b82f6; }}
+            .grid {{ display: grid; grid-template-columns: 1fr 1fr; gap: 15px; }}
+            .image-section {{ text-align: center; margin: 20px 0; }}
+            .image-section img {{ max-width: 100%; height: auto; border-radius: 8px; box-shadow: 0 2px 8px rgba(0,0,0,0.1); }}
+            .footer {{ background: #f1f5f9; padding: 20px; text-align: center; color: #666; font-size: 14px; }}
+            .urgent {{ background: #fef3c7; border-left-color: #f59e0b; }}
+            .important {{ background: #fecaca; border-left-color: #ef4444; }}
+            @media (max-width: 600px) {{
+                .grid {{ grid-template-columns: 1fr; }}
+                .container {{ margin: 10px; }}
+                .header, .content {{ padding: 20px; }}
+            }}
+        </style>
+    </head>
+    <body>
+        <div class="container">
+            <div class="header">
+                <h1>🚛 คำขอใบเสนอราคาใหม่</h1>
+                <p>JLK Transservice - บริการโลจิสติกส์มืออาชีพ</p>
+            </div>
+            
+            <div class="content">
+                <div class="section">
+                    <h2>📋 ข้อมูลผู้ติดต่อ</h2>
+                    <div class="grid">
+                        <div class="field">
+                            <div class="field-label">🏢 ชื่อบริษัท</div>
+                            <div class="field-value">{company_name}</div>
+                        </div>
+                        <div class="field">
+                            <div class="field-label">👤 ชื่อผู้ติดต่อ</div>
+                            <div class="field-value">{contact_name}</div>
+                        </div>
+                        <div class="field">
+                            <div class="field-label">✉️ อีเมล</div>
+                            <div class="field-value"><a href="mailto:{email}">{email}</a></div>
+                        </div>
+                        <div class="field">
+                            <div class="field-label">📞 เบอร์โทรศัพท์</div>
+                            <div class="field-value"><a href="tel:{phone}">{phone}</a></div>
+                        </div>
+                    </div>
+                </div>
+
+                <div class="section">
+                    <h2>🚚 ข้อมูลบริการ</h2>
+                    <div class="grid">
+                        <div class="field">
+                            <div class="field-label">🎯 ประเภทบริการ</div>
+                            <div class="field-value">{service_type_text}</div>
+                        </div>
+                        <div class="field">
+                            <div class="field-label">⚡ ความเร่งด่วน</div>
+                            <div class="field-value {urgency_class}">{urgency_text}</div>
+                        </div>
+                        <div class="field">
+                            <div class="field-label">📍 จุดต้นทาง</div>
+                            <div class="field-value">{origin}</div>
+                        </div>
+                        <div class="field">
+                            <div class="field-label">📍 จุดปลายทาง</div>
+                            <div class="field-value">{destination}</div>
+                        </div>
+                    </div>
+                </div>
+
+                <div class="section">
+                    <h2>📦 ข้อมูลสินค้า</h2>
+                    <div class="grid">
+                        <div class="field">
+                            <div class="field-label">📋 ประเภทสินค้า</div>
+                            <div class="field-value">{cargo_type}</div>
+                        </div>
+                        <div class="field">
+                            <div class="field-label">⚖️ น้ำหนัก</div>
+                            <div class="field-value">{weight}</div>
+                        </div>
+                    </div>
+                    <div class="field">
+                        <div class="field-label">📏 ขนาด</div>
+                        <div class="field-value">{dimensions}</div>
+                    </div>
+                </div>
+
+                {additional_services_section}
+
+                {image_section}
+
+                {description_section}
+            </div>
+
+            <div class="footer">
+                <p><strong>JLK Transservice</strong> - บริการโลจิสติกส์ นำเข้า-ส่งออก และพิธีการทางศุลกากร</p>
+                <p>📧 jlktransservice@gmail.com | 📱 ติดต่อกลับภายใน 24 ชั่วโมง</p>
+                <p><em>วันที่ส่งคำขอ: {date_time}</em></p>
+            </div>
+        </div>
+    </body>
+    </html>
+    """
+
+    # Service type mapping
+    service_types = {
+        'export': '📤 บริการส่งออก',
+        'import': '📥 บริการนำเข้า', 
+        'customs': '🏛️ พิธีการศุลกากร',
+        'domestic': '🚛 ขนส่งภายในประเทศ',
+        'consulting': '💼 ที่ปรึกษาโลจิสติกส์',
+        'other': '🔄 อื่นๆ'
+    }
+
+    # Urgency mapping and classes
+    urgency_types = {
+        'standard': 'ปกติ (7-14 วัน)',
+        'urgent': 'เร่งด่วน (3-7 วัน)',
+        'express': 'ด่วนพิเศษ (1-3 วัน)',
+        'same-day': 'ภายในวันเดียว'
+    }
+
+    urgency_classes = {
+        'express': 'important',
+        'same-day': 'important',
+        'urgent': 'urgent'
+    }
+
+    # Additional services section
+    additional_services_section = ""
+    if data.get('additionalServices'):
+        services_list = json.loads(data.get('additionalServices', '[]'))
+        if services_list:
+            services_html = "<ul>" + "".join([f"<li>{service}</li>" for service in services_list]) + "</ul>"
+            additional_services_section = f"""
+                <div class="section">
+                    <h2>➕ บริการเพิ่มเติม</h2>
+                    <div class="field">
+                        <div class="field-value">{services_html}</div>
+                    </div>
+                </div>
+            """
+
+    # Image section
+    image_section = ""
+    if image_url:
+        image_section = f"""
+            <div class="section">
+                <h2>🖼️ รูปภาพประกอบ</h2>
+                <div class="image-section">
+                    <img src="{base_url.rstrip('/')}{image_url}" alt="รูปภาพประกอบคำขอใบเสนอราคา" />
+                    <p style="margin-top: 10px; color: #666; font-size: 14px;">
+                        <a href="{base_url.rstrip('/')}{image_url}" target="_blank">ดูรูปภาพขนาดเต็ม</a>
+                    </p>
+                </div>
+            </div>
+        """
+
+    # Description section
+    description_section = ""
+    if data.get('description'):
+        description_html = data.get('description', '').replace('\n', '<br>')
+        description_section = f"""
+            <div class="section">
+                <h2>💬 รายละเอียดเพิ่มเติม</h2>
+                <div class="field">
+                    <div class="field-value">{description_html}</div>
+                </div>
+            </div>
+        """
+
+    return html_template.format(
+        company_name=data.get('companyName', '-'),
+        contact_name=data.get('contactName', '-'),
+        email=data.get('email', '-'),
+        phone=data.get('phone', '-'),
+        service_type_text=service_types.get(data.get('serviceType', ''), data.get('serviceType', '-')),
+        urgency_text=urgency_types.get(data.get('urgency', ''), data.get('urgency', '-') if data.get('urgency') else 'ไม่ระบุ'),
+        urgency_class=urgency_classes.get(data.get('urgency', ''), ''),
+        origin=data.get('origin', 'ไม่ระบุ'),
+        destination=data.get('destination', 'ไม่ระบุ'),
+        cargo_type=data.get('cargoType', 'ไม่ระบุ'),
+        weight=f"{data.get('weight', 'ไม่ระบุ')} กก." if data.get('weight') else 'ไม่ระบุ',
+        dimensions=f"{data.get('dimensions', 'ไม่ระบุ')} ซม." if data.get('dimensions') else 'ไม่ระบุ',
+        additional_services_section=additional_services_section,
+        image_section=image_section,
+        description_section=description_section,
+        date_time=datetime.datetime.now().strftime('%d/%m/%Y %H:%M:%S')
+    )
@@ -0,0 +1,198 @@
+"""
+JLK Transservice - Broken link beacons from 404.html
+
+404.html posts {path, referrer} to /api/404-log whenever someone lands on
+a missing page. The endpoint answers 204 straight away; the beacon only
+adds one to an in-memory count for its (path, referrer) pair. A
+background thread per process adds the counts to the `broken_links`
+table every `flush_interval` seconds in one transaction, one upsert
+per distinct pair, so a burst of hits on the same dead link costs a single
+row write.
+
+Beacons are cheap to send and easy to flood, so they are bounded:
+bodies over `max_body` bytes and anything that is not a path are dropped,
+only `sample_rate` of beacons are counted, referrers lose their query
+string and fragment, and at most `max_pending` distinct pairs wait for
+a flush (new pairs beyond that are dropped until the next one). Counts
+held in memory are lost if a worker is killed; a normal shutdown
+flushes them.
+"""
+
+import datetime
+import json
+import logging
+import os
+import random
+import threading
+from urllib.parse import urlsplit, urlunsplit
+
+from metrics import metrics
+from queries import parse_limit
+
+logger = logging.getLogger(__name__)
+
+# Broken link beacon configuration
+BROKEN_LINKS_CONFIG = {
+    'enabled': os.environ.get('BROKEN_LINK_LOG', '1') != '0',
+    'sample_rate': float(os.environ.get('BROKEN_LINK_SAMPLE_RATE', '1.0')),  # 0..1
+    'flush_interval': float(os.environ.get('BROKEN_LINK_FLUSH_INTERVAL', '10')),  # seconds
+    'max_pending': int(os.environ.get('BROKEN_LINK_MAX_PENDING', '1000')),  # distinct pairs per process
+    'max_body': 4096,  # bytes
+    'max_length': 512,  # characters kept of path and referrer
+}
+
+_UPSERT_SQL = '''
+    INSERT INTO broken_links (path, referrer, hits, first_seen, last_seen) VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (path, referrer) DO UPDATE SET
+        hits = broken_links.hits + excluded.hits, last_seen = excluded.last_seen
+'''
+
+
+def init_broken_links(cursor):
+    """Create the broken link table"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS broken_links (
+            path TEXT NOT NULL,
+            referrer TEXT NOT NULL DEFAULT '',
+            hits INTEGER NOT NULL DEFAULT 0,
+            first_seen TIMESTAMP NOT NULL,
+            last_seen TIMESTAMP NOT NULL,
+            PRIMARY KEY (path, referrer)
+        ) WITHOUT ROWID
+    ''')
+
+
+def _clean_referrer(referrer, max_length):
+    """Referrer without query string or fragment (they may carry personal data)"""
+    if not isinstance(referrer, str) or not referrer:
+        return ''
+    try:
+        parts = urlsplit(referrer)
+    except ValueError:
+        return ''
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, '', ''))[:max_length]
+
+
+def parse_beacon(body, config=None):
+    """(path, referrer) of a beacon body, or None if it is not one"""
+    config = config or BROKEN_LINKS_CONFIG
+    if len(body) > config['max_body']:
+        return None
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    path = data.get('path')
+    if not isinstance(path, str) or not path.startswith('/'):
+        return None
+    return path[:config['max_length']], _clean_referrer(data.get('referrer'), config['max_length'])
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+class BrokenLinkLog:
+    """Per-process counts of 404 beacons, flushed to broken_links in batches"""
+
+    def __init__(self, config=None):
+        self.config = dict(BROKEN_LINKS_CONFIG, **(config or {}))
+        self.db = None
+        self._pending = {}  # (path, referrer) -> [hits, first_seen, last_seen]
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+
+    # -- lifecycle -------------------------------------------------------
+
+    def start(self, db):
+        """Start this process's flush thread (idempotent, fork-aware)"""
+        if self._pid == os.getpid() and self._thread is not None:
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None:
+                return
+            # Counts and the thread inherited across fork belong to the parent
+            self.db = db
+            self._pending = {}
+            self._pid = os.getpid()
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='broken-links', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5):
+        """Flush what is buffered and stop the flush thread"""
+        if self._thread is None or self._pid != os.getpid():
+            return
+        self._stopping.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    # -- recording -------------------------------------------------------
+
+    def record(self, body):
+        """Count one beacon body; returns what became of it (the metrics label)"""
+        if not self.config['enabled']:
+            result = 'disabled'
+        elif random.random() >= self.config['sample_rate']:
+            result = 'sampled_out'
+        else:
+            beacon = parse_beacon(body, self.config)
+            if beacon is None:
+                result = 'invalid'
+            else:
+                result = self._add(beacon)
+        metrics.inc('jlk_broken_link_beacons_total', (('result', result),))
+        return result
+
+    def _add(self, key):
+        now = _now()
+        with self._lock:
+            entry = self._pending.get(key)
+            if entry is not None:
+                entry[0] += 1
+                entry[2] = now
+            elif len(self._pending) >= self.config['max_pending']:
+                return 'dropped'
+            else:
+                self._pending[key] = [1, now, now]
+        return 'recorded'
+
+    # -- flush thread ----------------------------------------------------
+
+    def flush(self):
+        """Add the buffered counts to broken_links; returns the number of rows written"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        rows = [(path, referrer, hits, first_seen, last_seen)
+                for (path, referrer), (hits, first_seen, last_seen) in pending.items()]
+        try:
+            with self.db.transaction() as cursor:
+                cursor.executemany(_UPSERT_SQL, rows)
+        except self.db.Error as e:
+            logger.warning("Dropped %s broken link counts: %s", len(rows), e)
+            return 0
+        return len(rows)
+
+    def _run(self):
+        try:
+            while not self._stopping.is_set():
+                self._stopping.wait(self.config['flush_interval'])
+                self.flush()
+        finally:
+            self.db.close()
+
+
+def top_links(db, limit=None):
+    """Most hit (path, referrer) pairs, most hits first (raises queries.InvalidQuery)"""
+    rows = db.connection().execute(
+        'SELECT path, referrer, hits, first_seen, last_seen FROM broken_links '
+        'ORDER BY hits DESC, last_seen DESC LIMIT ?', (parse_limit(limit),)
+    ).fetchall()
+    return [{'path': row[0], 'referrer': row[1], 'hits': row[2], 'first_seen': row[3], 'last_seen': row[4]}
+            for row in rows]
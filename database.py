@@ -0,0 +1,217 @@
+"""
+JLK Transservice - SQLite connection layer
+
+Keeps one long-lived connection per thread (and per process, so gunicorn
+workers never share a handle inherited across fork) instead of calling
+sqlite3.connect() on every request. Each connection is opened in WAL mode
+with a busy timeout, so concurrent workers no longer serialize on the
+rollback journal or fail with "database is locked".
+
+The INSERT statements live here as module constants so sqlite3's
+per-connection statement cache prepares each of them only once.
+
+Database is also the storage interface the rest of the app codes against
+(connection, transaction, the quote/contact repository methods); the
+PostgreSQL backend in postgres.py implements the same interface, and
+open_database() picks one from DATABASE_URL / DATABASE_PATH.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Connection pragmas applied when a connection is opened
+DATABASE_CONFIG = {
+    'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+    'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', '5000')),  # milliseconds
+    'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', str(64 * 1024 * 1024))),  # bytes
+    'cache_size': int(os.environ.get('SQLITE_CACHE_SIZE', '-16000')),  # negative = KiB
+    'cached_statements': 256,
+}
+
+QUOTE_COLUMNS = (
+    'company_name', 'contact_name', 'email', 'phone', 'service_type',
+    'origin', 'destination', 'cargo_type', 'weight', 'dimensions',
+    'urgency', 'additional_services', 'description', 'attachment_hash'
+)
+
+CONTACT_COLUMNS = ('name', 'email', 'subject', 'message')
+
+INSERT_QUOTE_SQL = 'INSERT INTO quotes ({}) VALUES ({})'.format(
+    ', '.join(QUOTE_COLUMNS), ', '.join('?' * len(QUOTE_COLUMNS)))
+
+INSERT_CONTACT_SQL = 'INSERT INTO contacts ({}) VALUES ({})'.format(
+    ', '.join(CONTACT_COLUMNS), ', '.join('?' * len(CONTACT_COLUMNS)))
+
+INSERT_SQL = {
+    'quotes': INSERT_QUOTE_SQL,
+    'contacts': INSERT_CONTACT_SQL,
+}
+
+
+def quote_row(record):
+    """Order a quote record (dict keyed by column name) for INSERT_QUOTE_SQL"""
+    return tuple(record.get(column, '') for column in QUOTE_COLUMNS)
+
+
+def contact_row(record):
+    """Order a contact record (dict keyed by column name) for INSERT_CONTACT_SQL"""
+    return tuple(record.get(column, '') for column in CONTACT_COLUMNS)
+
+
+def chain_hooks(*hooks):
+    """Combine after_insert(cursor, row_id) hooks into one, skipping None"""
+    hooks = [hook for hook in hooks if hook is not None]
+    if not hooks:
+        return None
+    if len(hooks) == 1:
+        return hooks[0]
+
+    def run_all(cursor, row_id):
+        for hook in hooks:
+            hook(cursor, row_id)
+    return run_all
+
+
+def open_database(target, config=None):
+    """Database for a postgresql:// URL or an SQLite file path"""
+    if target.startswith(('postgres://', 'postgresql://')):
+        from postgres import PostgresDatabase  # psycopg is only needed for this backend
+        return PostgresDatabase(target, config)
+    return Database(target, config)
+
+
+class Database:
+    """Per-thread, per-process SQLite connections with tuned pragmas"""
+
+    dialect = 'sqlite'
+    Error = sqlite3.Error
+
+    def __init__(self, path, config=None):
+        self.path = path
+        self.config = dict(DATABASE_CONFIG, **(config or {}))
+        self._local = threading.local()
+
+    def _open(self):
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.config['busy_timeout'] / 1000.0,
+            isolation_level=None,  # transactions are started explicitly
+            cached_statements=self.config['cached_statements'],
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute(f"PRAGMA busy_timeout = {int(self.config['busy_timeout'])}")
+        if self.config['journal_mode']:
+            conn.execute(f"PRAGMA journal_mode = {self.config['journal_mode']}")
+        if self.config['synchronous']:
+            conn.execute(f"PRAGMA synchronous = {self.config['synchronous']}")
+        conn.execute(f"PRAGMA mmap_size = {int(self.config['mmap_size'])}")
+        conn.execute(f"PRAGMA cache_size = {int(self.config['cache_size'])}")
+        return conn
+
+    def connection(self):
+        """Return this thread's connection, opening it on first use"""
+        local = self._local
+        conn = getattr(local, 'conn', None)
+        if conn is None or local.pid != os.getpid():
+            # A connection inherited across fork must not be used by the child
+            conn = self._open()
+            local.conn = conn
+            local.pid = os.getpid()
+        return conn
+
+    def close(self):
+        """Close this thread's connection"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            conn.close()
+        self._local.conn = None
+
+    def release(self):
+        """End-of-request hook; SQLite keeps the thread's connection open"""
+
+    def close_pool(self):
+        """Close every connection this process holds (SQLite: this thread's)"""
+        self.close()
+
+    @contextmanager
+    def transaction(self):
+        """Run a write transaction; takes the write lock up front (BEGIN IMMEDIATE)"""
+        conn = self.connection()
+        cursor = conn.cursor()
+        began = time.perf_counter()
+        cursor.execute('BEGIN IMMEDIATE')
+        metrics.observe('jlk_db_lock_wait_seconds', time.perf_counter() - began)
+        try:
+            yield cursor
+        except BaseException:
+            conn.rollback()
+            raise
+        else:
+            conn.commit()
+        finally:
+            cursor.close()
+
+    def iter_batches(self, sql, params=(), size=1000):
+        """Run a query and yield its rows as lists of plain tuples, `size` rows at a time"""
+        cursor = self.connection().cursor()
+        cursor.row_factory = None  # plain tuples, not sqlite3.Row
+        try:
+            cursor.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(size)
+                if not rows:
+                    return
+                yield rows
+        finally:
+            cursor.close()
+
+    # -- repository ------------------------------------------------------
+
+    def insert_quote(self, cursor, record):
+        """Insert a quote row using the caller's transaction and return its id"""
+        cursor.execute(INSERT_QUOTE_SQL, quote_row(record))
+        return cursor.lastrowid
+
+    def insert_contact(self, cursor, record):
+        """Insert a contact row using the caller's transaction and return its id"""
+        cursor.execute(INSERT_CONTACT_SQL, contact_row(record))
+        return cursor.lastrowid
+
+    def insert_many(self, cursor, table, rows):
+        """executemany() rows (tuples in INSERT_SQL[table] order) and return their ids in order"""
+        cursor.execute('SELECT seq FROM sqlite_sequence WHERE name = ?', (table,))
+        found = cursor.fetchone()
+        start = found[0] if found else 0
+        cursor.executemany(INSERT_SQL[table], rows)
+        # The caller holds the write lock and the tables use AUTOINCREMENT, so the new
+        # rows are exactly the ids above the previous sequence value, in insert order
+        cursor.execute(f'SELECT id FROM {table} WHERE id > ? ORDER BY id', (start,))
+        ids = [result[0] for result in cursor.fetchall()]
+        if len(ids) != len(rows):
+            raise RuntimeError(f'Group insert on {table} assigned {len(ids)} ids for {len(rows)} rows')
+        return ids
+
+    def save_quote(self, record, after_insert=None):
+        """Store a quote; after_insert(cursor, quote_id) runs in the same transaction"""
+        with self.transaction() as cursor:
+            quote_id = self.insert_quote(cursor, record)
+            if after_insert is not None:
+                after_insert(cursor, quote_id)
+        return quote_id
+
+    def save_contact(self, record, after_insert=None):
+        """Store a contact message; after_insert(cursor, contact_id) runs in the same transaction"""
+        with self.transaction() as cursor:
+            contact_id = self.insert_contact(cursor, record)
+            if after_insert is not None:
+                after_insert(cursor, contact_id)
+        return contact_id
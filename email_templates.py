@@ -0,0 +1,388 @@
+"""
+JLK Transservice - Email templates
+
+Notification emails are rendered from precompiled format plans: each
+template is parsed once at import time into literal chunks and field slots,
+and the blocks that never change (stylesheet, page head, header, footer)
+are folded into the literals up front. A render is then one pass that
+HTML-escapes the per-quote values and joins the pieces.
+
+Nothing here touches the Flask request, so background senders can render
+emails too; the public base URL for image links is passed in explicitly.
+"""
+
+import datetime
+import html
+import json
+import re
+from string import Formatter
+
+from markupsafe import Markup, escape
+
+# Service type mapping
+SERVICE_TYPES = {
+    'export': '📤 บริการส่งออก',
+    'import': '📥 บริการนำเข้า',
+    'customs': '🏛️ พิธีการศุลกากร',
+    'domestic': '🚛 ขนส่งภายในประเทศ',
+    'consulting': '💼 ที่ปรึกษาโลจิสติกส์',
+    'other': '🔄 อื่นๆ'
+}
+
+# Urgency mapping and classes
+URGENCY_TYPES = {
+    'standard': 'ปกติ (7-14 วัน)',
+    'urgent': 'เร่งด่วน (3-7 วัน)',
+    'express': 'ด่วนพิเศษ (1-3 วัน)',
+    'same-day': 'ภายในวันเดียว'
+}
+
+URGENCY_CLASSES = {
+    'express': 'important',
+    'same-day': 'important',
+    'urgent': 'urgent'
+}
+
+NOT_SPECIFIED = 'ไม่ระบุ'
+
+EMAIL_STYLE = Markup("""
+            body { font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; line-height: 1.6; color: #333; margin: 0; padding: 20px; background-color: #f5f5f5; }
+            .container { max-width: 600px; margin: 0 auto; background: white; border-radius: 10px; box-shadow: 0 4px 6px rgba(0,0,0,0.1); overflow: hidden; }
+            .header { background: linear-gradient(135deg, #1e3a8a, #3b82f6); color: white; padding: 30px; text-align: center; }
+            .header h1 { margin: 0; font-size: 24px; }
+            .header p { margin: 10px 0 0 0; opacity: 0.9; }
+            .content { padding: 30px; }
+            .section { margin-bottom: 25px; }
+            .section h2 { color: #1e3a8a; border-bottom: 2px solid #3b82f6; padding-bottom: 5px; margin-bottom: 15px; font-size: 18px; }
+            .field { margin-bottom: 12px; }
+            .field-label { font-weight: bold; color: #555; margin-bottom: 5px; }
+            .field-value { background: #f8f9ff; padding: 8px 12px; border-radius: 5px; border-left: 3px solid #3b82f6; }
+            .grid { display: grid; grid-template-columns: 1fr 1fr; gap: 15px; }
+            .image-section { text-align: center; margin: 20px 0; }
+            .image-section img { max-width: 100%; height: auto; border-radius: 8px; box-shadow: 0 2px 8px rgba(0,0,0,0.1); }
+            .footer { background: #f1f5f9; padding: 20px; text-align: center; color: #666; font-size: 14px; }
+            .urgent { background: #fef3c7; border-left-color: #f59e0b; }
+            .important { background: #fecaca; border-left-color: #ef4444; }
+            @media (max-width: 600px) {
+                .grid { grid-template-columns: 1fr; }
+                .container { margin: 10px; }
+                .header, .content { padding: 20px; }
+            }
+""")
+
+
+class TemplatePlan:
+    """A template parsed once into literal chunks and {field} slots
+
+    Fields named in `static` are substituted at compile time and folded into
+    the surrounding literals. Rendering copies the chunk list, drops the
+    escaped field values into their slots and joins it, which avoids
+    re-parsing the template (str.format) on every call. Values are
+    HTML-escaped unless they are already Markup (a rendered sub-section).
+    """
+
+    __slots__ = ('fields', '_chunks', '_slots')
+
+    def __init__(self, source, static=None):
+        static = static or {}
+        chunks = []
+        slots = []
+        fields = []
+        for literal, field, _, _ in Formatter().parse(source):
+            if literal:
+                _append_literal(chunks, slots, literal)
+            if field is None:
+                continue
+            if field in static:
+                _append_literal(chunks, slots, str(escape(static[field])))
+            else:
+                slots.append(len(chunks))
+                chunks.append('')
+                fields.append(field)
+        self.fields = tuple(fields)
+        self._chunks = chunks
+        self._slots = tuple(zip(slots, fields))
+
+    def render(self, values):
+        """Render with the given field values; returns Markup"""
+        out = self._chunks[:]
+        for index, field in self._slots:
+            out[index] = _escape(values[field])
+        return Markup(''.join(out))
+
+
+def _append_literal(chunks, slots, text):
+    """Append literal text, merging it into the previous chunk when that is a literal"""
+    if chunks and (not slots or slots[-1] != len(chunks) - 1):
+        chunks[-1] += text
+    else:
+        chunks.append(text)
+
+
+_NEEDS_ESCAPE = re.compile('[&<>"\']')
+
+
+def _escape(value):
+    """HTML-escape a field value; Markup (already rendered HTML) passes through"""
+    if isinstance(value, Markup):
+        return value
+    value = str(value)
+    # Most form values contain nothing to escape; skip the replace() chain for them
+    return html.escape(value) if _NEEDS_ESCAPE.search(value) else value
+
+
+# Blocks shared by every email, rendered once
+EMAIL_HEAD = TemplatePlan("""
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <meta charset="UTF-8">
+        <style>{style}        </style>
+    </head>
+    <body>
+        <div class="container">
+""", static={'style': EMAIL_STYLE}).render({})
+
+EMAIL_FOOTER = Markup("""
+            <div class="footer">
+                <p><strong>JLK Transservice</strong> - บริการโลจิสติกส์ นำเข้า-ส่งออก และพิธีการทางศุลกากร</p>
+                <p>📧 jlktransservice@gmail.com | 📱 ติดต่อกลับภายใน 24 ชั่วโมง</p>
+""")
+
+_HEADER = TemplatePlan("""
+            <div class="header">
+                <h1>{title}</h1>
+                <p>JLK Transservice - บริการโลจิสติกส์มืออาชีพ</p>
+            </div>
+""")
+
+
+def email_header(title):
+    """Header block for a given title"""
+    return _HEADER.render({'title': title})
+
+
+# Per-quote sections, shared by single notifications and digests
+_QUOTE_BODY_SOURCE = """
+                <div class="section">
+                    <h2>📋 ข้อมูลผู้ติดต่อ</h2>
+                    <div class="grid">
+                        <div class="field">
+                            <div class="field-label">🏢 ชื่อบริษัท</div>
+                            <div class="field-value">{company_name}</div>
+                        </div>
+                        <div class="field">
+                            <div class="field-label">👤 ชื่อผู้ติดต่อ</div>
+                            <div class="field-value">{contact_name}</div>
+                        </div>
+                        <div class="field">
+                            <div class="field-label">✉️ อีเมล</div>
+                            <div class="field-value"><a href="mailto:{email}">{email}</a></div>
+                        </div>
+                        <div class="field">
+                            <div class="field-label">📞 เบอร์โทรศัพท์</div>
+                            <div class="field-value"><a href="tel:{phone}">{phone}</a></div>
+                        </div>
+                    </div>
+                </div>
+
+                <div class="section">
+                    <h2>🚚 ข้อมูลบริการ</h2>
+                    <div class="grid">
+                        <div class="field">
+                            <div class="field-label">🎯 ประเภทบริการ</div>
+                            <div class="field-value">{service_type_text}</div>
+                        </div>
+                        <div class="field">
+                            <div class="field-label">⚡ ความเร่งด่วน</div>
+                            <div class="field-value {urgency_class}">{urgency_text}</div>
+                        </div>
+                        <div class="field">
+                            <div class="field-label">📍 จุดต้นทาง</div>
+                            <div class="field-value">{origin}</div>
+                        </div>
+                        <div class="field">
+                            <div class="field-label">📍 จุดปลายทาง</div>
+                            <div class="field-value">{destination}</div>
+                        </div>
+                    </div>
+                </div>
+
+                <div class="section">
+                    <h2>📦 ข้อมูลสินค้า</h2>
+                    <div class="grid">
+                        <div class="field">
+                            <div class="field-label">📋 ประเภทสินค้า</div>
+                            <div class="field-value">{cargo_type}</div>
+                        </div>
+                        <div class="field">
+                            <div class="field-label">⚖️ น้ำหนัก</div>
+                            <div class="field-value">{weight}</div>
+                        </div>
+                    </div>
+                    <div class="field">
+                        <div class="field-label">📏 ขนาด</div>
+                        <div class="field-value">{dimensions}</div>
+                    </div>
+                </div>
+{additional_services_section}{image_section}{description_section}"""
+
+QUOTE_BODY = TemplatePlan(_QUOTE_BODY_SOURCE)
+
+_ADDITIONAL_SERVICES_SECTION = TemplatePlan("""
+                <div class="section">
+                    <h2>➕ บริการเพิ่มเติม</h2>
+                    <div class="field">
+                        <div class="field-value"><ul>{items}</ul></div>
+                    </div>
+                </div>
+""")
+
+_IMAGE_SECTION = TemplatePlan("""
+                <div class="section">
+                    <h2>🖼️ รูปภาพประกอบ</h2>
+                    <div class="image-section">
+                        <img src="{image_src}" alt="รูปภาพประกอบคำขอใบเสนอราคา" />
+                        <p style="margin-top: 10px; color: #666; font-size: 14px;">
+                            <a href="{image_href}" target="_blank">ดูรูปภาพขนาดเต็ม</a>
+                        </p>
+                    </div>
+                </div>
+""")
+
+_DESCRIPTION_SECTION = TemplatePlan("""
+                <div class="section">
+                    <h2>💬 รายละเอียดเพิ่มเติม</h2>
+                    <div class="field">
+                        <div class="field-value">{description}</div>
+                    </div>
+                </div>
+""")
+
+# The quote body is spliced into the source so a notification renders in one pass
+QUOTE_EMAIL = TemplatePlan("""{head}{header}
+            <div class="content">
+""" + _QUOTE_BODY_SOURCE + """
+            </div>
+{footer}                <p><em>วันที่ส่งคำขอ: {date_time}</em></p>
+            </div>
+        </div>
+    </body>
+    </html>
+""", static={
+    'head': EMAIL_HEAD,
+    'header': email_header('🚛 คำขอใบเสนอราคาใหม่'),
+    'footer': EMAIL_FOOTER,
+})
+
+
+def _parse_services(value):
+    """additionalServices arrives as a JSON string (form posts) or a list (JSON posts)"""
+    if not value:
+        return []
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return [value]
+    return list(value) if isinstance(value, (list, tuple)) else [value]
+
+
+def quote_body_values(data, image_url=None, base_url='', thumbnail_url=None):
+    """Map raw quote form data to the values of the QUOTE_BODY plan"""
+    service_type = data.get('serviceType', '')
+    urgency = data.get('urgency', '')
+
+    services = _parse_services(data.get('additionalServices'))
+    additional_services_section = ''
+    if services:
+        items = Markup(''.join(['<li>' + _escape(service) + '</li>' for service in services]))
+        additional_services_section = _ADDITIONAL_SERVICES_SECTION.render({'items': items})
+
+    image_section = ''
+    if image_url:
+        base = base_url.rstrip('/')
+        image_section = _IMAGE_SECTION.render({
+            'image_src': f"{base}{thumbnail_url or image_url}",
+            'image_href': f"{base}{image_url}",
+        })
+
+    description_section = ''
+    if data.get('description'):
+        description = Markup('<br>'.join([_escape(line) for line in data['description'].split('\n')]))
+        description_section = _DESCRIPTION_SECTION.render({'description': description})
+
+    return {
+        'company_name': data.get('companyName', '-'),
+        'contact_name': data.get('contactName', '-'),
+        'email': data.get('email', '-'),
+        'phone': data.get('phone', '-'),
+        'service_type_text': SERVICE_TYPES.get(service_type, service_type or '-'),
+        'urgency_text': URGENCY_TYPES.get(urgency, urgency or NOT_SPECIFIED),
+        'urgency_class': URGENCY_CLASSES.get(urgency, ''),
+        'origin': data.get('origin', NOT_SPECIFIED),
+        'destination': data.get('destination', NOT_SPECIFIED),
+        'cargo_type': data.get('cargoType', NOT_SPECIFIED),
+        'weight': f"{data['weight']} กก." if data.get('weight') else NOT_SPECIFIED,
+        'dimensions': f"{data['dimensions']} ซม." if data.get('dimensions') else NOT_SPECIFIED,
+        'additional_services_section': additional_services_section,
+        'image_section': image_section,
+        'description_section': description_section,
+    }
+
+
+def render_quote_email(data, image_url=None, base_url='', now=None, thumbnail_url=None):
+    """Render the HTML notification for one quote (no request context needed)"""
+    now = now or datetime.datetime.now()
+    values = quote_body_values(data, image_url, base_url, thumbnail_url)
+    values['date_time'] = now.strftime('%d/%m/%Y %H:%M:%S')
+    return str(QUOTE_EMAIL.render(values))
+
+
+# One quote inside a digest: a heading, then the same sections as a notification
+_DIGEST_ITEM = TemplatePlan("""
+                <div class="section">
+                    <h2>🚛 {company_name} <span style="font-weight: normal; font-size: 14px; color: #666;">{date_time}</span></h2>
+                </div>
+""" + _QUOTE_BODY_SOURCE + """
+                <hr style="border: none; border-top: 2px dashed #cbd5e1; margin: 30px 0;">
+""")
+
+_DIGEST_EMAIL = TemplatePlan("""{head}{header}
+            <div class="content">
+                <p>คำขอใบเสนอราคา {count} รายการ (ตามลำดับเวลาที่ส่ง)</p>
+{items}
+            </div>
+{footer}                <p><em>สรุป ณ วันที่: {date_time}</em></p>
+            </div>
+        </div>
+    </body>
+    </html>
+""", static={
+    'head': EMAIL_HEAD,
+    'header': email_header('📋 สรุปคำขอใบเสนอราคา'),
+    'footer': EMAIL_FOOTER,
+})
+
+
+def render_quote_section(data, image_url=None, base_url='', now=None, thumbnail_url=None):
+    """Render one quote as a digest item (kept in the outbox until the digest is built)"""
+    now = now or datetime.datetime.now()
+    values = quote_body_values(data, image_url, base_url, thumbnail_url)
+    values['date_time'] = now.strftime('%d/%m/%Y %H:%M')
+    return str(_DIGEST_ITEM.render(values))
+
+
+def render_digest_email(sections, now=None):
+    """Render a digest from quote sections made by render_quote_section"""
+    now = now or datetime.datetime.now()
+    return str(_DIGEST_EMAIL.render({
+        'count': len(sections),
+        'items': Markup(''.join(sections)),
+        'date_time': now.strftime('%d/%m/%Y %H:%M:%S'),
+    }))
+
+
+def digest_subject(count):
+    """Subject line for a digest of count quotes"""
+    return f"สรุปคำขอใบเสนอราคา {count} รายการ | JLK Transservice"
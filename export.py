@@ -0,0 +1,321 @@
+"""
+JLK Transservice - Bulk export of quotes and contacts
+
+Streams a table (optionally limited to a created_at range) to CSV, JSONL
+or Parquet without loading it: rows are read from one database cursor in
+`batch_size` batches, each batch is encoded and compressed and handed on
+as bytes, so memory stays flat however many rows there are. Parquet
+buffers at most one row group of `parquet_row_group` rows.
+
+additional_services (a JSON list) becomes one boolean additional_<name>
+column per service; the set of services is found up front from the
+distinct additional_services values of the same rows (a handful of
+combinations), so the columns are known before the first row is written.
+
+CSV and JSONL can be wrapped in gzip or zstd (zstd needs the `zstandard`
+package); Parquet compresses its columns internally with the same codec
+names. Parquet needs `pyarrow`. Both are imported on the first export that
+uses them, so they cost the web workers nothing until then.
+"""
+
+import csv
+import io
+import json
+import logging
+import os
+import re
+import zlib
+
+from queries import LIST_COLUMNS, InvalidQuery, parse_timestamp
+
+# Optional modules, imported on first use by _load_optional()
+pyarrow = None
+zstandard = None
+_optional_loaded = False
+
+logger = logging.getLogger(__name__)
+
+# Export configuration
+EXPORT_CONFIG = {
+    'batch_size': int(os.environ.get('EXPORT_BATCH_SIZE', '5000')),  # rows per fetch and output chunk
+    'parquet_row_group': int(os.environ.get('EXPORT_PARQUET_ROW_GROUP', '100000')),  # rows
+    'gzip_level': 6,
+    'zstd_level': 3,
+}
+
+FORMATS = ('csv', 'jsonl', 'parquet')
+COMPRESSIONS = ('none', 'gzip', 'zstd')
+
+MEDIA_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+    'gzip': 'application/gzip',
+    'zstd': 'application/zstd',
+}
+
+EXTENSIONS = {'gzip': '.gz', 'zstd': '.zst'}
+
+# Columns that are not plain text in Parquet
+_INTEGER_COLUMNS = {'id'}
+_TIMESTAMP_COLUMNS = {'created_at'}
+
+_SERVICE_NAME = re.compile(r'[^0-9a-zA-Z]+')
+
+# Distinct additional_services values remembered while flattening
+_FLAG_CACHE_SIZE = 4096
+
+
+class InvalidExport(ValueError):
+    """The export request cannot be run"""
+
+
+def _load_optional():
+    """Import pyarrow and zstandard if they are installed (once per process)"""
+    global pyarrow, zstandard, _optional_loaded
+    if _optional_loaded:
+        return
+    try:
+        import pyarrow as pyarrow_module
+        import pyarrow.parquet
+        pyarrow = pyarrow_module
+    except ImportError:  # optional; Parquet export is then unavailable
+        pass
+    try:
+        import zstandard as zstandard_module
+        zstandard = zstandard_module
+    except ImportError:  # optional; zstd compression is then unavailable
+        pass
+    _optional_loaded = True
+
+
+def service_column(service):
+    """Column name for one additional service"""
+    return 'additional_' + (_SERVICE_NAME.sub('_', str(service)).strip('_').lower() or 'other')
+
+
+def _filters(created_from=None, created_to=None):
+    where, params = [], []
+    try:
+        if created_from:
+            where.append('created_at >= ?')
+            params.append(parse_timestamp(created_from))
+        if created_to:
+            where.append('created_at < ?')
+            params.append(parse_timestamp(created_to))
+    except InvalidQuery as e:
+        raise InvalidExport(str(e))
+    return (' WHERE ' + ' AND '.join(where) if where else ''), params
+
+
+def _parse_services(raw):
+    try:
+        chosen = json.loads(raw) if raw else []
+    except ValueError:
+        return []
+    return chosen if isinstance(chosen, list) else []
+
+
+def find_services(db, where, params):
+    """Column names of the additional services among the exported quotes, in name order"""
+    services = set()
+    for batch in db.iter_batches(f'SELECT DISTINCT additional_services FROM quotes{where}', params,
+                                 EXPORT_CONFIG['batch_size']):
+        for (raw,) in batch:
+            services.update(service_column(service) for service in _parse_services(raw) if service is not None)
+    return sorted(services)
+
+
+class _Rows:
+    """The exported columns and a generator of row batches (lists of tuples)"""
+
+    def __init__(self, db, table, created_from=None, created_to=None):
+        if table not in LIST_COLUMNS:
+            raise InvalidExport(f'unknown table {table!r}')
+        where, params = _filters(created_from, created_to)
+        columns = list(LIST_COLUMNS[table])
+        self.services = []
+        self._services_at = None
+        if 'additional_services' in columns:
+            self._services_at = columns.index('additional_services')
+            self.services = find_services(db, where, params)
+            columns.pop(self._services_at)
+        self.columns = columns + self.services
+        self._sql = (f"SELECT {', '.join(LIST_COLUMNS[table])} FROM {table}{where} "
+                     'ORDER BY created_at, id')
+        self._params = params
+        self._db = db
+        self._flags = {}
+
+    def _service_flags(self, raw):
+        chosen = {service_column(service) for service in _parse_services(raw)}
+        return tuple(service in chosen for service in self.services)
+
+    def _flatten(self, rows):
+        # Most quotes share a handful of service combinations: parse each distinct value once
+        at = self._services_at
+        flags_of = self._flags
+        flattened = []
+        for row in rows:
+            raw = row[at]
+            flags = flags_of.get(raw)
+            if flags is None:
+                if len(flags_of) >= _FLAG_CACHE_SIZE:
+                    flags_of.clear()
+                flags = flags_of[raw] = self._service_flags(raw)
+            flattened.append(row[:at] + row[at + 1:] + flags)
+        return flattened
+
+    def batches(self):
+        for rows in self._db.iter_batches(self._sql, self._params, EXPORT_CONFIG['batch_size']):
+            yield rows if self._services_at is None else self._flatten(rows)
+
+
+# -- encoders -------------------------------------------------------------
+
+def _encode_csv(rows):
+    columns = rows.columns
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for batch in rows.batches():
+        writer.writerows(batch)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def _encode_jsonl(rows):
+    columns = rows.columns
+    for batch in rows.batches():
+        yield ''.join(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + '\n'
+                      for row in batch).encode('utf-8')
+
+
+class _Drain:
+    """Write-only file that hands what was written to the caller in pieces"""
+
+    def __init__(self):
+        self.chunks = []
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _parquet_schema(columns, services):
+    fields = []
+    for column in columns:
+        if column in _INTEGER_COLUMNS:
+            kind = pyarrow.int64()
+        elif column in _TIMESTAMP_COLUMNS:
+            kind = pyarrow.timestamp('s')
+        elif column in services:
+            kind = pyarrow.bool_()
+        else:
+            kind = pyarrow.string()
+        fields.append(pyarrow.field(column, kind))
+    return pyarrow.schema(fields)
+
+
+def _record_batch(schema, rows):
+    arrays = []
+    for index, field in enumerate(schema):
+        values = [row[index] for row in rows]
+        if pyarrow.types.is_timestamp(field.type):
+            arrays.append(pyarrow.array(values, pyarrow.string()).cast(field.type))
+        else:
+            arrays.append(pyarrow.array(values, field.type))
+    return pyarrow.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def _encode_parquet(rows, compression):
+    # Each batch is converted to Arrow columns straight away, so a row group
+    # waiting to be written costs its compact columnar size, not Python tuples
+    schema = _parquet_schema(rows.columns, set(rows.services))
+    sink = _Drain()
+    writer = pyarrow.parquet.ParquetWriter(sink, schema, compression=compression or 'none')
+    pending, pending_rows = [], 0
+    try:
+        for batch in rows.batches():
+            pending.append(_record_batch(schema, batch))
+            pending_rows += len(batch)
+            if pending_rows >= EXPORT_CONFIG['parquet_row_group']:
+                writer.write_table(pyarrow.Table.from_batches(pending), row_group_size=pending_rows)
+                pending, pending_rows = [], 0
+                yield sink.take()
+        if pending:
+            writer.write_table(pyarrow.Table.from_batches(pending), row_group_size=pending_rows)
+    finally:
+        writer.close()
+    yield sink.take()
+
+
+def _compress(chunks, compression):
+    """Compress a stream of byte chunks with gzip or zstd"""
+    if compression == 'gzip':
+        compressor = zlib.compressobj(EXPORT_CONFIG['gzip_level'], zlib.DEFLATED, 31)  # 31: gzip container
+        finish = compressor.flush
+    else:
+        compressor = zstandard.ZstdCompressor(level=EXPORT_CONFIG['zstd_level']).compressobj()
+        finish = compressor.flush
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield finish()
+
+
+# -- public API -----------------------------------------------------------
+
+def check_options(fmt, compression):
+    """Validate format and compression; returns compression with 'none' as None"""
+    _load_optional()
+    if fmt not in FORMATS:
+        raise InvalidExport(f'unknown format {fmt!r}')
+    compression = None if compression in (None, '', 'none') else compression
+    if compression is not None and compression not in COMPRESSIONS:
+        raise InvalidExport(f'unknown compression {compression!r}')
+    if fmt == 'parquet' and pyarrow is None:
+        raise InvalidExport('parquet export needs the pyarrow package')
+    if compression == 'zstd' and zstandard is None and fmt != 'parquet':
+        raise InvalidExport('zstd compression needs the zstandard package')
+    return compression
+
+
+def export_stream(db, table, fmt='csv', compression=None, created_from=None, created_to=None):
+    """Validate the request, then return a generator of the exported file's bytes"""
+    compression = check_options(fmt, compression)
+    rows = _Rows(db, table, created_from, created_to)
+    if fmt == 'parquet':
+        return _encode_parquet(rows, compression)
+    chunks = _encode_csv(rows) if fmt == 'csv' else _encode_jsonl(rows)
+    return _compress(chunks, compression) if compression else chunks
+
+
+def export_filename(table, fmt, compression=None):
+    """Download name, e.g. quotes.csv.gz (Parquet compresses internally)"""
+    compression = None if compression in (None, '', 'none') else compression
+    suffix = EXTENSIONS.get(compression, '') if fmt != 'parquet' else ''
+    return f'{table}.{fmt}{suffix}'
+
+
+def export_media_type(fmt, compression=None):
+    """Content-Type of an export"""
+    if fmt != 'parquet' and compression in EXTENSIONS:
+        return MEDIA_TYPES[compression]
+    return MEDIA_TYPES[fmt]
@@ -0,0 +1,76 @@
+"""
+JLK Transservice - gunicorn settings
+
+gunicorn reads this file from the working directory, so
+
+  gunicorn --workers 4 --bind 0.0.0.0:8000
+
+serves app:create_app(). With preload (the default) the master imports
+the app and runs its one-time startup work (schema migrations, asset
+manifest, page cache) before forking. A new worker, at boot or when one
+is recycled, is then a fork of a ready process: it only has to open its
+own database connection on its first request. Objects created during
+startup are frozen out of the garbage collector so that collections in
+the workers do not touch, and copy, the pages they share with the master.
+
+Every worker starts its email senders (which pick up mail left in the
+outbox by a restart), logs how long it took from fork to ready, and
+writes out its buffered broken link counts and queued log records when
+it exits. Its metrics move into the retired totals then, so recycled
+workers leave no per-worker files behind (see metrics.py).
+GUNICORN_PRELOAD=0 makes each worker import and start the app itself
+(slower boot, no memory shared with the master).
+"""
+
+import gc
+import os
+import time
+
+wsgi_app = 'app:create_app()'
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') != '0'
+
+# Recycle workers after this many requests (0 = never); jitter spreads restarts out
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', '0'))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', '0'))
+
+
+def on_starting(server):
+    # Totals of a previous run's workers would otherwise be added to this one's
+    from metrics import metrics
+    metrics.clear_directory()
+    # The master serves no requests; with preload its startup work would
+    # otherwise record metrics and flush a worker file no exit hook retires
+    metrics.disable_process()
+    if not server.cfg.preload_app:
+        return
+    # Also covers `gunicorn app:app`, which does not go through create_app()
+    import app
+    app.create_app()
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    worker.forked_at = time.perf_counter()
+
+
+def post_worker_init(worker):
+    import app
+    app.start_outbox()
+    worker.log.info("Worker %s ready in %.1f ms", worker.pid,
+                    (time.perf_counter() - worker.forked_at) * 1000)
+
+
+def worker_exit(server, worker):
+    import app
+    import app_logging
+    from metrics import metrics
+    app.outbox.stop()
+    app.broken_link_log.stop()
+    app_logging.shutdown()
+    metrics.retire()
+
+
+def child_exit(server, worker):
+    # In the master: a worker killed before worker_exit ran still has its file
+    from metrics import metrics
+    metrics.retire(worker.pid)
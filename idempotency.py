@@ -0,0 +1,133 @@
+"""
+JLK Transservice - Duplicate submission suppression
+
+A double-clicked or retried form posts the same payload again. Each
+stored submission records a key (a hash of its fields and attachment, or
+the client's Idempotency-Key header) in `submission_keys`, in the same
+transaction as the row itself. A repeat within `window` seconds is
+answered with the original id after one indexed read, without inserting,
+storing the image again or sending another email.
+
+Two identical posts racing each other both miss the lookup; the second
+one's key insert finds the first one's key, which rolls its transaction
+back (DuplicateSubmission, carrying the first one's id and response
+fields, read in that same transaction) and it is answered with those.
+
+The response fields include whether the notification email went out, so
+a retry gets the same message as the original: known before the insert
+when the email is queued, and written afterwards by update_response()
+when it was sent inline and failed.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import time
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Idempotency configuration
+IDEMPOTENCY_CONFIG = {
+    'enabled': os.environ.get('IDEMPOTENCY', '1') != '0',
+    'window': float(os.environ.get('IDEMPOTENCY_WINDOW', '600')),  # seconds
+    'prune_interval': 300,  # seconds between deletes of expired keys (per process)
+    'max_header_length': 255,
+}
+
+_next_prune = 0.0
+
+
+class DuplicateSubmission(Exception):
+    """Another request stored the same submission first"""
+
+    def __init__(self, key, record_id, response):
+        super().__init__(key)
+        self.key = key
+        self.record_id = record_id
+        self.response = response
+
+
+def init_idempotency(cursor):
+    """Create the submission key table"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS submission_keys (
+            key TEXT PRIMARY KEY,
+            record_id INTEGER NOT NULL,
+            response TEXT,
+            created_at REAL NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_submission_keys_created
+        ON submission_keys (created_at)
+    ''')
+
+
+def submission_key(kind, data, attachment_digest=None, header_key=None):
+    """Key of a submission: the Idempotency-Key header if sent, else a hash of its content"""
+    if not IDEMPOTENCY_CONFIG['enabled']:
+        return None
+    if header_key:
+        material = 'header:' + header_key[:IDEMPOTENCY_CONFIG['max_header_length']]
+    else:
+        material = json.dumps([data, attachment_digest], sort_keys=True, ensure_ascii=False, default=str)
+    return f'{kind}:' + hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+def find_duplicate(db, key):
+    """(record_id, response fields) stored under key within the window, or None"""
+    if key is None:
+        return None
+    row = db.connection().execute(
+        'SELECT record_id, response FROM submission_keys WHERE key = ? AND created_at > ?',
+        (key, time.time() - IDEMPOTENCY_CONFIG['window'])
+    ).fetchone()
+    if row is None:
+        return None
+    metrics.inc('jlk_duplicate_submissions_total', (('kind', key.split(':', 1)[0]),))
+    return row['record_id'], json.loads(row['response'] or '{}')
+
+
+def remember_hook(key, response=None):
+    """after_insert hook recording key for the new row, or None if there is no key"""
+    if key is None:
+        return None
+    response_json = json.dumps(response or {}, ensure_ascii=False)
+
+    def remember(cursor, record_id):
+        global _next_prune
+        now = time.time()
+        cutoff = now - IDEMPOTENCY_CONFIG['window']
+        # An expired key is taken over; a live one means we lost a race to a duplicate
+        while True:
+            cursor.execute('''
+                INSERT INTO submission_keys (key, record_id, response, created_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET
+                    record_id = excluded.record_id, response = excluded.response, created_at = excluded.created_at
+                WHERE submission_keys.created_at <= ?
+            ''', (key, record_id, response_json, now, cutoff))
+            if cursor.rowcount:
+                break
+            # Read the winner now: a later lookup could already count its key as expired
+            cursor.execute('SELECT record_id, response FROM submission_keys WHERE key = ?', (key,))
+            row = cursor.fetchone()
+            if row is not None:
+                metrics.inc('jlk_duplicate_submissions_total', (('kind', key.split(':', 1)[0]),))
+                raise DuplicateSubmission(key, row[0], json.loads(row[1] or '{}'))
+            # Pruned in between: the key is free again
+        if now >= _next_prune:
+            _next_prune = now + IDEMPOTENCY_CONFIG['prune_interval']
+            cursor.execute('DELETE FROM submission_keys WHERE created_at <= ?', (cutoff,))
+    return remember
+
+
+def update_response(db, key, record_id, response):
+    """Replace the response fields stored under key for record_id (e.g. after the email failed)"""
+    if key is None:
+        return
+    with db.transaction() as cursor:
+        cursor.execute('UPDATE submission_keys SET response = ? WHERE key = ? AND record_id = ?',
+                       (json.dumps(response, ensure_ascii=False), key, record_id))
@@ -0,0 +1,458 @@
+"""
+JLK Transservice - Outbound email queue
+
+Quote notifications are written to an `email_outbox` table in the same
+SQLite database (and the same transaction) as the quote itself, so
+`/api/quote` can return as soon as both rows are committed. A small pool of
+background sender threads drains the outbox over a few long-lived,
+authenticated SMTP connections that are reused between messages.
+
+Failed sends are retried with exponential backoff; once a message runs out
+of attempts it is parked with status 'dead' for manual inspection.
+
+With the 'digest' delivery policy, quotes that are not urgent are written
+as 'held' rows carrying only their rendered section. A sender turns the
+held rows into one digest message once the oldest has waited
+`digest_interval` seconds (or `digest_max_items` have piled up): in one
+transaction it inserts the digest as an ordinary pending message and
+marks the held rows 'digested' with its id. Every quote is therefore in
+exactly one digest, and the digest itself is delivered (and retried)
+like any other message. The senders run from worker start and check
+for a due digest every `poll_interval` seconds, so a digest goes out on
+time whether or not new quotes arrive; the check is a plain read until
+one is due. Each message carries a Message-ID derived from
+its outbox id, so a resend after a crash between the SMTP send and the
+status update is recognised as the same message by the mailbox.
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+import attachments
+from email_templates import URGENCY_CLASSES, digest_subject, render_digest_email
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Queue configuration
+EMAIL_QUEUE_CONFIG = {
+    'workers': int(os.environ.get('EMAIL_QUEUE_WORKERS', '2')),
+    'smtp_connections': int(os.environ.get('EMAIL_QUEUE_SMTP_CONNECTIONS', '2')),
+    'max_attempts': int(os.environ.get('EMAIL_QUEUE_MAX_ATTEMPTS', '6')),
+    'backoff_base': float(os.environ.get('EMAIL_QUEUE_BACKOFF_BASE', '30')),  # seconds
+    'backoff_max': float(os.environ.get('EMAIL_QUEUE_BACKOFF_MAX', '3600')),  # seconds
+    'poll_interval': float(os.environ.get('EMAIL_QUEUE_POLL_INTERVAL', '5')),  # seconds
+    'lease_timeout': float(os.environ.get('EMAIL_QUEUE_LEASE_TIMEOUT', '300')),  # seconds
+    'smtp_timeout': float(os.environ.get('EMAIL_QUEUE_SMTP_TIMEOUT', '30')),  # seconds
+    'smtp_max_idle': float(os.environ.get('EMAIL_QUEUE_SMTP_MAX_IDLE', '60')),  # seconds
+    # 'immediate' sends one message per quote; 'digest' batches quotes that are not urgent
+    'delivery_policy': os.environ.get('EMAIL_DELIVERY_POLICY', 'immediate'),
+    'digest_interval': float(os.environ.get('EMAIL_DIGEST_INTERVAL', '3600')),  # seconds; 86400 = daily
+    'digest_max_items': int(os.environ.get('EMAIL_DIGEST_MAX_ITEMS', '50')),
+    # Urgency classes (email_templates.URGENCY_CLASSES) that are never held for a digest
+    'immediate_classes': tuple(os.environ.get('EMAIL_DIGEST_IMMEDIATE_CLASSES', 'important').split(',')),
+}
+
+# Outbox statuses
+STATUS_PENDING = 'pending'
+STATUS_SENDING = 'sending'
+STATUS_SENT = 'sent'
+STATUS_DEAD = 'dead'
+STATUS_HELD = 'held'  # waiting to be included in a digest
+STATUS_DIGESTED = 'digested'  # included in the digest message digest_id
+
+
+def init_outbox(cursor):
+    """Create the email outbox table and its indexes"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS email_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            quote_id INTEGER,
+            to_addr TEXT NOT NULL,
+            reply_to TEXT,
+            subject TEXT NOT NULL,
+            html_body TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL DEFAULT 0,
+            locked_until REAL,
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            sent_at TIMESTAMP,
+            digest_id INTEGER
+        )
+    ''')
+    columns = {row[1] for row in cursor.execute('PRAGMA table_info(email_outbox)')}
+    if 'digest_id' not in columns:
+        cursor.execute('ALTER TABLE email_outbox ADD COLUMN digest_id INTEGER')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_email_outbox_due
+        ON email_outbox (status, next_attempt_at)
+    ''')
+
+
+def enqueue_email(cursor, to_addr, subject, html_body, reply_to='', quote_id=None, hold=False):
+    """Add a message to the outbox using the caller's cursor (and transaction)
+
+    With hold=True html_body is one quote's digest section and the row waits
+    for the next digest instead of being sent on its own.
+    """
+    cursor.execute('''
+        INSERT INTO email_outbox (quote_id, to_addr, reply_to, subject, html_body, status, next_attempt_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (quote_id, to_addr, reply_to, subject, html_body, STATUS_HELD if hold else STATUS_PENDING,
+          time.time()))
+    return cursor.lastrowid
+
+
+def holds_for_digest(urgency, queue_config=None):
+    """Whether a quote with this urgency waits for a digest under the configured policy"""
+    config = queue_config or EMAIL_QUEUE_CONFIG
+    if config['delivery_policy'] != 'digest':
+        return False
+    return URGENCY_CLASSES.get(urgency, '') not in config['immediate_classes']
+
+
+def count_pending(conn):
+    """Number of outbox messages not yet sent (including leased ones)"""
+    return conn.execute(
+        'SELECT COUNT(*) FROM email_outbox WHERE status IN (?, ?)',
+        (STATUS_PENDING, STATUS_SENDING)
+    ).fetchone()[0]
+
+
+def count_held(conn):
+    """Number of quotes waiting for the next digest"""
+    return conn.execute('SELECT COUNT(*) FROM email_outbox WHERE status = ?', (STATUS_HELD,)).fetchone()[0]
+
+
+def outbox_message_id(email_config, message_id):
+    """Stable Message-ID of an outbox entry, the same on every delivery attempt"""
+    domain = email_config['email'].rpartition('@')[2] or 'localhost'
+    return f'<jlk-outbox-{message_id}@{domain}>'
+
+
+def build_message(email_config, to_addr, subject, html_body, reply_to='', message_id=None):
+    """Build the MIME message for an outbox entry"""
+    # The MIME and SMTP modules load on the first send, not when a worker boots
+    from email.mime.multipart import MIMEMultipart
+    from email.mime.text import MIMEText
+    from email.utils import formataddr
+
+    msg = MIMEMultipart('alternative')
+    msg['Subject'] = subject
+    msg['From'] = formataddr((email_config['from_name'], email_config['email']))
+    msg['To'] = to_addr
+    if reply_to:
+        msg['Reply-To'] = reply_to
+    if message_id is not None:
+        msg['Message-ID'] = outbox_message_id(email_config, message_id)
+    msg.attach(MIMEText(html_body, 'html', 'utf-8'))
+    return msg
+
+
+def open_smtp_connection(email_config, timeout=30):
+    """Open an SMTP connection, upgrade it to TLS and log in"""
+    import smtplib
+    server = smtplib.SMTP(email_config['smtp_server'], email_config['smtp_port'], timeout=timeout)
+    try:
+        if email_config.get('use_tls', True):
+            server.starttls()
+        server.login(email_config['email'], email_config['password'])
+    except Exception:
+        server.close()
+        raise
+    return server
+
+
+class SMTPConnectionPool:
+    """A bounded pool of long-lived, authenticated SMTP connections"""
+
+    def __init__(self, email_config, size=2, timeout=30, max_idle=60):
+        self.email_config = email_config
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self._slots = threading.BoundedSemaphore(size)
+        self._idle = queue.LifoQueue()
+
+    def _is_alive(self, server):
+        """Check an idle connection with NOOP before reusing it"""
+        import smtplib
+        try:
+            return server.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def _discard(self, server):
+        import smtplib
+        try:
+            server.quit()
+        except (smtplib.SMTPException, OSError):
+            server.close()
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection, reconnecting if the idle one went stale"""
+        self._slots.acquire()
+        server = None
+        try:
+            try:
+                server, last_used = self._idle.get_nowait()
+                if time.monotonic() - last_used > self.max_idle and not self._is_alive(server):
+                    self._discard(server)
+                    server = None
+            except queue.Empty:
+                pass
+
+            if server is None:
+                server = open_smtp_connection(self.email_config, self.timeout)
+
+            try:
+                yield server
+            except Exception:
+                # Never hand a connection in an unknown state to the next sender
+                self._discard(server)
+                server = None
+                raise
+        finally:
+            if server is not None:
+                self._idle.put((server, time.monotonic()))
+            self._slots.release()
+
+    def close(self):
+        """Close every idle connection"""
+        while True:
+            try:
+                server, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._discard(server)
+
+
+class MailQueue:
+    """Background sender pool that drains the email outbox"""
+
+    def __init__(self, email_config, queue_config=None):
+        self.email_config = email_config
+        self.config = dict(EMAIL_QUEUE_CONFIG, **(queue_config or {}))
+        self.db = None
+        self._pool = None
+        self._threads = []
+        self._pid = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._digest_lock = threading.Lock()
+        self._next_digest_check = 0.0
+
+    # -- lifecycle -------------------------------------------------------
+
+    def start(self, db):
+        """Start the sender threads for this process (idempotent, fork-aware)"""
+        with self._lock:
+            if self._pid == os.getpid() and self._threads:
+                return
+            # After a fork the parent's threads and sockets are not ours
+            self.db = db
+            self._pid = os.getpid()
+            self._stopping.clear()
+            self._pool = SMTPConnectionPool(
+                self.email_config,
+                size=self.config['smtp_connections'],
+                timeout=self.config['smtp_timeout'],
+                max_idle=self.config['smtp_max_idle'],
+            )
+            self._threads = []
+            for i in range(self.config['workers']):
+                thread = threading.Thread(target=self._run, name=f'mail-sender-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self, timeout=5):
+        """Stop the sender threads and close pooled SMTP connections"""
+        if self._pid != os.getpid():
+            return  # started by the parent before a fork, or never
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        if self._pool is not None:
+            self._pool.close()
+        self._pid = None
+
+    def notify(self):
+        """Wake idle senders after a new message was committed"""
+        self._wakeup.set()
+
+    # -- outbox access ---------------------------------------------------
+
+    def _claim(self, conn):
+        """Atomically lease the next due message, or return None"""
+        now = time.time()
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            row = cursor.execute('''
+                SELECT * FROM email_outbox
+                WHERE (status = ? AND next_attempt_at <= ?)
+                   OR (status = ? AND locked_until < ?)
+                ORDER BY next_attempt_at, id
+                LIMIT 1
+            ''', (STATUS_PENDING, now, STATUS_SENDING, now)).fetchone()
+            if row is not None:
+                cursor.execute('''
+                    UPDATE email_outbox SET status = ?, locked_until = ? WHERE id = ?
+                ''', (STATUS_SENDING, now + self.config['lease_timeout'], row['id']))
+            conn.commit()
+            return row
+        except Exception:
+            conn.rollback()
+            raise
+
+    def _mark_sent(self, conn, message_id):
+        conn.execute('''
+            UPDATE email_outbox
+            SET status = ?, sent_at = CURRENT_TIMESTAMP, locked_until = NULL, last_error = NULL
+            WHERE id = ?
+        ''', (STATUS_SENT, message_id))
+        conn.commit()
+
+    def _mark_failed(self, conn, row, error):
+        attempts = row['attempts'] + 1
+        if attempts >= self.config['max_attempts']:
+            status, next_attempt_at = STATUS_DEAD, row['next_attempt_at']
+            logger.error("Email %s moved to dead letter after %s attempts: %s", row['id'], attempts, error)
+        else:
+            delay = min(self.config['backoff_base'] * (2 ** (attempts - 1)), self.config['backoff_max'])
+            status, next_attempt_at = STATUS_PENDING, time.time() + delay
+            logger.warning("Email %s failed (attempt %s), retrying in %.0fs: %s", row['id'], attempts, delay, error)
+        conn.execute('''
+            UPDATE email_outbox
+            SET status = ?, attempts = ?, next_attempt_at = ?, locked_until = NULL, last_error = ?
+            WHERE id = ?
+        ''', (status, attempts, next_attempt_at, str(error)[:1000], row['id']))
+        conn.commit()
+
+    def build_digest(self, conn, force=False):
+        """Turn held quotes into one pending digest message if one is due; returns its id"""
+        now = time.time()
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            count, oldest = cursor.execute('''
+                SELECT COUNT(*), MIN(next_attempt_at) FROM email_outbox WHERE status = ?
+            ''', (STATUS_HELD,)).fetchone()
+            due = count and (force or count >= self.config['digest_max_items']
+                             or now - oldest >= self.config['digest_interval'])
+            if not due:
+                conn.commit()
+                return None
+            rows = cursor.execute('''
+                SELECT id, to_addr, html_body FROM email_outbox WHERE status = ? ORDER BY id LIMIT ?
+            ''', (STATUS_HELD, self.config['digest_max_items'])).fetchall()
+            html_body = render_digest_email([row['html_body'] for row in rows])
+            cursor.execute('''
+                INSERT INTO email_outbox (to_addr, subject, html_body, next_attempt_at) VALUES (?, ?, ?, ?)
+            ''', (rows[0]['to_addr'], digest_subject(len(rows)), html_body, now))
+            digest_id = cursor.lastrowid
+            cursor.executemany('''
+                UPDATE email_outbox SET status = ?, digest_id = ? WHERE id = ?
+            ''', [(STATUS_DIGESTED, digest_id, row['id']) for row in rows])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        logger.info("Email digest %s built from %s quotes", digest_id, len(rows))
+        return digest_id
+
+    def _digest_due(self, conn):
+        """Whether held quotes are due for a digest, by a plain read (no write lock)"""
+        count, oldest = conn.execute('''
+            SELECT COUNT(*), MIN(next_attempt_at) FROM email_outbox WHERE status = ?
+        ''', (STATUS_HELD,)).fetchone()
+        conn.commit()
+        return bool(count) and (count >= self.config['digest_max_items']
+                                or time.time() - oldest >= self.config['digest_interval'])
+
+    def _maybe_build_digest(self, conn):
+        """Check for a due digest at most once per poll interval per process"""
+        if time.monotonic() < self._next_digest_check or not self._digest_lock.acquire(blocking=False):
+            return False
+        try:
+            self._next_digest_check = time.monotonic() + self.config['poll_interval']
+            if not self._digest_due(conn):
+                return False
+            return self.build_digest(conn) is not None
+        finally:
+            self._digest_lock.release()
+
+    def pending_count(self):
+        """Number of messages waiting to be sent (including leased ones)"""
+        return count_pending(self.db.connection())
+
+    def wait_idle(self, timeout=30):
+        """Block until the outbox has nothing due (used by benchmarks and shutdown)"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.pending_count() == 0:
+                return True
+            self._wakeup.set()
+            time.sleep(0.05)
+        return False
+
+    # -- sender loop -----------------------------------------------------
+
+    def _send(self, row):
+        import smtplib
+        # Image variants generated since the quote was stored replace the original upload
+        msg = build_message(self.email_config, row['to_addr'], row['subject'],
+                            attachments.link_variants(row['html_body']), row['reply_to'], message_id=row['id'])
+        with metrics.stage('smtp_send'):
+            try:
+                with self._pool.connection() as server:
+                    server.send_message(msg)
+            except smtplib.SMTPServerDisconnected:
+                # The server dropped a pooled connection; retry once on a fresh one
+                with self._pool.connection() as server:
+                    server.send_message(msg)
+
+    def _run(self):
+        conn = self.db.connection()
+        try:
+            while not self._stopping.is_set():
+                try:
+                    # Also under the 'immediate' policy, for quotes held before it was switched
+                    self._maybe_build_digest(conn)
+                    row = self._claim(conn)
+                except self.db.Error as e:
+                    logger.error("Email queue claim failed: %s", e)
+                    row = None
+
+                if row is None:
+                    self._wakeup.wait(self.config['poll_interval'])
+                    self._wakeup.clear()
+                    continue
+
+                try:
+                    self._send(row)
+                except Exception as e:
+                    error = e
+                else:
+                    error = None
+
+                try:
+                    if error is None:
+                        self._mark_sent(conn, row['id'])
+                    else:
+                        self._mark_failed(conn, row, error)
+                except self.db.Error as e:
+                    # The lease expires and the message is retried by the next claim
+                    logger.error("Email queue update failed for %s: %s", row['id'], e)
+        finally:
+            self.db.close()
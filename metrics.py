@@ -0,0 +1,395 @@
+"""
+JLK Transservice - Request metrics
+
+Per-route latency histograms, per-stage timings of a form submission
+(validation, image save, DB insert, email render, SMTP send), SQLite
+write-lock wait and email queue depth, exposed in the Prometheus text
+format on /api/metrics.
+
+Recording is lock-free: every thread updates its own shard of counters
+and only the scrape merges them. Each gunicorn worker writes its merged
+totals to a small JSON file in `directory` every `flush_interval` seconds
+from a background thread,
+and a scrape (served by whichever worker gets it) adds up every worker's
+file, so the numbers cover the whole server. Gauges such as the email
+queue depth are read fresh at scrape time instead.
+
+When a worker exits its final totals are added to `retired.json` and
+its own file is deleted (gunicorn's worker_exit, and child_exit in the
+master for a worker that was killed before it could). Recycled workers
+therefore do not leave files behind for every scrape to read, and a new
+worker that gets a dead worker's pid starts from its own zero while the
+dead worker's counts stay in the total, so counters never go backwards.
+The master clears the directory when the server starts and records
+nothing itself, so its startup work (preload) adds no file of its own.
+
+Stage timings can be sampled: with `stage_sample_rate` below 1 only that
+share of requests records them; route latency is always recorded.
+"""
+
+import bisect
+import contextlib
+import contextvars
+import glob
+import json
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import nullcontext
+
+try:
+    import fcntl
+except ImportError:  # no flock(); retiring a worker is then not atomic for a concurrent scrape
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Metrics configuration
+METRICS_CONFIG = {
+    'enabled': os.environ.get('METRICS', '1') != '0',
+    'directory': os.environ.get('METRICS_DIR', 'build/metrics'),  # shared by all workers on the host
+    'flush_interval': float(os.environ.get('METRICS_FLUSH_INTERVAL', '5')),  # seconds
+    'stage_sample_rate': float(os.environ.get('METRICS_STAGE_SAMPLE_RATE', '1.0')),  # 0..1
+    'buckets': (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),  # seconds
+}
+
+# Metric name -> (type, help)
+METRICS = {
+    'jlk_http_requests_total': ('counter', 'Requests handled, by route, method and status'),
+    'jlk_http_request_duration_seconds': ('histogram', 'Request latency by route'),
+    'jlk_stage_duration_seconds': ('histogram', 'Time spent in each stage of a form submission'),
+    'jlk_db_lock_wait_seconds': ('histogram', 'Time waiting for the SQLite write lock'),
+    'jlk_rate_limited_total': ('counter', 'Form posts rejected by the rate limiter'),
+    'jlk_duplicate_submissions_total': ('counter', 'Repeated form posts answered with the original id'),
+    'jlk_stats_requests_total': ('counter', '/api/stats answers, by whether the cache had them'),
+    'jlk_broken_link_beacons_total': ('counter', '404 beacons received, by what became of them'),
+    'jlk_log_records_dropped_total': ('counter', 'Log records not written, by reason'),
+    'jlk_estimates_total': ('counter', 'Price estimates asked for, by whether the rate table had a price'),
+}
+
+RETIRED_FILE = 'retired.json'
+
+# Whether the current request records stage timings (a contextvar, so it
+# follows a request across threads and asyncio tasks)
+_sampled = contextvars.ContextVar('metrics_sampled', default=True)
+
+
+class _Shard:
+    """Counters and histograms written by one thread"""
+
+    __slots__ = ('pid', 'thread', 'counters', 'histograms')
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.thread = threading.current_thread()
+        self.counters = {}
+        self.histograms = {}
+
+
+class _StageTimer:
+    __slots__ = ('metrics', 'labels', 'began')
+
+    def __init__(self, metrics, labels):
+        self.metrics = metrics
+        self.labels = labels
+
+    def __enter__(self):
+        self.began = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe('jlk_stage_duration_seconds', time.perf_counter() - self.began, self.labels)
+
+
+_NOT_TIMED = nullcontext()
+
+
+def _merge(target, snapshot):
+    for key, value in snapshot['counters']:
+        key = (key[0], tuple(map(tuple, key[1])))
+        target['counters'][key] = target['counters'].get(key, 0) + value
+    for key, values in snapshot['histograms']:
+        key = (key[0], tuple(map(tuple, key[1])))
+        current = target['histograms'].get(key)
+        if current is None or len(current) != len(values):
+            target['histograms'][key] = list(values)
+        else:
+            for i, value in enumerate(values):
+                current[i] += value
+
+
+def _shard_items(shard):
+    # list() copies a dict in one step, so a writing thread cannot change it mid-iteration
+    return {'counters': list(shard.counters.items()), 'histograms': list(shard.histograms.items())}
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metrics:
+    """Lock-free per-thread recording, merged per process and across workers"""
+
+    def __init__(self, config=None):
+        self.config = dict(METRICS_CONFIG, **(config or {}))
+        self.buckets = tuple(self.config['buckets'])
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []
+        self._retired = {'counters': {}, 'histograms': {}}  # shards of threads that have exited
+        self._pid = None
+        self._gauges = {}
+        self._flush_lock = threading.Lock()
+        self._file_retired = False  # this process's file was folded into retired.json
+        self._disabled_pid = None  # a process that records nothing (the gunicorn master)
+
+    # -- recording -------------------------------------------------------
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None or shard.pid != os.getpid():
+            shard = _Shard()
+            if shard.pid == self._disabled_pid:
+                # Not registered: whatever this process records is dropped, and it gets no flusher
+                self._local.shard = shard
+                return shard
+            with self._lock:
+                if self._pid != shard.pid:
+                    # After a fork the parent's numbers and flusher thread are not this worker's
+                    self._pid = shard.pid
+                    self._shards = []
+                    self._retired = {'counters': {}, 'histograms': {}}
+                    self._file_retired = False
+                    threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True).start()
+                self._shards.append(shard)
+            self._local.shard = shard
+        return shard
+
+    def inc(self, name, labels=(), amount=1):
+        """Add to a counter"""
+        if not self.config['enabled']:
+            return
+        counters = self._shard().counters
+        key = (name, labels)
+        counters[key] = counters.get(key, 0) + amount
+
+    def observe(self, name, value, labels=()):
+        """Record a value (seconds) in a histogram"""
+        if not self.config['enabled']:
+            return
+        histograms = self._shard().histograms
+        key = (name, labels)
+        counts = histograms.get(key)
+        if counts is None:
+            # one slot per bucket, one for +Inf, then the sum
+            counts = histograms[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def gauge(self, name, help_text, read):
+        """Register a gauge whose value read() returns at scrape time"""
+        self._gauges[name] = (help_text, read)
+
+    def stage(self, name):
+        """Context manager timing a block as one stage of the current request, if it is sampled"""
+        if not (self.config['enabled'] and _sampled.get()):
+            return _NOT_TIMED
+        return _StageTimer(self, (('stage', name),))
+
+    def begin_request(self):
+        """Decide whether this request records stage timings; returns its start time"""
+        rate = self.config['stage_sample_rate']
+        _sampled.set(rate >= 1.0 or (rate > 0.0 and random.random() < rate))
+        return time.perf_counter()
+
+    def end_request(self, method, route, status, started):
+        """Record a finished request"""
+        if not self.config['enabled']:
+            return
+        labels = (('route', route), ('method', method))
+        self.observe('jlk_http_request_duration_seconds', time.perf_counter() - started, labels)
+        self.inc('jlk_http_requests_total', labels + (('status', str(status)),))
+
+    # -- aggregation -----------------------------------------------------
+
+    def snapshot(self):
+        """This process's totals, merged across threads"""
+        totals = {'counters': {}, 'histograms': {}}
+        with self._lock:
+            if self._pid != os.getpid():
+                return totals
+            # Fold exited threads (one per request on some servers) into one total
+            for shard in [shard for shard in self._shards if not shard.thread.is_alive()]:
+                _merge(self._retired, _shard_items(shard))
+                self._shards.remove(shard)
+            _merge(totals, {'counters': list(self._retired['counters'].items()),
+                            'histograms': list(self._retired['histograms'].items())})
+            shards = list(self._shards)
+        for shard in shards:
+            _merge(totals, _shard_items(shard))
+        return totals
+
+    def _worker_file(self, pid=None):
+        return os.path.join(self.config['directory'], f'worker-{pid or os.getpid()}.json')
+
+    def _flush_loop(self):
+        pid = os.getpid()
+        while True:
+            time.sleep(self.config['flush_interval'])
+            if self._pid != pid:
+                return
+            self.flush()
+
+    @contextlib.contextmanager
+    def _directory_lock(self, exclusive):
+        """Shared for scrapes, exclusive while a worker's file moves into retired.json"""
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(self.config['directory'], exist_ok=True)
+        with open(os.path.join(self.config['directory'], '.lock'), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            yield
+
+    def _write_json(self, path, totals):
+        payload = {
+            'counters': [[[name, labels], value] for (name, labels), value in totals['counters'].items()],
+            'histograms': [[[name, labels], values] for (name, labels), values in totals['histograms'].items()],
+        }
+        temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        os.makedirs(self.config['directory'], exist_ok=True)
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(payload, f, separators=(',', ':'))
+        os.replace(temp_path, path)
+
+    def _read_json(self, path, totals):
+        try:
+            with open(path, encoding='utf-8') as f:
+                _merge(totals, json.load(f))
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning("Skipping unreadable metrics file %s: %s", path, e)
+
+    def flush(self):
+        """Write this worker's totals for the other workers' scrapes"""
+        path = self._worker_file()
+        with self._flush_lock:
+            if self._file_retired or self._pid != os.getpid():
+                return
+            try:
+                self._write_json(path, self.snapshot())
+            except OSError as e:
+                logger.warning("Could not write metrics to %s: %s", path, e)
+
+    def retire(self, pid=None):
+        """Add a finished worker's totals to retired.json and delete its file
+
+        Without pid: this process, with its live totals, at exit (it writes
+        no file afterwards). With pid: a worker that is gone, from its last
+        flush. Returns whether anything was retired.
+        """
+        own = pid is None or pid == os.getpid()
+        path = self._worker_file(pid)
+        retired_path = os.path.join(self.config['directory'], RETIRED_FILE)
+        with self._flush_lock:
+            if own and (self._file_retired or self._pid != os.getpid()):
+                return False
+            try:
+                with self._directory_lock(exclusive=True):
+                    if own:
+                        totals = self.snapshot()
+                    elif os.path.exists(path):
+                        totals = {'counters': {}, 'histograms': {}}
+                        self._read_json(path, totals)
+                    else:
+                        return False
+                    self._read_json(retired_path, totals)
+                    self._write_json(retired_path, totals)
+                    with contextlib.suppress(FileNotFoundError):
+                        os.remove(path)
+            except OSError as e:
+                logger.warning("Could not retire metrics of %s: %s", path, e)
+                return False
+            if own:
+                self._file_retired = True
+            return True
+
+    def disable_process(self):
+        """Stop this process recording (the gunicorn master, which runs startup but serves nothing)
+
+        What it recorded so far is dropped along with its file, not retired,
+        and its flusher stops. Workers forked from it record as usual.
+        """
+        with self._flush_lock:
+            with self._lock:
+                self._disabled_pid = os.getpid()
+                self._pid = None
+                self._shards = []
+                self._retired = {'counters': {}, 'histograms': {}}
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(self._worker_file())
+
+    def clear_directory(self):
+        """Remove every worker's and retired totals (server start, before any worker runs)"""
+        for path in glob.glob(os.path.join(self.config['directory'], '*.json*')):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+
+    def collect(self):
+        """Totals of every worker: this one live, the others from their last flush, plus exited ones"""
+        totals = self.snapshot()
+        own = self._worker_file()
+        with self._directory_lock(exclusive=False):
+            for path in glob.glob(os.path.join(self.config['directory'], 'worker-*.json')):
+                if path != own:
+                    self._read_json(path, totals)
+            self._read_json(os.path.join(self.config['directory'], RETIRED_FILE), totals)
+        return totals
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        self.flush()
+        totals = self.collect()
+        lines = []
+        for name, (kind, help_text) in METRICS.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            if kind == 'counter':
+                for (metric, labels), value in sorted(totals['counters'].items()):
+                    if metric == name:
+                        lines.append(f'{name}{_format_labels(labels)} {_format_number(value)}')
+                continue
+            for (metric, labels), values in sorted(totals['histograms'].items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(self.buckets + ('+Inf',), values):
+                    cumulative += count
+                    bound = bound if bound == '+Inf' else _format_number(bound)
+                    lines.append(f'{name}_bucket{_format_labels(labels, [("le", bound)])} {cumulative}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {_format_number(values[-1])}')
+                lines.append(f'{name}_count{_format_labels(labels)} {cumulative}')
+        for name, (help_text, read) in self._gauges.items():
+            try:
+                value = read()
+            except Exception as e:
+                logger.warning("Metric %s unavailable: %s", name, e)
+                continue
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} gauge')
+            lines.append(f'{name} {_format_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+# Process-wide registry used by app.py, asgi.py, database.py and mail_queue.py
+metrics = Metrics()
@@ -0,0 +1,241 @@
+"""
+JLK Transservice - Versioned schema migrations
+
+Each backend has an ordered list of (version, name, step) migrations; a
+step gets a cursor inside its own transaction and the version is recorded
+in schema_migrations in that same transaction, so a step either applies
+completely or not at all. Versions mean the same schema on SQLite and
+PostgreSQL. Schema changes are made by appending a migration, never by
+editing one that has shipped.
+
+The SQLite steps are the modules' own init_* functions. They still use
+IF NOT EXISTS (and check for columns added later) so that databases
+created before migrations existed are adopted as they are and simply get
+their versions recorded. The PostgreSQL schema is written out here; search
+has no PostgreSQL index yet, so version 5 is a no-op there.
+
+Several workers may start at once: SQLite serializes the transactions
+with BEGIN IMMEDIATE, PostgreSQL with a lock on schema_migrations, and a
+version is re-checked under the lock before it is applied.
+"""
+
+import functools
+import logging
+
+import attachments
+import broken_links
+import idempotency
+import mail_queue
+import queries
+import search
+import stats
+
+logger = logging.getLogger(__name__)
+
+
+def _sqlite_base_tables(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS quotes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            company_name TEXT NOT NULL,
+            contact_name TEXT NOT NULL,
+            email TEXT NOT NULL,
+            phone TEXT NOT NULL,
+            service_type TEXT NOT NULL,
+            origin TEXT,
+            destination TEXT,
+            cargo_type TEXT,
+            weight TEXT,
+            dimensions TEXT,
+            urgency TEXT,
+            additional_services TEXT,
+            description TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            status TEXT DEFAULT 'pending'
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS contacts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            email TEXT NOT NULL,
+            subject TEXT,
+            message TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            status TEXT DEFAULT 'new'
+        )
+    ''')
+
+
+def _sql(*statements):
+    """Migration step running fixed SQL statements"""
+    def run(cursor):
+        for statement in statements:
+            cursor.execute(statement)
+    return run
+
+
+# CURRENT_TIMESTAMP in SQLite: UTC, whole seconds
+_PG_NOW = "(now() AT TIME ZONE 'UTC')"
+
+MIGRATIONS = {
+    'sqlite': (
+        (1, 'quotes and contacts', _sqlite_base_tables),
+        (2, 'email outbox', mail_queue.init_outbox),
+        (3, 'attachments', attachments.init_attachments),
+        (4, 'list indexes', queries.init_list_indexes),
+        (5, 'search indexes', search.init_search),
+        (6, 'submission keys', idempotency.init_idempotency),
+        (7, 'quote rollups', stats.init_stats),
+        (8, 'broken links', broken_links.init_broken_links),
+    ),
+    'postgresql': (
+        (1, 'quotes and contacts', _sql(f'''
+            CREATE TABLE quotes (
+                id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+                company_name TEXT NOT NULL,
+                contact_name TEXT NOT NULL,
+                email TEXT NOT NULL,
+                phone TEXT NOT NULL,
+                service_type TEXT NOT NULL,
+                origin TEXT,
+                destination TEXT,
+                cargo_type TEXT,
+                weight TEXT,
+                dimensions TEXT,
+                urgency TEXT,
+                additional_services TEXT,
+                description TEXT,
+                created_at TIMESTAMP(0) DEFAULT {_PG_NOW},
+                status TEXT DEFAULT 'pending'
+            )
+        ''', f'''
+            CREATE TABLE contacts (
+                id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+                name TEXT NOT NULL,
+                email TEXT NOT NULL,
+                subject TEXT,
+                message TEXT NOT NULL,
+                created_at TIMESTAMP(0) DEFAULT {_PG_NOW},
+                status TEXT DEFAULT 'new'
+            )
+        ''')),
+        (2, 'email outbox', _sql(f'''
+            CREATE TABLE email_outbox (
+                id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+                quote_id BIGINT,
+                to_addr TEXT NOT NULL,
+                reply_to TEXT,
+                subject TEXT NOT NULL,
+                html_body TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at DOUBLE PRECISION NOT NULL DEFAULT 0,
+                locked_until DOUBLE PRECISION,
+                last_error TEXT,
+                created_at TIMESTAMP(0) DEFAULT {_PG_NOW},
+                sent_at TIMESTAMP(0),
+                digest_id BIGINT
+            )
+        ''', '''
+            CREATE INDEX idx_email_outbox_due ON email_outbox (status, next_attempt_at)
+        ''')),
+        (3, 'attachments', _sql(f'''
+            CREATE TABLE attachments (
+                hash TEXT PRIMARY KEY,
+                extension TEXT NOT NULL,
+                size BIGINT NOT NULL,
+                ref_count INTEGER NOT NULL DEFAULT 0,
+                created_at TIMESTAMP(0) DEFAULT {_PG_NOW},
+                updated_at DOUBLE PRECISION NOT NULL
+            )
+        ''', '''
+            ALTER TABLE quotes ADD COLUMN attachment_hash TEXT
+        ''', '''
+            CREATE INDEX idx_quotes_attachment_hash ON quotes (attachment_hash)
+        ''', '''
+            CREATE FUNCTION quotes_release_attachment() RETURNS trigger LANGUAGE plpgsql AS $$
+            BEGIN
+                UPDATE attachments
+                SET ref_count = ref_count - 1, updated_at = extract(epoch FROM clock_timestamp())
+                WHERE hash = OLD.attachment_hash;
+                RETURN OLD;
+            END
+            $$
+        ''', '''
+            CREATE TRIGGER quotes_release_attachment
+            AFTER DELETE ON quotes
+            FOR EACH ROW WHEN (OLD.attachment_hash IS NOT NULL)
+            EXECUTE FUNCTION quotes_release_attachment()
+        ''')),
+        (4, 'list indexes', queries.init_list_indexes),
+        (5, 'search indexes', None),
+        (6, 'submission keys', _sql('''
+            CREATE TABLE submission_keys (
+                key TEXT PRIMARY KEY,
+                record_id BIGINT NOT NULL,
+                response TEXT,
+                created_at DOUBLE PRECISION NOT NULL
+            )
+        ''', '''
+            CREATE INDEX idx_submission_keys_created ON submission_keys (created_at)
+        ''')),
+        (7, 'quote rollups', functools.partial(stats.init_stats, dialect='postgresql')),
+        (8, 'broken links', _sql('''
+            CREATE TABLE broken_links (
+                path TEXT NOT NULL,
+                referrer TEXT NOT NULL DEFAULT '',
+                hits BIGINT NOT NULL DEFAULT 0,
+                first_seen TIMESTAMP(0) NOT NULL,
+                last_seen TIMESTAMP(0) NOT NULL,
+                PRIMARY KEY (path, referrer)
+            )
+        ''')),
+    ),
+}
+
+
+def _ensure_version_table(db):
+    with db.transaction() as cursor:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+
+def applied_versions(db):
+    """Versions already applied to db"""
+    _ensure_version_table(db)
+    return {row[0] for row in db.connection().execute('SELECT version FROM schema_migrations')}
+
+
+def pending(db):
+    """(version, name) of the migrations db still needs, in order"""
+    done = applied_versions(db)
+    return [(version, name) for version, name, _ in MIGRATIONS[db.dialect] if version not in done]
+
+
+def migrate(db, target=None):
+    """Apply pending migrations up to target (default: all); returns the versions applied"""
+    done = applied_versions(db)
+    applied = []
+    for version, name, step in MIGRATIONS[db.dialect]:
+        if version in done:
+            continue
+        if target is not None and version > target:
+            break
+        with db.transaction() as cursor:
+            if db.dialect == 'postgresql':
+                cursor.execute('LOCK TABLE schema_migrations IN EXCLUSIVE MODE')
+            cursor.execute('SELECT 1 FROM schema_migrations WHERE version = ?', (version,))
+            if cursor.fetchone() is not None:
+                continue  # another worker got here first
+            if step is not None:
+                step(cursor)
+            cursor.execute('INSERT INTO schema_migrations (version, name) VALUES (?, ?)', (version, name))
+        logger.info("Applied migration %s: %s", version, name)
+        applied.append(version)
+    return applied
@@ -0,0 +1,140 @@
+"""
+JLK Transservice - Render-once HTML page cache
+
+The site's pages (index.html, services.html, ...) carry no per-request
+data, so each is rendered once, with asset URLs rewritten, and kept in
+memory as encoded bytes together with a gzip (and brotli, when available)
+variant and a strong ETag per variant. A hit only negotiates
+Accept-Encoding and returns the stored bytes; If-None-Match that matches
+is answered with 304 without rendering anything.
+
+In debug mode (or with PAGE_CACHE_CHECK_MTIME=1) each hit stats the
+template file and re-renders it when its mtime changes, so editing a page
+in development shows up on the next reload.
+
+A page name with no template behind it (/nope.html) is answered with the
+cached 404 page; nothing is stored for the missing name.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+
+from flask import Response, current_app, render_template, request
+from jinja2 import TemplateNotFound
+
+from static_assets import assets, compress_variants, negotiate_encoding
+
+logger = logging.getLogger(__name__)
+
+# Page cache configuration
+PAGE_CACHE_CONFIG = {
+    'enabled': os.environ.get('PAGE_CACHE', '1') != '0',
+    # None follows app.debug
+    'check_mtime': {'1': True, '0': False}.get(os.environ.get('PAGE_CACHE_CHECK_MTIME', '')),
+    'pages': ('index.html', 'services.html', 'about.html', 'quote.html', 'contact.html', '404.html'),
+}
+
+NOT_FOUND_PAGE = '404.html'
+
+
+class _Page:
+    __slots__ = ('body', 'etag', 'variants', 'source', 'mtime')
+
+    def __init__(self, body, etag, variants, source, mtime):
+        self.body = body
+        self.etag = etag
+        self.variants = variants  # encoding -> (bytes, etag), in preference order
+        self.source = source
+        self.mtime = mtime
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except (OSError, TypeError):
+        return None
+
+
+class PageCache:
+    """Rendered pages kept as bytes, with compressed variants and ETags"""
+
+    def __init__(self, config=None):
+        self.config = dict(PAGE_CACHE_CONFIG, **(config or {}))
+        self._pages = {}
+        self._lock = threading.Lock()
+
+    def render(self, name):
+        """Render a page the uncached way"""
+        return assets.rewrite_html(render_template(name))
+
+    def _build(self, name):
+        source = current_app.jinja_env.get_template(name).filename
+        mtime = _mtime(source)
+        body = self.render(name).encode('utf-8')
+        digest = hashlib.sha256(body).hexdigest()[:16]
+        variants = {encoding: (data, f'{digest}-{suffix[1:]}')
+                    for encoding, suffix, data in compress_variants(body)}
+        page = _Page(body, digest, variants, source, mtime)
+        with self._lock:
+            self._pages[name] = page
+        return page
+
+    def _check_mtime(self):
+        check = self.config['check_mtime']
+        return current_app.debug if check is None else check
+
+    def get(self, name):
+        """The cached page, rendering it on first use or when its template changed"""
+        page = self._pages.get(name)
+        if page is None or (self._check_mtime() and _mtime(page.source) != page.mtime):
+            try:
+                page = self._build(name)
+            except TemplateNotFound:
+                # Deleted since it was cached (mtime checks) or never existed
+                with self._lock:
+                    self._pages.pop(name, None)
+                raise
+        return page
+
+    def warm(self, names=None):
+        """Render pages ahead of the first request (needs an app context)"""
+        for name in names or self.config['pages']:
+            self.get(name)
+        logger.info("Page cache warmed with %s pages", len(self._pages))
+
+    def clear(self):
+        """Drop every cached page, e.g. after the asset manifest is rebuilt"""
+        with self._lock:
+            self._pages = {}
+
+    def respond(self, name, status=200):
+        """Response serving a page from the cache; the 404 page if there is no such template"""
+        try:
+            if not self.config['enabled']:
+                return self.render(name), status
+            page = self.get(name)
+        except TemplateNotFound:
+            if name == NOT_FOUND_PAGE:
+                return 'Not Found', 404
+            return self.respond(NOT_FOUND_PAGE, status=404)
+        encoding = negotiate_encoding(page.variants)
+        body, etag = page.variants[encoding] if encoding else (page.body, page.etag)
+
+        if status == 200 and request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = Response(body, status=status, mimetype='text/html')
+            if encoding is not None:
+                response.headers['Content-Encoding'] = encoding
+        if status == 200:
+            response.set_etag(etag)
+        if page.variants:
+            response.headers['Vary'] = 'Accept-Encoding'
+        # Pages link to fingerprinted assets, so browsers must revalidate them
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+
+pages = PageCache()
@@ -0,0 +1,324 @@
+"""
+JLK Transservice - PostgreSQL storage backend
+
+PostgresDatabase implements the same interface as database.Database on
+top of a psycopg connection pool, so several app servers can share one
+database instead of queueing behind SQLite's single writer. It is picked
+by setting DATABASE_URL=postgresql://...
+
+A thread borrows a pooled connection on first use and hands it back in
+release(), which the app calls at the end of every request; background
+threads (email senders, the group-commit writer) keep theirs until they
+close it. Connections run in autocommit and transactions are opened
+explicitly, as on SQLite.
+
+The app's SQL is written for sqlite3, so connections are wrapped to look
+like it: '?' placeholders, rows readable by position or column name,
+cursor.lastrowid, and timestamps read back as 'YYYY-MM-DD HH:MM:SS' text.
+'BEGIN IMMEDIATE' (the outbox claim and digest builder) also takes a
+transaction-level advisory lock, so those transactions still run one at
+a time across every server.
+
+copy_from_sqlite() moves an existing jlktran.db into PostgreSQL with COPY,
+one transaction per batch, and can be re-run to pick up where it stopped.
+"""
+
+import functools
+import logging
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import psycopg
+    import psycopg.rows
+    from psycopg.types.string import TextLoader
+    from psycopg_pool import ConnectionPool
+except ImportError:  # optional; only needed when DATABASE_URL is a PostgreSQL URL
+    psycopg = None
+
+from database import INSERT_SQL, Database
+
+logger = logging.getLogger(__name__)
+
+# Connection pool configuration
+POSTGRES_CONFIG = {
+    'pool_min_size': int(os.environ.get('PG_POOL_MIN_SIZE', '1')),
+    'pool_max_size': int(os.environ.get('PG_POOL_MAX_SIZE', '10')),
+    'pool_timeout': float(os.environ.get('PG_POOL_TIMEOUT', '30')),  # seconds to wait for a free connection
+    'statement_timeout': int(os.environ.get('PG_STATEMENT_TIMEOUT', '30000')),  # milliseconds, 0 = none
+    'copy_batch_size': 5000,  # rows per COPY transaction in copy_from_sqlite
+}
+
+# pg_advisory_xact_lock() key standing in for SQLite's database write lock
+IMMEDIATE_LOCK_KEY = 0x4A4C4B
+
+# Tables moved by copy_from_sqlite, parents first
+COPY_TABLES = ('quotes', 'contacts', 'attachments', 'submission_keys', 'email_outbox')
+
+
+class Row(tuple):
+    """A result row readable by position or by column name, like sqlite3.Row"""
+
+    __slots__ = ()
+    _index = {}
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            key = self._index[key]
+        return tuple.__getitem__(self, key)
+
+    def keys(self):
+        return list(self._index)
+
+
+@functools.lru_cache(maxsize=256)
+def _row_class(names):
+    return type('Row', (Row,), {'__slots__': (), '_index': {name: i for i, name in enumerate(names)}})
+
+
+def _row_factory(cursor):
+    if cursor.description is None:
+        return tuple
+    return _row_class(tuple(column.name for column in cursor.description))
+
+
+@functools.lru_cache(maxsize=512)
+def _translate(sql):
+    """sqlite3 '?' placeholders to psycopg '%s' ones"""
+    return sql.replace('%', '%%').replace('?', '%s')
+
+
+class _Cursor:
+    """sqlite3-style cursor over a psycopg cursor"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self.row_factory = None  # accepted for sqlite3 compatibility; rows are always Row
+
+    def execute(self, sql, params=()):
+        if params:
+            self._cursor.execute(_translate(sql), params)
+        elif sql == 'BEGIN IMMEDIATE':
+            self._cursor.execute('BEGIN')
+            self._cursor.execute('SELECT pg_advisory_xact_lock(%s)', (IMMEDIATE_LOCK_KEY,))
+        else:
+            self._cursor.execute(sql)
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        self._cursor.executemany(_translate(sql), seq_of_params)
+        return self
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchmany(self, size=1):
+        return self._cursor.fetchmany(size)
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def lastrowid(self):
+        """Id generated by the last INSERT on this connection"""
+        return self._cursor.connection.execute('SELECT lastval()').fetchone()[0]
+
+    def close(self):
+        self._cursor.close()
+
+
+class _Connection:
+    """sqlite3-style connection over a pooled psycopg connection"""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self):
+        return _Cursor(self._conn.cursor())
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+
+class PostgresDatabase(Database):
+    """Pooled PostgreSQL connections behind the Database interface"""
+
+    dialect = 'postgresql'
+    Error = psycopg.Error if psycopg is not None else Exception
+
+    def __init__(self, url, config=None):
+        if psycopg is None:
+            raise RuntimeError('DATABASE_URL points at PostgreSQL but psycopg and psycopg_pool are not installed')
+        self.url = url
+        self.config = dict(POSTGRES_CONFIG, **(config or {}))
+        self._local = threading.local()
+        self._pool = None
+        self._pool_pid = None
+        self._pool_lock = threading.Lock()
+
+    def _configure(self, conn):
+        conn.row_factory = _row_factory
+        # Same text the SQLite tables hold, so cursors, JSON and exports look alike
+        conn.adapters.register_loader('timestamp', TextLoader)
+        conn.execute("SET TIME ZONE 'UTC'")
+        conn.execute(f"SET statement_timeout = {int(self.config['statement_timeout'])}")
+
+    def pool(self):
+        """This process's connection pool, opened on first use"""
+        if self._pool is None or self._pool_pid != os.getpid():
+            with self._pool_lock:
+                if self._pool is None or self._pool_pid != os.getpid():
+                    # A pool inherited across fork is abandoned; its sockets belong to the parent
+                    self._pool = ConnectionPool(
+                        self.url,
+                        min_size=self.config['pool_min_size'],
+                        max_size=self.config['pool_max_size'],
+                        timeout=self.config['pool_timeout'],
+                        kwargs={'autocommit': True},
+                        configure=self._configure,
+                        name='jlk',
+                    )
+                    self._pool_pid = os.getpid()
+        return self._pool
+
+    def connection(self):
+        """Return this thread's connection, borrowing one from the pool on first use"""
+        local = self._local
+        raw = getattr(local, 'raw', None)
+        if raw is None or local.pid != os.getpid() or raw.closed or raw.broken:
+            if raw is not None and local.pid == os.getpid():
+                self.pool().putconn(raw)  # the pool discards broken connections
+            local.raw = self.pool().getconn()
+            local.conn = _Connection(local.raw)
+            local.pid = os.getpid()
+        return local.conn
+
+    def release(self):
+        """Give this thread's connection back to the pool"""
+        raw = getattr(self._local, 'raw', None)
+        if raw is not None and self._local.pid == os.getpid():
+            self.pool().putconn(raw)
+        self._local.raw = None
+        self._local.conn = None
+
+    close = release
+
+    def close_pool(self):
+        """Close every pooled connection (process shutdown)"""
+        self.release()
+        if self._pool is not None and self._pool_pid == os.getpid():
+            self._pool.close()
+        self._pool = None
+
+    @contextmanager
+    def transaction(self):
+        """Run a write transaction on this thread's connection"""
+        conn = self.connection()
+        cursor = conn.cursor()
+        cursor.execute('BEGIN')
+        try:
+            yield cursor
+        except BaseException:
+            conn.rollback()
+            raise
+        else:
+            conn.commit()
+        finally:
+            cursor.close()
+
+    def iter_batches(self, sql, params=(), size=1000):
+        """Run a query and yield its rows as lists of tuples through a server-side cursor"""
+        with self.pool().connection() as conn:
+            with conn.transaction():
+                with conn.cursor(name='jlk_batches', row_factory=psycopg.rows.tuple_row) as cursor:
+                    if params:
+                        cursor.execute(_translate(sql), params)
+                    else:
+                        cursor.execute(sql)
+                    while True:
+                        rows = cursor.fetchmany(size)
+                        if not rows:
+                            return
+                        yield rows
+
+    def insert_many(self, cursor, table, rows):
+        """Insert rows in one pipelined round trip and return their ids in order"""
+        raw = cursor._cursor
+        raw.executemany(_translate(INSERT_SQL[table]) + ' RETURNING id', rows, returning=True)
+        ids = []
+        while True:
+            ids.append(raw.fetchone()[0])
+            if not raw.nextset():
+                return ids
+
+
+def _table_columns(conn, table):
+    return {row[0] for row in conn.execute(
+        'SELECT column_name FROM information_schema.columns '
+        'WHERE table_schema = current_schema() AND table_name = %s', (table,))}
+
+
+def copy_from_sqlite(source, target, tables=COPY_TABLES, batch_size=None, progress=None):
+    """Copy rows from an SQLite Database into a migrated PostgresDatabase; returns rows copied per table
+
+    Tables with an id column continue after the highest id already in the
+    target, so an interrupted copy can simply be run again; other tables are
+    copied only while still empty in the target. progress(table, rows) is
+    called after every committed batch.
+    """
+    batch_size = batch_size or target.config['copy_batch_size']
+    copied = {}
+    with target.pool().connection() as conn:
+        for table in tables:
+            source_columns = [row[1] for row in source.connection().execute(f'PRAGMA table_info({table})')]
+            if not source_columns:
+                continue  # older database without this table
+            target_columns = _table_columns(conn, table)
+            columns = [column for column in source_columns if column in target_columns]
+            column_list = ', '.join(columns)
+            sql, params = f'SELECT {column_list} FROM {table}', ()
+            if 'id' in columns:
+                start = conn.execute(f'SELECT COALESCE(MAX(id), 0) FROM {table}').fetchone()[0]
+                sql, params = sql + ' WHERE id > ? ORDER BY id', (start,)
+            elif conn.execute(f'SELECT 1 FROM {table} LIMIT 1').fetchone() is not None:
+                logger.info("Copy: %s already has rows, skipped", table)
+                continue
+
+            count = 0
+            for rows in source.iter_batches(sql, params, batch_size):
+                with conn.transaction():
+                    with conn.cursor() as cursor:
+                        with cursor.copy(f'COPY {table} ({column_list}) FROM STDIN') as copy:
+                            for row in rows:
+                                copy.write_row(row)
+                count += len(rows)
+                if progress is not None:
+                    progress(table, count)
+            if 'id' in columns:
+                # Rows kept their ids; new inserts must continue after the highest one
+                conn.execute(f"SELECT setval(pg_get_serial_sequence(%s, 'id'), COALESCE(MAX(id), 0) + 1, false) "
+                             f'FROM {table}', (table,))
+            copied[table] = count
+            logger.info("Copy: %s %s rows", table, count)
+    return copied
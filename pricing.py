@@ -0,0 +1,270 @@
+"""
+JLK Transservice - Instant indicative prices from the lane rate table
+
+rates.json holds the tariff: per (service, origin, destination) lane a
+minimum charge and weight-break tiers of price per kg, place names
+(Thai and English, cities and countries) mapped to zone codes, urgency
+multipliers and the volumetric divisor. A lane may use '*' for any
+origin or destination; the most specific lane wins.
+
+The file is read once into a RateIndex: place names become one dict,
+lanes another, and each lane's tiers become sorted break points with
+their rates plus, per tier, the cheapest charge at any heavier break.
+Pricing a shipment is then a few dict lookups and one bisect:
+
+  chargeable = max(weight, length * width * height / divisor)   (kg, cm)
+  price      = min(chargeable * rate of its tier,
+                   cheapest heavier break * its rate)
+  price      = max(price, minimum) * urgency multiplier
+
+Estimates are memoized per index in an LRU cache, so repeated calls
+while someone types into the quote form cost one cache lookup.
+PriceEstimator checks the file's mtime at most every `check_interval`
+seconds and swaps in a new index when it changes; a file that fails to
+load is logged and the previous table stays in use.
+"""
+
+import bisect
+import functools
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Price estimate configuration
+PRICING_CONFIG = {
+    'rates_file': os.environ.get('RATES_FILE', 'rates.json'),
+    'check_interval': float(os.environ.get('RATES_CHECK_INTERVAL', '5')),  # seconds between mtime checks
+    'cache_size': int(os.environ.get('ESTIMATE_CACHE_SIZE', '4096')),  # estimates remembered per process
+    'max_weight': 50000.0,  # kg; heavier shipments get no instant price
+    'max_input_length': 200,  # characters read of each form field
+    'round_to': 10,  # prices are rounded up to this many currency units
+}
+
+ANY = '*'
+
+_NUMBER = r'(\d+(?:\.\d+)?)'
+_WEIGHT = re.compile(_NUMBER + r'\s*(?:kg|kgs|กก\.?|กิโลกรัม)?')
+_DIMENSIONS = re.compile(_NUMBER + r'\s*[x×*]\s*' + _NUMBER + r'\s*[x×*]\s*' + _NUMBER + r'\s*(?:cm|ซม\.?)?')
+_PLACE_SEPARATORS = re.compile(r'[,/|;]')
+
+
+class InvalidEstimate(ValueError):
+    """A weight or dimensions value could not be understood"""
+
+
+class InvalidRateTable(ValueError):
+    """rates.json is not a usable rate table"""
+
+
+def _normalize_place(text):
+    return ' '.join(text.lower().replace('.', ' ').split())
+
+
+def _number_text(value):
+    # '.' is the decimal point; commas are thousands separators ('1,200.5')
+    return str(value or '').strip().lower().replace(',', '')
+
+
+def parse_weight(value):
+    """Weight in kg from form text ('1,200', '1200 kg'); None when empty"""
+    text = _number_text(value)
+    if not text:
+        return None
+    match = _WEIGHT.fullmatch(text)
+    if not match:
+        raise InvalidEstimate(f'weight {value!r}')
+    return float(match.group(1))
+
+
+def parse_dimensions(value):
+    """(length, width, height) in cm from '100×80×60' or '1,200x80x60'; None when empty"""
+    text = _number_text(value)
+    if not text:
+        return None
+    match = _DIMENSIONS.fullmatch(text)
+    if not match:
+        raise InvalidEstimate(f'dimensions {value!r}')
+    return tuple(float(side) for side in match.groups())
+
+
+class _Lane:
+    __slots__ = ('minimum', 'breaks', 'rates', 'cheaper_above')
+
+    def __init__(self, minimum, tiers):
+        tiers = sorted((float(start), float(rate)) for start, rate in tiers)
+        if not tiers or tiers[0][0] != 0 or any(rate <= 0 for _, rate in tiers):
+            raise InvalidRateTable('tiers must start at 0 kg and have positive rates')
+        self.minimum = float(minimum)
+        self.breaks = tuple(start for start, _ in tiers)
+        self.rates = tuple(rate for _, rate in tiers)
+        # cheaper_above[i]: lowest charge of shipping at the break of any tier after i
+        cheaper_above = [math.inf] * len(tiers)
+        for i in range(len(tiers) - 2, -1, -1):
+            cheaper_above[i] = min(cheaper_above[i + 1], self.breaks[i + 1] * self.rates[i + 1])
+        self.cheaper_above = tuple(cheaper_above)
+
+    def charge(self, weight):
+        tier = bisect.bisect_right(self.breaks, weight) - 1
+        return max(self.minimum, min(weight * self.rates[tier], self.cheaper_above[tier]))
+
+
+class RateIndex:
+    """In-memory form of one rate table, with its own estimate cache"""
+
+    def __init__(self, table, config=None):
+        self.config = dict(PRICING_CONFIG, **(config or {}))
+        try:
+            self.currency = table['currency']
+            self.divisor = float(table['volumetric_divisor'])
+            self.urgency = {name.lower(): float(factor) for name, factor in table['urgency'].items()}
+            self.places = {}
+            for code, names in table['places'].items():
+                self.places[_normalize_place(code)] = code
+                for name in names:
+                    self.places[_normalize_place(name)] = code
+            self.lanes = {}
+            for lane in table['lanes']:
+                key = (lane['service'].lower(), lane['origin'], lane['destination'])
+                self.lanes[key] = _Lane(lane['minimum'], lane['tiers'])
+        except (KeyError, TypeError, AttributeError, ValueError) as e:
+            raise InvalidRateTable(f'{type(e).__name__}: {e}') from None
+        if self.divisor <= 0:
+            raise InvalidRateTable('volumetric_divisor must be positive')
+        self.services = frozenset(service for service, _, _ in self.lanes)
+        self._cached = functools.lru_cache(maxsize=self.config['cache_size'])(self._estimate)
+
+    def place(self, text):
+        """Zone code of a free-text place ('โตเกียว, ญี่ปุ่น' -> 'JP'), or None"""
+        text = text[:self.config['max_input_length']]
+        code = self.places.get(_normalize_place(text))
+        if code is None:
+            # 'city, country': try the country first, it is the part most likely to be listed
+            for part in reversed(_PLACE_SEPARATORS.split(text)):
+                code = self.places.get(_normalize_place(part))
+                if code is not None:
+                    break
+        return code
+
+    def lane(self, service, origin, destination):
+        for key in ((service, origin, destination), (service, origin, ANY),
+                    (service, ANY, destination), (service, ANY, ANY)):
+            lane = self.lanes.get(key)
+            if lane is not None:
+                return lane
+        return None
+
+    def estimate(self, service, origin, destination, weight=None, dimensions=None, urgency=None):
+        """Indicative price for form values, or None if the table has no price for them
+
+        Returns a new dict each call; raises InvalidEstimate for an
+        unreadable weight or dimensions.
+        """
+        limit = self.config['max_input_length']
+        result = self._cached(str(service or '').strip().lower()[:limit], str(origin or '')[:limit],
+                              str(destination or '')[:limit], str(weight or '')[:limit],
+                              str(dimensions or '')[:limit], str(urgency or '').strip().lower()[:limit])
+        return dict(result) if result is not None else None
+
+    def _estimate(self, service, origin, destination, weight, dimensions, urgency):
+        if service not in self.services:
+            return None
+        kilograms = parse_weight(weight) or 0.0
+        sides = parse_dimensions(dimensions)
+        volumetric = sides[0] * sides[1] * sides[2] / self.divisor if sides else 0.0
+        chargeable = max(kilograms, volumetric)
+        if chargeable <= 0 or chargeable > self.config['max_weight']:
+            return None
+        origin_code, destination_code = self.place(origin), self.place(destination)
+        if origin_code is None or destination_code is None:
+            return None
+        lane = self.lane(service, origin_code, destination_code)
+        if lane is None:
+            return None
+        # No or an unknown urgency is priced as standard
+        urgency = urgency if urgency in self.urgency else 'standard'
+        factor = self.urgency.get(urgency, 1.0)
+        step = self.config['round_to']
+        return {
+            'price': math.ceil(lane.charge(chargeable) * factor / step) * step,
+            'currency': self.currency,
+            'chargeable_weight': round(chargeable, 2),
+            'volumetric_weight': round(volumetric, 2),
+            'lane': f'{origin_code} → {destination_code}',
+            'service': service,
+            'urgency': urgency,
+        }
+
+    def cache_info(self):
+        return self._cached.cache_info()
+
+
+def load_rate_index(path, config=None):
+    """Read and index a rate file (raises OSError or InvalidRateTable)"""
+    with open(path, encoding='utf-8') as rates_file:
+        try:
+            table = json.load(rates_file)
+        except ValueError as e:
+            raise InvalidRateTable(str(e)) from None
+    return RateIndex(table, config)
+
+
+class PriceEstimator:
+    """The current RateIndex, reloaded when the rate file changes"""
+
+    def __init__(self, config=None):
+        self.config = dict(PRICING_CONFIG, **(config or {}))
+        self.index = None
+        self._mtime = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def _file_mtime(self):
+        try:
+            return os.stat(self.config['rates_file']).st_mtime_ns
+        except OSError:
+            return None
+
+    def load(self):
+        """(Re)read the rate file; returns whether a table is in use"""
+        with self._lock:
+            self._checked = time.monotonic()
+            mtime = self._file_mtime()
+            if mtime is None:
+                if self.index is None:
+                    logger.warning("No rate file at %s; price estimates are off", self.config['rates_file'])
+                return self.index is not None
+            try:
+                index = load_rate_index(self.config['rates_file'], self.config)
+            except (OSError, InvalidRateTable) as e:
+                logger.error("Keeping the previous rate table, %s is unusable: %s", self.config['rates_file'], e)
+            else:
+                self.index = index
+                logger.info("Loaded %s rate lanes from %s", len(index.lanes), self.config['rates_file'])
+            # Also on failure, so a broken file is not re-read on every check
+            self._mtime = mtime
+            return self.index is not None
+
+    def current(self):
+        """The rate index in use, after reloading it if the file changed"""
+        if time.monotonic() - self._checked >= self.config['check_interval']:
+            self._checked = time.monotonic()
+            if self._file_mtime() != self._mtime:
+                self.load()
+        return self.index
+
+    def estimate(self, data):
+        """Indicative price for quote form data (form field names), or None"""
+        index = self.current()
+        if index is None:
+            return None
+        return index.estimate(data.get('serviceType'), data.get('origin'), data.get('destination'),
+                              data.get('weight'), data.get('dimensions'), data.get('urgency'))
+
+
+estimator = PriceEstimator()
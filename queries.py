@@ -0,0 +1,167 @@
+"""
+JLK Transservice - Keyset-paginated reads of quotes and contacts
+
+Rows are listed newest first, ordered by (created_at, id). A page ends
+with an opaque cursor holding the last row's (created_at, id); the next
+page starts strictly after it with a row-value comparison, so every page
+is an index range scan of `limit` rows however deep it is (OFFSET would
+walk and discard every earlier row).
+
+The composite indexes created in init_database() put each filter column
+in front of created_at, so filtering and ordering use the same index.
+
+Pages are written out as JSON while the cursor is read, a chunk of rows
+at a time, so memory does not grow with the page size.
+"""
+
+import base64
+import datetime
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Read API configuration
+QUERY_CONFIG = {
+    'default_limit': 50,
+    'max_limit': 5000,
+    'fetch_size': 200,  # rows serialized per chunk of output
+}
+
+# table -> columns that may be filtered by exact value
+FILTER_COLUMNS = {
+    'quotes': ('status', 'service_type', 'urgency'),
+    'contacts': ('status',),
+}
+
+LIST_COLUMNS = {
+    'quotes': ('id', 'company_name', 'contact_name', 'email', 'phone', 'service_type',
+               'origin', 'destination', 'cargo_type', 'weight', 'dimensions', 'urgency',
+               'additional_services', 'description', 'attachment_hash', 'status', 'created_at'),
+    'contacts': ('id', 'name', 'email', 'subject', 'message', 'status', 'created_at'),
+}
+
+# Composite indexes backing the filters; created by init_database()
+LIST_INDEXES = (
+    ('idx_quotes_created', 'quotes', ('created_at', 'id')),
+    ('idx_quotes_status_created', 'quotes', ('status', 'created_at', 'id')),
+    ('idx_quotes_service_created', 'quotes', ('service_type', 'created_at', 'id')),
+    ('idx_quotes_urgency_created', 'quotes', ('urgency', 'created_at', 'id')),
+    ('idx_contacts_created', 'contacts', ('created_at', 'id')),
+    ('idx_contacts_status_created', 'contacts', ('status', 'created_at', 'id')),
+)
+
+TIMESTAMP_FORMATS = ('%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d')
+
+
+class InvalidQuery(ValueError):
+    """A list request parameter could not be understood"""
+
+
+def init_list_indexes(cursor):
+    """Create the composite indexes used by the list endpoints"""
+    for name, table, columns in LIST_INDEXES:
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})")
+
+
+def encode_cursor(created_at, row_id):
+    """Opaque page cursor for the row a page ended on"""
+    raw = json.dumps([created_at, row_id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    """(created_at, id) from a cursor made by encode_cursor"""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        created_at, row_id = json.loads(raw)
+    except (ValueError, TypeError):
+        raise InvalidQuery('invalid cursor')
+    if not isinstance(created_at, str) or not isinstance(row_id, int):
+        raise InvalidQuery('invalid cursor')
+    return created_at, row_id
+
+
+def parse_timestamp(value):
+    """Normalize an ISO date/time to the 'YYYY-MM-DD HH:MM:SS' form SQLite stores"""
+    for fmt in TIMESTAMP_FORMATS:
+        try:
+            return datetime.datetime.strptime(value, fmt).strftime('%Y-%m-%d %H:%M:%S')
+        except ValueError:
+            continue
+    raise InvalidQuery(f'invalid timestamp {value!r}')
+
+
+def parse_limit(value):
+    if value is None or value == '':
+        return QUERY_CONFIG['default_limit']
+    try:
+        limit = int(value)
+    except ValueError:
+        raise InvalidQuery('invalid limit')
+    if limit < 1:
+        raise InvalidQuery('invalid limit')
+    return min(limit, QUERY_CONFIG['max_limit'])
+
+
+def build_list_query(table, args):
+    """SQL and parameters for one page of `table` from request args; returns (sql, params, limit)"""
+    where, params = [], []
+    for column in FILTER_COLUMNS[table]:
+        value = args.get(column)
+        if value:
+            where.append(f'{column} = ?')
+            params.append(value)
+    if args.get('created_from'):
+        where.append('created_at >= ?')
+        params.append(parse_timestamp(args['created_from']))
+    if args.get('created_to'):
+        where.append('created_at < ?')
+        params.append(parse_timestamp(args['created_to']))
+    if args.get('cursor'):
+        where.append('(created_at, id) < (?, ?)')
+        params.extend(decode_cursor(args['cursor']))
+
+    limit = parse_limit(args.get('limit'))
+    sql = f"SELECT {', '.join(LIST_COLUMNS[table])} FROM {table}"
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    # One extra row tells us whether there is a next page
+    sql += ' ORDER BY created_at DESC, id DESC LIMIT ?'
+    params.append(limit + 1)
+    return sql, params, limit
+
+
+def stream_page(db, table, args):
+    """Yield one page of rows as chunks of a JSON document
+
+    Rows come from db.iter_batches(), read while the response is being
+    sent: on PostgreSQL through a server-side cursor on a connection the
+    generator holds until it finishes, so neither the page nor the
+    request's pooled connection (released at teardown) is involved.
+    """
+    sql, params, limit = build_list_query(table, args)
+    columns = LIST_COLUMNS[table]
+    created_at, row_id = columns.index('created_at'), columns.index('id')
+
+    def generate():
+        yield f'{{"success":true,"table":"{table}","items":['
+        sent, last, more = 0, None, False
+        batches = db.iter_batches(sql, params, QUERY_CONFIG['fetch_size'])
+        try:
+            for rows in batches:
+                # The query asks for one row past the page to know whether there is a next one
+                if sent + len(rows) > limit:
+                    rows, more = rows[:limit - sent], True
+                if rows:
+                    chunk = ','.join(json.dumps(dict(zip(columns, row)), ensure_ascii=False) for row in rows)
+                    yield (',' if sent else '') + chunk
+                    sent += len(rows)
+                    last = rows[-1]
+                if more:
+                    break
+        finally:
+            batches.close()
+        next_cursor = encode_cursor(last[created_at], last[row_id]) if more and last is not None else None
+        yield f'],"count":{sent},"next_cursor":{json.dumps(next_cursor)}}}'
+    return generate()
@@ -0,0 +1,151 @@
+"""
+JLK Transservice - Rate limiting for the form endpoints
+
+Token buckets keyed by client IP and by submitted email address, checked
+before a form is validated, so a bot or a stuck double-click is turned
+away before it costs an image write, a DB transaction or an SMTP login.
+
+The buckets live in a small memory-mapped file (`path`) shared by every
+gunicorn/uvicorn worker on the host: a fixed table of `slots` entries,
+each holding the key's hash, its token count and when it was last
+refilled. A check is a hash, an flock() around a 24-byte read-modify-
+write and no I/O, i.e. a few microseconds. Keys that hash to the same
+slot probe a few neighbours; a key whose bucket has fully refilled is
+free to be reused. Without fcntl (Windows) the table is per process.
+"""
+
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # no flock(); buckets are then kept per process
+    fcntl = None
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Rate limit configuration
+RATE_LIMIT_CONFIG = {
+    'enabled': os.environ.get('RATE_LIMIT', '1') != '0',
+    'path': os.environ.get('RATE_LIMIT_FILE', 'build/rate_limit.bin'),  # shared by all workers on the host
+    'slots': 16384,
+    'probes': 4,  # neighbouring slots tried when a slot belongs to another key
+    'ip_burst': int(os.environ.get('RATE_LIMIT_IP_BURST', '10')),
+    'ip_per_minute': float(os.environ.get('RATE_LIMIT_IP_PER_MINUTE', '6')),
+    'email_burst': int(os.environ.get('RATE_LIMIT_EMAIL_BURST', '5')),
+    'email_per_minute': float(os.environ.get('RATE_LIMIT_EMAIL_PER_MINUTE', '1')),
+    # Behind nginx/Apache the client is the last X-Forwarded-For address
+    'trust_forwarded_for': os.environ.get('RATE_LIMIT_TRUST_FORWARDED_FOR', '0') == '1',
+}
+
+# key hash, tokens, last refill (unix time)
+_SLOT = struct.Struct('<Qdd')
+
+
+def client_address(remote_addr, forwarded_for=None):
+    """The address to limit on: the peer, or the one our proxy appended to X-Forwarded-For"""
+    if RATE_LIMIT_CONFIG['trust_forwarded_for'] and forwarded_for:
+        return forwarded_for.split(',')[-1].strip()
+    return remote_addr or ''
+
+
+class RateLimiter:
+    """Token buckets in a memory-mapped table shared across worker processes"""
+
+    def __init__(self, config=None):
+        self.config = dict(RATE_LIMIT_CONFIG, **(config or {}))
+        self._lock = threading.Lock()
+        self._table = None
+        self._fd = None
+        self._pid = None
+
+    def _open(self):
+        """Map the shared table (once per process: flock needs this process's own descriptor)"""
+        size = self.config['slots'] * _SLOT.size
+        if fcntl is None:
+            self._table = bytearray(size)
+            return
+        directory = os.path.dirname(self.config['path'])
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        fd = os.open(self.config['path'], os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        self._fd = fd
+        self._table = mmap.mmap(fd, size)
+
+    def _take(self, key, capacity, per_second):
+        """Take a token from key's bucket; returns 0 or the seconds until one is available"""
+        key_hash = int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little') or 1
+        slots = self.config['slots']
+        full_after = capacity / per_second  # an idle bucket is full again after this long
+        now = time.time()
+        table = self._table
+        chosen = None
+        for probe in range(self.config['probes']):
+            offset = ((key_hash + probe) % slots) * _SLOT.size
+            owner, tokens, updated = _SLOT.unpack_from(table, offset)
+            if owner == key_hash:
+                chosen = offset
+                tokens = min(capacity, tokens + (now - updated) * per_second)
+                break
+            if chosen is None and (owner == 0 or now - updated >= full_after):
+                chosen = offset
+        else:
+            if chosen is None:
+                # Every probed slot is busy: share the first one rather than not limiting
+                chosen = (key_hash % slots) * _SLOT.size
+                _, tokens, updated = _SLOT.unpack_from(table, chosen)
+                tokens = min(capacity, tokens + (now - updated) * per_second)
+            else:
+                tokens = capacity
+        if tokens < 1:
+            _SLOT.pack_into(table, chosen, key_hash, tokens, now)
+            return (1 - tokens) / per_second
+        _SLOT.pack_into(table, chosen, key_hash, tokens - 1, now)
+        return 0.0
+
+    def hit(self, key, capacity, per_minute):
+        """Count one request against key; returns 0 if allowed, else seconds to wait"""
+        with self._lock:
+            if self._pid != os.getpid():
+                self._open()
+                self._pid = os.getpid()
+            if self._fd is None:
+                return self._take(key, capacity, per_minute / 60.0)
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                return self._take(key, capacity, per_minute / 60.0)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def check(self, scope, kind, value):
+        """Apply the 'ip' or 'email' limit for one endpoint; returns seconds to wait, 0 if allowed"""
+        if not self.config['enabled'] or not value:
+            return 0.0
+        value = str(value).strip().lower()
+        try:
+            retry_after = self.hit(f'{scope}:{kind}:{value}', self.config[f'{kind}_burst'],
+                                   self.config[f'{kind}_per_minute'])
+        except OSError as e:
+            # Never turn customers away because the table is unavailable
+            logger.error("Rate limit check failed: %s", e)
+            return 0.0
+        if retry_after:
+            metrics.inc('jlk_rate_limited_total', (('scope', scope), ('key', kind)))
+        return retry_after
+
+
+# Process-wide limiter used by app.py and asgi.py
+limiter = RateLimiter()
@@ -0,0 +1,236 @@
+"""
+JLK Transservice - Full-text search over quotes and contacts
+
+Each table has an external-content FTS5 index (quotes_fts, contacts_fts)
+that stores only the index, not a second copy of the text; triggers keep
+it in step with every INSERT, UPDATE and DELETE, and a 'rebuild' backfills
+rows that existed before the index did.
+
+The trigram tokenizer indexes every three-character sequence instead of
+words. Thai is written without spaces between words, so a word tokenizer
+would treat a whole phrase as one token; with trigrams "ขนส่ง" matches
+inside "บริษัทขนส่งไทย" just like a substring search, but through the
+index. Terms shorter than three characters cannot use the trigram index
+and are applied as a LIKE filter on the matched rows instead.
+
+Results are ranked by bm25 with per-column weights (company names count
+more than free-text descriptions) and carry an HTML-escaped snippet with
+the matches wrapped in <mark>. Every match is scored, so an old quote is
+found as readily as a new one; the ranking query keeps only the top
+`limit` ids, and snippets (the expensive part) are built for those alone.
+
+bm25 depends on each index's own term statistics and column weights, so
+a quotes score and a contacts score cannot be compared. Each table is
+ranked on its own and the two lists are interleaved, best of each first.
+"""
+
+import html
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# Search configuration
+SEARCH_CONFIG = {
+    'default_limit': 20,
+    'max_limit': 100,
+    'snippet_tokens': 64,  # trigram tokens are roughly characters; 64 is the FTS5 maximum
+    'min_term_length': 3,  # shorter terms fall back to LIKE
+}
+
+# table -> (indexed column, bm25 weight), in FTS column order
+SEARCH_COLUMNS = {
+    'quotes': (
+        ('company_name', 10.0),
+        ('contact_name', 5.0),
+        ('email', 5.0),
+        ('cargo_type', 3.0),
+        ('origin', 2.0),
+        ('destination', 2.0),
+        ('description', 1.0),
+    ),
+    'contacts': (
+        ('name', 10.0),
+        ('email', 5.0),
+        ('subject', 3.0),
+        ('message', 1.0),
+    ),
+}
+
+# Columns returned with each hit besides the snippet
+RESULT_COLUMNS = {
+    'quotes': ('id', 'company_name', 'contact_name', 'service_type', 'origin', 'destination',
+               'status', 'created_at'),
+    'contacts': ('id', 'name', 'email', 'subject', 'status', 'created_at'),
+}
+
+# "a phrase" or a bare word
+QUERY_TERM = re.compile(r'"([^"]*)"?|([^\s"]+)')
+
+# Private-use characters mark matches until the snippet has been HTML-escaped
+_MARK_OPEN = '\ue000'
+_MARK_CLOSE = '\ue001'
+
+
+class InvalidSearch(ValueError):
+    """The search request cannot be run"""
+
+
+def _fts_table(table):
+    return f'{table}_fts'
+
+
+def init_search(cursor):
+    """Create the FTS5 indexes and sync triggers, backfilling rows that predate them"""
+    for table, columns in SEARCH_COLUMNS.items():
+        fts = _fts_table(table)
+        names = [column for column, _ in columns]
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (fts,))
+        exists = cursor.fetchone() is not None
+        cursor.execute(f'''
+            CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+                {', '.join(names)},
+                content='{table}', content_rowid='id', tokenize='trigram'
+            )
+        ''')
+
+        column_list = ', '.join(names)
+        new_values = ', '.join(f'new.{column}' for column in names)
+        old_values = ', '.join(f'old.{column}' for column in names)
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_fts_insert AFTER INSERT ON {table} BEGIN
+                INSERT INTO {fts} (rowid, {column_list}) VALUES (new.id, {new_values});
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_fts_delete AFTER DELETE ON {table} BEGIN
+                INSERT INTO {fts} ({fts}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_fts_update AFTER UPDATE OF {column_list} ON {table} BEGIN
+                INSERT INTO {fts} ({fts}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+                INSERT INTO {fts} (rowid, {column_list}) VALUES (new.id, {new_values});
+            END
+        ''')
+        if not exists:
+            cursor.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+            logger.info("Built search index %s", fts)
+
+
+def _require_fts(db):
+    if db.dialect != 'sqlite':
+        raise InvalidSearch(f'full-text search is not available on {db.dialect}')
+
+
+def rebuild_search(db):
+    """Rebuild both FTS indexes from their tables"""
+    _require_fts(db)
+    with db.transaction() as cursor:
+        for table in SEARCH_COLUMNS:
+            fts = _fts_table(table)
+            cursor.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+            cursor.execute(f"INSERT INTO {fts} ({fts}) VALUES ('optimize')")
+
+
+def parse_terms(text):
+    """Split a query into (indexed terms, short terms); "quoted text" stays one term"""
+    terms = [(phrase or word).strip() for phrase, word in QUERY_TERM.findall(text or '')]
+    terms = [term for term in terms if term]
+    if not terms:
+        raise InvalidSearch('empty query')
+    minimum = SEARCH_CONFIG['min_term_length']
+    return ([term for term in terms if len(term) >= minimum],
+            [term for term in terms if len(term) < minimum])
+
+
+def match_expression(terms):
+    """FTS5 query requiring every term, each as a quoted string (no query syntax)"""
+    return ' AND '.join('"' + term.replace('"', '""') + '"' for term in terms)
+
+
+def _like_pattern(term):
+    escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'%{escaped}%'
+
+
+def build_search_query(table, indexed, short, limit):
+    """SQL and parameters for the ranked hits of one table"""
+    fts = _fts_table(table)
+    columns = SEARCH_COLUMNS[table]
+    weights = ', '.join(str(weight) for _, weight in columns)
+    selected = ', '.join(f't.{column}' for column in RESULT_COLUMNS[table])
+    short_where, short_params = [], []
+    for term in short:
+        short_where.append('(' + ' OR '.join(f"t.{column} LIKE ? ESCAPE '\\'" for column, _ in columns) + ')')
+        short_params.extend([_like_pattern(term)] * len(columns))
+    if not indexed:
+        # Nothing long enough for the trigram index: plain scan, newest first
+        snippet = f"substr(coalesce(t.{columns[-1][0]}, ''), 1, {SEARCH_CONFIG['snippet_tokens']})"
+        sql = (f'SELECT {selected}, 0 AS score, {snippet} AS snippet FROM {table} t '
+               f"WHERE {' AND '.join(short_where)} ORDER BY t.id DESC LIMIT ?")
+        return sql, short_params + [limit]
+
+    # Score every match and keep the best `limit` ids, then build snippets for those only
+    expression = match_expression(indexed)
+    ranked = (f'SELECT {fts}.rowid AS id, bm25({fts}, {weights}) AS score FROM {fts} '
+              + (f'JOIN {table} t ON t.id = {fts}.rowid ' if short else '')
+              + f"WHERE {' AND '.join([f'{fts} MATCH ?'] + short_where)} "
+              'ORDER BY score, id DESC LIMIT ?')
+    snippet = (f"snippet({fts}, -1, '{_MARK_OPEN}', '{_MARK_CLOSE}', '…', "
+               f"{SEARCH_CONFIG['snippet_tokens']})")
+    sql = (f'SELECT {selected}, ranked.score AS score, {snippet} AS snippet FROM ({ranked}) ranked '
+           # CROSS JOIN keeps the few ranked ids as the outer loop (a rowid lookup in the index each)
+           f'CROSS JOIN {table} t ON t.id = ranked.id CROSS JOIN {fts} ON {fts}.rowid = ranked.id '
+           f'WHERE {fts} MATCH ? ORDER BY ranked.score, ranked.id DESC')
+    return sql, [expression] + short_params + [limit, expression]
+
+
+def interleave(ranked_lists, limit):
+    """Merge per-table ranked lists by taking the next best of each in turn"""
+    merged = []
+    for position in range(max(map(len, ranked_lists), default=0)):
+        merged.extend(hits[position] for hits in ranked_lists if position < len(hits))
+    return merged[:limit]
+
+
+def highlight(snippet):
+    """HTML-escape a snippet and turn the match markers into <mark> tags"""
+    escaped = html.escape(snippet or '')
+    return escaped.replace(_MARK_OPEN, '<mark>').replace(_MARK_CLOSE, '</mark>')
+
+
+def parse_limit(value):
+    if value is None or value == '':
+        return SEARCH_CONFIG['default_limit']
+    try:
+        limit = int(value)
+    except ValueError:
+        raise InvalidSearch('invalid limit')
+    if limit < 1:
+        raise InvalidSearch('invalid limit')
+    return min(limit, SEARCH_CONFIG['max_limit'])
+
+
+def search(db, text, tables=None, limit=None):
+    """Ranked hits across the given tables (each table's best first, interleaved) as dicts"""
+    _require_fts(db)
+    indexed, short = parse_terms(text)
+    limit = parse_limit(limit)
+    tables = tables or tuple(SEARCH_COLUMNS)
+    conn = db.connection()
+    ranked_lists = []
+    for table in tables:
+        if table not in SEARCH_COLUMNS:
+            raise InvalidSearch(f'unknown type {table!r}')
+        sql, params = build_search_query(table, indexed, short, limit)
+        hits = []
+        for row in conn.execute(sql, params):
+            hit = {column: row[column] for column in RESULT_COLUMNS[table]}
+            hit['type'] = table
+            hit['rank'] = row['score']
+            hit['snippet'] = highlight(row['snippet'])
+            hits.append(hit)
+        ranked_lists.append(hits)
+    # rank is the table's own bm25 score (negative; lower is better), not comparable across tables
+    return interleave(ranked_lists, limit)
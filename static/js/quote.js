@@ -6,6 +6,7 @@ document.addEventListener('DOMContentLoaded', function() {
     checkForSuccessMessage();
     initializeAnimations();
     setupImagePreview();
+    setupPriceEstimate();
 });
 
 // Setup toast container if not exists
@@ -244,6 +245,74 @@ function submitForm() {
     });
 }
 
+// Instant indicative price while the form is filled in
+const ESTIMATE_FIELDS = ['serviceType', 'origin', 'destination', 'weight', 'dimensions', 'urgency'];
+let estimateTimer = null;
+let estimateRequest = 0;
+
+function setupPriceEstimate() {
+    const form = document.getElementById('quote-form');
+    if (!form) return;
+
+    ESTIMATE_FIELDS.forEach(fieldName => {
+        const field = form.querySelector(`[name="${fieldName}"]`);
+        if (field) {
+            field.addEventListener('input', scheduleEstimate);
+            field.addEventListener('change', scheduleEstimate);
+        }
+    });
+    form.addEventListener('reset', () => showEstimate(null));
+}
+
+function scheduleEstimate() {
+    clearTimeout(estimateTimer);
+    estimateTimer = setTimeout(requestEstimate, 250);
+}
+
+function requestEstimate() {
+    const form = document.getElementById('quote-form');
+    const params = new URLSearchParams();
+    ESTIMATE_FIELDS.forEach(fieldName => {
+        const field = form.querySelector(`[name="${fieldName}"]`);
+        if (field && field.value.trim()) {
+            params.set(fieldName, field.value.trim());
+        }
+    });
+
+    // Only the answer to the latest keystroke is shown
+    const requestId = ++estimateRequest;
+    fetch(`/api/estimate?${params.toString()}`)
+        .then(response => response.json())
+        .then(data => {
+            if (requestId === estimateRequest) {
+                showEstimate(data.success ? data.estimate : null);
+            }
+        })
+        .catch(() => {
+            if (requestId === estimateRequest) {
+                showEstimate(null);
+            }
+        });
+}
+
+function showEstimate(estimate) {
+    const box = document.getElementById('price-estimate');
+    if (!box) return;
+
+    if (!estimate) {
+        box.classList.add('hidden');
+        box.textContent = '';
+        return;
+    }
+    const price = estimate.price.toLocaleString('th-TH');
+    box.innerHTML = `
+        <p class="font-semibold">ราคาประเมินเบื้องต้น: ${price} ${estimate.currency}</p>
+        <p class="text-sm mt-1">เส้นทาง ${estimate.lane} · น้ำหนักคิดราคา ${estimate.chargeable_weight} กก.
+        (ราคาจริงจะแจ้งในใบเสนอราคา)</p>
+    `;
+    box.classList.remove('hidden');
+}
+
 // Reset submit button state
 function resetSubmitButton(button) {
     if (button) {
@@ -0,0 +1,244 @@
+"""
+JLK Transservice - Fingerprinted, precompressed static assets
+
+`flask --app app build-assets` copies every file under static/ and public/
+into the build directory under a content-hashed name
+(static/css/style.css -> static/css/style.3f2a1b9c0d4e.css), writes .gz
+and .br siblings for text assets and records the mapping in manifest.json.
+
+At runtime AssetServer loads the manifest once, rewrites asset references
+in the HTML pages to the hashed URLs, and serves assets itself: it picks
+the smallest encoding the client accepts, answers If-None-Match with a
+bodyless 304, and marks hashed URLs immutable for a year since their
+content can never change. Bodies go out through send_file, so gunicorn
+hands them to sendfile() (or the front proxy does, with USE_X_SENDFILE).
+
+Without a manifest (build step not run) nothing is rewritten and the
+routes fall back to plain send_from_directory.
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import re
+import tempfile
+import threading
+
+from flask import Response, request, send_file
+
+try:
+    import brotli
+except ImportError:  # optional; .br variants are skipped without it
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Static asset build/serving configuration
+ASSET_CONFIG = {
+    'source_dirs': ('static', 'public'),
+    'exclude_dirs': ('static/uploads',),  # user content is served by the blob store
+    'build_dir': os.environ.get('ASSET_BUILD_DIR', 'build/assets'),
+    'hash_length': 12,  # hex characters of SHA-256 in fingerprinted names
+    'compress_extensions': {'css', 'js', 'svg', 'html', 'txt', 'json', 'xml', 'ico', 'map'},
+    'min_compress_size': 256,  # bytes; smaller files are not worth a variant
+    'gzip_level': 9,
+    'brotli_quality': 11,
+    'cache_max_age': 365 * 24 * 3600,  # seconds, for fingerprinted URLs
+}
+
+MANIFEST_NAME = 'manifest.json'
+
+# Preferred order when the client accepts several encodings equally
+ENCODING_SUFFIXES = (
+    ('br', '.br'),
+    ('gzip', '.gz'),
+)
+
+# src="static/..." and href="/public/..." references in the HTML pages
+# (no leading \b: it makes the scan try every position of the page)
+ASSET_REFERENCE = re.compile(r'''(?P<attr>(?:src|href)=["'])(?P<slash>/?)(?P<path>(?:static|public)/[^"'?#]+)''')
+
+
+def fingerprint_name(path, digest):
+    """'static/css/style.css' -> 'static/css/style.<digest>.css'"""
+    directory, name = os.path.split(path)
+    stem, extension = os.path.splitext(name)
+    return os.path.join(directory, f'{stem}.{digest}{extension}').replace(os.sep, '/')
+
+
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    with os.fdopen(fd, 'wb') as tmp:
+        tmp.write(data)
+    os.replace(tmp_path, path)
+
+
+def _source_files(config):
+    excluded = tuple(os.path.normpath(path) for path in config['exclude_dirs'])
+    for source_dir in config['source_dirs']:
+        for root, dirs, files in os.walk(source_dir):
+            dirs[:] = sorted(d for d in dirs
+                             if not d.startswith('.') and os.path.normpath(os.path.join(root, d)) not in excluded)
+            for name in sorted(files):
+                if not name.startswith('.'):
+                    yield os.path.join(root, name).replace(os.sep, '/')
+
+
+def compress_variants(data, config=None):
+    """Yield (encoding, suffix, bytes) for each variant smaller than the original"""
+    config = config or ASSET_CONFIG
+    candidates = {'gzip': lambda: gzip.compress(data, config['gzip_level'], mtime=0)}
+    if brotli is not None:
+        candidates['br'] = lambda: brotli.compress(data, quality=config['brotli_quality'])
+    for encoding, suffix in ENCODING_SUFFIXES:
+        if encoding in candidates:
+            compressed = candidates[encoding]()
+            if len(compressed) < len(data):
+                yield encoding, suffix, compressed
+
+
+def build_assets(config=None):
+    """Fingerprint and precompress every static asset; returns the manifest"""
+    config = dict(ASSET_CONFIG, **(config or {}))
+    build_dir = config['build_dir']
+    manifest = {}
+    for path in _source_files(config):
+        with open(path, 'rb') as source:
+            data = source.read()
+        digest = hashlib.sha256(data).hexdigest()[:config['hash_length']]
+        hashed = fingerprint_name(path, digest)
+        entry = {'url': hashed, 'etag': digest, 'size': len(data), 'encodings': {}}
+
+        # Hashed names never collide with other content, so earlier builds can stay
+        # in place for workers that still hold the previous manifest
+        target = os.path.join(build_dir, hashed)
+        if not os.path.exists(target):
+            _write_atomic(target, data)
+        extension = path.rsplit('.', 1)[-1].lower()
+        if extension in config['compress_extensions'] and len(data) >= config['min_compress_size']:
+            for encoding, suffix, compressed in compress_variants(data, config):
+                if not os.path.exists(target + suffix):
+                    _write_atomic(target + suffix, compressed)
+                entry['encodings'][encoding] = len(compressed)
+        manifest[path] = entry
+
+    _write_atomic(os.path.join(build_dir, MANIFEST_NAME),
+                  json.dumps({'assets': manifest}, indent=2, sort_keys=True).encode('utf-8'))
+    logger.info("Built %s static assets into %s", len(manifest), build_dir)
+    return manifest
+
+
+def negotiate_encoding(available):
+    """Best of the available encodings for the request's Accept-Encoding, or None for identity"""
+    accept = request.accept_encodings
+    best, best_quality = None, 0
+    for encoding in available:  # in preference order; ties keep the earlier one
+        quality = accept.quality(encoding)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    if best is not None and accept.quality('identity') > best_quality:
+        return None
+    return best
+
+
+class _Asset:
+    __slots__ = ('path', 'mimetype', 'etag', 'encodings')
+
+    def __init__(self, path, mimetype, etag, encodings):
+        self.path = path
+        self.mimetype = mimetype
+        self.etag = etag
+        self.encodings = encodings  # encoding -> (file path, etag), in preference order
+
+
+class AssetServer:
+    """Serves fingerprinted assets from the build manifest"""
+
+    def __init__(self, config=None):
+        self.config = dict(ASSET_CONFIG, **(config or {}))
+        self._routes = None  # url path -> (_Asset, immutable)
+        self._urls = {}  # source path -> fingerprinted path
+        self._lock = threading.Lock()
+
+    def load(self):
+        """(Re)read manifest.json; returns the number of assets available"""
+        build_dir = self.config['build_dir']
+        try:
+            with open(os.path.join(build_dir, MANIFEST_NAME), encoding='utf-8') as manifest_file:
+                manifest = json.load(manifest_file)['assets']
+        except FileNotFoundError:
+            manifest = {}
+        except (ValueError, KeyError) as e:
+            logger.error("Ignoring unreadable asset manifest: %s", e)
+            manifest = {}
+
+        routes, urls = {}, {}
+        for path, entry in manifest.items():
+            target = os.path.abspath(os.path.join(build_dir, entry['url']))
+            # Each representation gets its own strong ETag
+            encodings = {encoding: (target + suffix, f"{entry['etag']}-{suffix[1:]}")
+                         for encoding, suffix in ENCODING_SUFFIXES if encoding in entry['encodings']}
+            mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+            asset = _Asset(target, mimetype, entry['etag'], encodings)
+            routes[entry['url']] = (asset, True)
+            routes[path] = (asset, False)
+            urls[path] = entry['url']
+        with self._lock:
+            self._routes, self._urls = routes, urls
+        return len(urls)
+
+    def _loaded_routes(self):
+        if self._routes is None:
+            self.load()
+        return self._routes
+
+    def url_for(self, path):
+        """Fingerprinted path for a source path, or the path itself if unknown"""
+        self._loaded_routes()
+        return self._urls.get(path, path)
+
+    def rewrite_html(self, html):
+        """Point static/ and public/ references in a page at their fingerprinted URLs"""
+        if not self._loaded_routes():
+            return html
+        urls = self._urls
+
+        def replace(match):
+            hashed = urls.get(match.group('path'))
+            if hashed is None:
+                return match.group(0)
+            return match.group('attr') + match.group('slash') + hashed
+        return ASSET_REFERENCE.sub(replace, html)
+
+    def serve(self, path):
+        """Response for an asset URL path (e.g. 'static/css/style.css'), or None if unknown"""
+        route = self._loaded_routes().get(path)
+        if route is None:
+            return None
+        asset, immutable = route
+        encoding = negotiate_encoding(asset.encodings)
+        file_path, etag = asset.encodings[encoding] if encoding else (asset.path, asset.etag)
+
+        if request.if_none_match.contains(etag):
+            # Answer revalidation without touching the file
+            response = Response(status=304)
+            response.set_etag(etag)
+        else:
+            response = send_file(file_path, mimetype=asset.mimetype, etag=etag, conditional=True)
+            if encoding is not None:
+                response.headers['Content-Encoding'] = encoding
+        if asset.encodings:
+            response.headers['Vary'] = 'Accept-Encoding'
+        # Set as plain strings; going through response.cache_control re-parses the header
+        if immutable:
+            response.headers['Cache-Control'] = f"public, max-age={self.config['cache_max_age']}, immutable"
+        else:
+            # Unversioned URL: cache, but revalidate with the ETag every time
+            response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+assets = AssetServer()
@@ -0,0 +1,328 @@
+"""
+JLK Transservice - Quote analytics from incrementally maintained rollups
+
+quote_rollups holds quote counts per (granularity, bucket, dimension,
+value, status), for hourly and daily buckets of created_at and for the
+dimensions service_type, urgency, lane (origin → destination) and 'all'.
+Triggers on quotes keep it current: an insert adds one to each of the
+eight rows it falls into, and a change of status (or of any rolled-up
+column) or a delete moves the counts, so conversion by status is always
+counted against the day the quote arrived.
+
+/api/stats reads only the rollup rows of the requested range, so its cost
+depends on the number of buckets and values shown, not on how many quotes
+there are. Answers are cached in memory for `cache_ttl` seconds per
+worker. rebuild_stats() recomputes everything from the quotes table.
+"""
+
+import datetime
+import logging
+import os
+import threading
+import time
+
+from metrics import metrics
+from queries import InvalidQuery, parse_timestamp
+
+logger = logging.getLogger(__name__)
+
+# Analytics configuration
+STATS_CONFIG = {
+    'cache_ttl': float(os.environ.get('STATS_CACHE_TTL', '60')),  # seconds
+    'cache_size': 256,  # distinct queries remembered
+    'default_buckets': {'hour': 48, 'day': 30},  # range shown when from/to are not given
+    'max_buckets': {'hour': 24 * 31, 'day': 366 * 2},
+    'default_top': 20,  # values listed per dimension, by quote count
+    'max_top': 200,
+}
+
+GRANULARITIES = ('hour', 'day')
+DIMENSIONS = ('all', 'service_type', 'urgency', 'lane')
+
+# Bucket start of a created_at value, per backend; same 'YYYY-MM-DD HH:MM:SS' text as created_at
+_BUCKET_SQL = {
+    'sqlite': {
+        'hour': "strftime('%Y-%m-%d %H:00:00', {ts})",
+        'day': "strftime('%Y-%m-%d 00:00:00', {ts})",
+    },
+    'postgresql': {
+        'hour': "to_char({ts}, 'YYYY-MM-DD HH24:00:00')",
+        'day': "to_char({ts}, 'YYYY-MM-DD 00:00:00')",
+    },
+}
+
+_VALUE_SQL = {
+    'all': "''",
+    'service_type': "coalesce({row}service_type, '')",
+    'urgency': "coalesce({row}urgency, '')",
+    'lane': "coalesce({row}origin, '') || ' → ' || coalesce({row}destination, '')",
+}
+
+# Columns whose change moves a quote between rollup rows
+_ROLLUP_COLUMNS = ('created_at', 'status', 'service_type', 'urgency', 'origin', 'destination')
+
+_UPSERT = '''
+    ON CONFLICT (granularity, dimension, bucket, value, status)
+    DO UPDATE SET quotes = quote_rollups.quotes + excluded.quotes
+'''
+
+
+class InvalidStats(ValueError):
+    """The stats request cannot be answered"""
+
+
+def _rollup_values(dialect, row, sign):
+    """VALUES tuples adding `sign` to the eight rollup rows of one quote (row is 'new.' or 'old.')"""
+    values = []
+    for granularity in GRANULARITIES:
+        bucket = _BUCKET_SQL[dialect][granularity].format(ts=f'{row}created_at')
+        for dimension in DIMENSIONS:
+            value = _VALUE_SQL[dimension].format(row=row)
+            values.append(f"('{granularity}', '{dimension}', {bucket}, {value}, "
+                          f"coalesce({row}status, ''), {sign})")
+    return values
+
+
+def _change_sql(dialect, row, sign):
+    return ('INSERT INTO quote_rollups (granularity, dimension, bucket, value, status, quotes) VALUES '
+            + ', '.join(_rollup_values(dialect, row, sign)) + _UPSERT)
+
+
+def _backfill_sql(dialect):
+    """Rollups of every quote, computed with one GROUP BY per granularity and dimension"""
+    selects = []
+    for granularity in GRANULARITIES:
+        bucket = _BUCKET_SQL[dialect][granularity].format(ts='created_at')
+        for dimension in DIMENSIONS:
+            value = _VALUE_SQL[dimension].format(row='')
+            selects.append(f"SELECT '{granularity}', '{dimension}', {bucket}, {value}, coalesce(status, ''), "
+                           f'COUNT(*) FROM quotes WHERE created_at IS NOT NULL '
+                           f'GROUP BY 3, 4, 5')
+    return ('INSERT INTO quote_rollups (granularity, dimension, bucket, value, status, quotes) '
+            + ' UNION ALL '.join(selects))
+
+
+def init_stats(cursor, dialect='sqlite'):
+    """Create quote_rollups and the triggers maintaining it, and fill it from existing quotes"""
+    cursor.execute('''
+        CREATE TABLE quote_rollups (
+            granularity TEXT NOT NULL,
+            dimension TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            value TEXT NOT NULL,
+            status TEXT NOT NULL,
+            quotes INTEGER NOT NULL,
+            PRIMARY KEY (granularity, dimension, bucket, value, status)
+        )
+    ''')
+    watched = ', '.join(_ROLLUP_COLUMNS)
+    moved = ' OR '.join(f'old.{column} IS NOT new.{column}' if dialect == 'sqlite'
+                        else f'OLD.{column} IS DISTINCT FROM NEW.{column}' for column in _ROLLUP_COLUMNS)
+    if dialect == 'sqlite':
+        cursor.execute(f'''
+            CREATE TRIGGER quotes_rollup_insert AFTER INSERT ON quotes
+            WHEN new.created_at IS NOT NULL BEGIN
+                {_change_sql(dialect, 'new.', 1)};
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER quotes_rollup_delete AFTER DELETE ON quotes
+            WHEN old.created_at IS NOT NULL BEGIN
+                {_change_sql(dialect, 'old.', -1)};
+            END
+        ''')
+        # Two update triggers so each side can skip a NULL created_at on its own
+        cursor.execute(f'''
+            CREATE TRIGGER quotes_rollup_update_old AFTER UPDATE OF {watched} ON quotes
+            WHEN old.created_at IS NOT NULL AND ({moved}) BEGIN
+                {_change_sql(dialect, 'old.', -1)};
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER quotes_rollup_update_new AFTER UPDATE OF {watched} ON quotes
+            WHEN new.created_at IS NOT NULL AND ({moved}) BEGIN
+                {_change_sql(dialect, 'new.', 1)};
+            END
+        ''')
+    else:
+        cursor.execute(f'''
+            CREATE FUNCTION quotes_rollup() RETURNS trigger LANGUAGE plpgsql AS $$
+            BEGIN
+                IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.created_at IS NOT NULL THEN
+                    {_change_sql(dialect, 'OLD.', -1)};
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.created_at IS NOT NULL THEN
+                    {_change_sql(dialect, 'NEW.', 1)};
+                END IF;
+                RETURN NULL;
+            END
+            $$
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER quotes_rollup_insert_delete AFTER INSERT OR DELETE ON quotes
+            FOR EACH ROW EXECUTE FUNCTION quotes_rollup()
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER quotes_rollup_update AFTER UPDATE OF {watched} ON quotes
+            FOR EACH ROW WHEN ({moved}) EXECUTE FUNCTION quotes_rollup()
+        ''')
+    cursor.execute(_backfill_sql(dialect))
+
+
+def rebuild_stats(db):
+    """Recompute quote_rollups from the quotes table"""
+    with db.transaction() as cursor:
+        if db.dialect == 'postgresql':
+            # Keep inserts out until the new counts are in; SQLite's write lock already does
+            cursor.execute('LOCK TABLE quotes IN SHARE MODE')
+        cursor.execute('DELETE FROM quote_rollups')
+        cursor.execute(_backfill_sql(db.dialect))
+    _cache.clear()
+
+
+class _TTLCache:
+    """Small thread-safe cache whose entries expire after `ttl` seconds"""
+
+    def __init__(self, ttl, size):
+        self.ttl = ttl
+        self.size = size
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return entry[1]
+
+    def put(self, key, value):
+        now = time.monotonic()
+        with self._lock:
+            if len(self._entries) >= self.size:
+                self._entries = {k: e for k, e in self._entries.items() if e[0] >= now}
+                if len(self._entries) >= self.size:
+                    self._entries.clear()
+            self._entries[key] = (now + self.ttl, value)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_cache = _TTLCache(STATS_CONFIG['cache_ttl'], STATS_CONFIG['cache_size'])
+
+
+def _floor(moment, granularity):
+    if granularity == 'day':
+        return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def _step(granularity):
+    return datetime.timedelta(days=1) if granularity == 'day' else datetime.timedelta(hours=1)
+
+
+def _parse_moment(value, name):
+    try:
+        return datetime.datetime.strptime(parse_timestamp(value), '%Y-%m-%d %H:%M:%S')
+    except InvalidQuery:
+        raise InvalidStats(f'invalid {name} {value!r}')
+
+
+def _parse_top(value):
+    if value is None or value == '':
+        return STATS_CONFIG['default_top']
+    try:
+        top = int(value)
+    except ValueError:
+        raise InvalidStats('invalid top')
+    if top < 1:
+        raise InvalidStats('invalid top')
+    return min(top, STATS_CONFIG['max_top'])
+
+
+def parse_request(args, now=None):
+    """(granularity, dimension, first bucket, end bucket, top) from request args"""
+    granularity = args.get('granularity') or 'day'
+    if granularity not in GRANULARITIES:
+        raise InvalidStats(f'unknown granularity {granularity!r}')
+    dimension = args.get('dimension') or 'all'
+    if dimension not in DIMENSIONS:
+        raise InvalidStats(f'unknown dimension {dimension!r}')
+    step = _step(granularity)
+    if args.get('to'):
+        end = _parse_moment(args['to'], 'to')
+        floor = _floor(end, granularity)
+        end = floor if floor == end else floor + step  # a bucket is shown if any of it is in range
+    else:
+        now = now or datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)  # created_at is UTC
+        end = _floor(now, granularity) + step
+    if args.get('from'):
+        start = _floor(_parse_moment(args['from'], 'from'), granularity)
+    else:
+        start = end - step * STATS_CONFIG['default_buckets'][granularity]
+    if start >= end:
+        raise InvalidStats('from must be before to')
+    if (end - start) / step > STATS_CONFIG['max_buckets'][granularity]:
+        raise InvalidStats(f'range too long for {granularity} buckets')
+    return granularity, dimension, start, end, _parse_top(args.get('top'))
+
+
+def _status_shares(counts, total):
+    return {status: round(count / total, 4) for status, count in counts.items()} if total else {}
+
+
+def _query(db, granularity, dimension, start, end, top):
+    rows = db.connection().execute('''
+        SELECT bucket, value, status, quotes FROM quote_rollups
+        WHERE granularity = ? AND dimension = ? AND bucket >= ? AND bucket < ? AND quotes <> 0
+        ORDER BY bucket
+    ''', (granularity, dimension, start.strftime('%Y-%m-%d %H:%M:%S'),
+          end.strftime('%Y-%m-%d %H:%M:%S'))).fetchall()
+
+    values = {}
+    for bucket, value, status, quotes in rows:
+        entry = values.setdefault(value, {'quotes': 0, 'status': {}, 'buckets': {}})
+        entry['quotes'] += quotes
+        entry['status'][status] = entry['status'].get(status, 0) + quotes
+        point = entry['buckets'].setdefault(bucket, {'bucket': bucket, 'quotes': 0, 'status': {}})
+        point['quotes'] += quotes
+        point['status'][status] = point['status'].get(status, 0) + quotes
+
+    total, total_status = 0, {}
+    for entry in values.values():
+        total += entry['quotes']
+        for status, count in entry['status'].items():
+            total_status[status] = total_status.get(status, 0) + count
+
+    ranked = sorted(values.items(), key=lambda item: (-item[1]['quotes'], item[0]))[:top]
+    series = [{
+        'value': value,
+        'quotes': entry['quotes'],
+        'status': entry['status'],
+        'conversion': _status_shares(entry['status'], entry['quotes']),
+        'points': list(entry['buckets'].values()),
+    } for value, entry in ranked]
+    return {
+        'granularity': granularity,
+        'dimension': dimension,
+        'from': start.strftime('%Y-%m-%d %H:%M:%S'),
+        'to': end.strftime('%Y-%m-%d %H:%M:%S'),
+        'total': {'quotes': total, 'status': total_status, 'conversion': _status_shares(total_status, total)},
+        'values': len(values),
+        'series': series,
+    }
+
+
+def quote_stats(db, args):
+    """Quote counts per bucket for one dimension, from the rollups (cached for cache_ttl)"""
+    key = parse_request(args)
+    cached = _cache.get(key)
+    if cached is not None:
+        metrics.inc('jlk_stats_requests_total', (('cache', 'hit'),))
+        return cached
+    metrics.inc('jlk_stats_requests_total', (('cache', 'miss'),))
+    result = _query(db, *key)
+    _cache.put(key, result)
+    return result
@@ -0,0 +1,82 @@
+"""
+Shared fixtures for the storage tests
+
+`db` is a freshly migrated database on each backend: a temporary SQLite
+file, and PostgreSQL when TEST_DATABASE_URL=postgresql://... names a
+server to use. Each PostgreSQL test gets its own schema, dropped
+afterwards, so the database can be shared and need not be empty. Without
+TEST_DATABASE_URL, psycopg or a reachable server the PostgreSQL cases are
+skipped.
+
+`client` is app.py's Flask test client on that database.
+"""
+
+import os
+import sys
+import uuid
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import migrations  # noqa: E402
+from database import Database  # noqa: E402
+
+POSTGRES_URL = os.environ.get('TEST_DATABASE_URL', '')
+
+
+def _postgres_database():
+    if not POSTGRES_URL.startswith(('postgres://', 'postgresql://')):
+        pytest.skip('TEST_DATABASE_URL is not a PostgreSQL URL')
+    try:
+        import psycopg
+        from psycopg.conninfo import make_conninfo
+        from postgres import PostgresDatabase
+    except ImportError:
+        pytest.skip('psycopg and psycopg_pool are not installed')
+    schema = f'jlk_test_{uuid.uuid4().hex[:12]}'
+    try:
+        with psycopg.connect(POSTGRES_URL, autocommit=True, connect_timeout=3) as conn:
+            conn.execute(f'CREATE SCHEMA {schema}')
+    except psycopg.OperationalError as e:
+        pytest.skip(f'PostgreSQL server not available: {e}')
+
+    db = PostgresDatabase(make_conninfo(POSTGRES_URL, options=f'-c search_path={schema}'),
+                          {'pool_min_size': 0, 'pool_timeout': 5})
+    try:
+        yield db
+    finally:
+        db.close_pool()
+        with psycopg.connect(POSTGRES_URL, autocommit=True) as conn:
+            conn.execute(f'DROP SCHEMA {schema} CASCADE')
+
+
+@pytest.fixture(params=['sqlite', 'postgresql'])
+def empty_db(request, tmp_path):
+    """An unmigrated database on each backend"""
+    if request.param == 'sqlite':
+        db = Database(str(tmp_path / 'test.db'))
+        yield db
+        db.close()
+    else:
+        yield from _postgres_database()
+
+
+@pytest.fixture
+def db(empty_db):
+    """A migrated database on each backend"""
+    migrations.migrate(empty_db)
+    return empty_db
+
+
+@pytest.fixture
+def client(db, tmp_path, monkeypatch):
+    """Flask test client of app.py on `db`, with its own rate limit table"""
+    import app
+    from rate_limit import RateLimiter
+    monkeypatch.setattr(app, 'db', db)
+    monkeypatch.setattr(app, 'store', db)
+    monkeypatch.setattr(app, 'limiter', RateLimiter({'path': str(tmp_path / 'rate_limit.bin')}))
+    return app.app.test_client()
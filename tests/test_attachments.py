@@ -0,0 +1,53 @@
+"""Attachment garbage collection: recounted references, dry runs and removed files"""
+
+import os
+import time
+
+import pytest
+
+import attachments
+from database import QUOTE_COLUMNS
+
+KEPT = 'aa' * 32
+STALE = 'bb' * 32
+OLD = time.time() - 7 * 24 * 3600
+
+
+@pytest.fixture
+def blobs(db, tmp_path, monkeypatch):
+    """One blob a quote references and one only a stale ref_count of 3 points at, both old"""
+    monkeypatch.setitem(attachments.ATTACHMENT_CONFIG, 'blob_dir', str(tmp_path / 'blobs'))
+    for digest in (KEPT, STALE):
+        for suffix in ('.png',) + attachments.VARIANT_SUFFIXES:
+            path = attachments.blob_path(digest, suffix)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(b'image')
+            os.utime(path, (OLD, OLD))
+    record = {column: '' for column in QUOTE_COLUMNS}
+    record.update(company_name='Acme', additional_services='[]', attachment_hash=KEPT)
+    with db.transaction() as cursor:
+        db.insert_quote(cursor, record)
+        for digest in (KEPT, STALE):
+            cursor.execute('INSERT INTO attachments (hash, extension, size, ref_count, updated_at) '
+                           'VALUES (?, ?, 5, 3, ?)', (digest, 'png', OLD))
+    return db
+
+
+def ref_counts(db):
+    return dict(db.connection().execute('SELECT hash, ref_count FROM attachments').fetchall())
+
+
+def test_dry_run_changes_nothing(blobs):
+    stats = attachments.collect_garbage(blobs, dry_run=True)
+    assert stats == {'unreferenced': 1, 'orphaned': 0, 'files_removed': 0}
+    assert ref_counts(blobs) == {KEPT: 3, STALE: 3}
+    assert os.path.exists(attachments.blob_path(STALE, '.png'))
+
+
+def test_collect_recounts_and_removes_unreferenced(blobs):
+    stats = attachments.collect_garbage(blobs)
+    assert stats == {'unreferenced': 1, 'orphaned': 0, 'files_removed': 3}
+    assert ref_counts(blobs) == {KEPT: 1}
+    assert not os.path.exists(attachments.blob_path(STALE, '.png'))
+    assert os.path.exists(attachments.blob_path(KEPT, '_thumb.jpg'))
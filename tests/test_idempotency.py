@@ -0,0 +1,120 @@
+"""Duplicate submission suppression: repeats, racing inserts, window expiry and replayed replies"""
+
+import time
+
+import pytest
+
+import idempotency
+from database import QUOTE_COLUMNS
+
+WINDOW = idempotency.IDEMPOTENCY_CONFIG['window']
+
+QUOTE_FORM = {
+    'companyName': 'Acme', 'contactName': 'Somchai', 'email': 'somchai@example.com',
+    'phone': '0812345678', 'serviceType': 'export', 'origin': 'Bangkok', 'destination': 'Tokyo',
+}
+
+
+class Clock:
+    def __init__(self, now):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock(time.time())
+    monkeypatch.setattr(idempotency, 'time', clock)
+    return clock
+
+
+def quote():
+    record = {column: '' for column in QUOTE_COLUMNS}
+    record.update(company_name='Acme', contact_name='Somchai', email='somchai@example.com',
+                  phone='0812345678', service_type='export', additional_services='[]', attachment_hash=None)
+    return record
+
+
+def key():
+    return idempotency.submission_key('quotes', {'companyName': 'Acme'})
+
+
+def count_quotes(db):
+    return db.connection().execute('SELECT COUNT(*) FROM quotes').fetchone()[0]
+
+
+def test_repeat_within_window_finds_original(db):
+    quote_id = db.save_quote(quote(), after_insert=idempotency.remember_hook(key(), {'estimate': 1200}))
+    assert idempotency.find_duplicate(db, key()) == (quote_id, {'estimate': 1200})
+    assert idempotency.find_duplicate(db, idempotency.submission_key('quotes', {'companyName': 'Other'})) is None
+
+
+def test_header_key_overrides_content():
+    first = idempotency.submission_key('quotes', {'a': 1}, header_key='abc')
+    assert first == idempotency.submission_key('quotes', {'a': 2}, header_key='abc')
+    assert first != idempotency.submission_key('quotes', {'a': 1})
+
+
+def test_racing_insert_is_rolled_back_and_answered_with_the_first(db):
+    first = db.save_quote(quote(), after_insert=idempotency.remember_hook(key(), {'email_sent': False}))
+    # The second post missed the lookup and got as far as its own insert
+    with pytest.raises(idempotency.DuplicateSubmission) as raised:
+        db.save_quote(quote(), after_insert=idempotency.remember_hook(key(), {'email_sent': True}))
+    assert (raised.value.record_id, raised.value.response) == (first, {'email_sent': False})
+    assert count_quotes(db) == 1
+
+
+def test_race_at_the_window_edge_still_names_the_first(db, clock):
+    first = db.save_quote(quote(), after_insert=idempotency.remember_hook(key()))
+    clock.now += WINDOW - 0.001
+    with pytest.raises(idempotency.DuplicateSubmission) as raised:
+        db.save_quote(quote(), after_insert=idempotency.remember_hook(key()))
+    # By the time a second lookup would run the key has expired
+    clock.now += 1
+    assert idempotency.find_duplicate(db, key()) is None
+    assert raised.value.record_id == first
+
+
+def test_expired_key_is_taken_over(db, clock):
+    db.save_quote(quote(), after_insert=idempotency.remember_hook(key()))
+    clock.now += WINDOW + 1
+    assert idempotency.find_duplicate(db, key()) is None
+    second = db.save_quote(quote(), after_insert=idempotency.remember_hook(key()))
+    assert idempotency.find_duplicate(db, key()) == (second, {})
+    assert count_quotes(db) == 2
+
+
+def test_update_response(db):
+    quote_id = db.save_quote(quote(), after_insert=idempotency.remember_hook(key(), {'estimate': None}))
+    idempotency.update_response(db, key(), quote_id, {'estimate': None, 'email_sent': False})
+    assert idempotency.find_duplicate(db, key()) == (quote_id, {'estimate': None, 'email_sent': False})
+
+
+def test_retried_quote_gets_the_original_reply(client):
+    # No SMTP password in the tests: the notification cannot be queued
+    first = client.post('/api/quote', json=QUOTE_FORM).get_json()
+    retried = client.post('/api/quote', json=QUOTE_FORM).get_json()
+    assert retried['duplicate'] is True
+    assert retried['quote_id'] == first['quote_id']
+    assert retried['message'] == first['message']
+    assert 'ไม่สามารถส่งอีเมลได้' in retried['message']
+
+
+def test_retried_quote_after_inline_email_failure(client, monkeypatch):
+    import app
+    monkeypatch.setattr(app, 'EMAIL_DELIVERY_MODE', 'inline')
+    monkeypatch.setattr(app, 'send_quote_email', lambda *args: False)
+    first = client.post('/api/quote', json=QUOTE_FORM).get_json()
+    retried = client.post('/api/quote', json=QUOTE_FORM).get_json()
+    assert (retried['quote_id'], retried['message']) == (first['quote_id'], first['message'])
+    assert 'ไม่สามารถส่งอีเมลได้' in retried['message']
+
+
+def test_retried_contact_gets_the_original_id(client):
+    form = {'name': 'Somchai', 'email': 'somchai@example.com', 'message': 'Hello'}
+    first = client.post('/api/contact', json=form).get_json()
+    retried = client.post('/api/contact', json=form).get_json()
+    assert retried['contact_id'] == first['contact_id']
+    assert retried['duplicate'] is True
@@ -0,0 +1,25 @@
+"""Cached HTML pages: unknown page names get the 404 page"""
+
+import pytest
+
+from page_cache import pages
+
+
+@pytest.fixture(params=[True, False], ids=['cached', 'uncached'])
+def page_client(request, client, monkeypatch):
+    monkeypatch.setitem(pages.config, 'enabled', request.param)
+    return client
+
+
+def test_unknown_page_is_404(page_client):
+    not_found = page_client.get('/404.html').get_data()
+    response = page_client.get('/nope.html')
+    assert response.status_code == 404
+    assert response.get_data() == not_found
+    assert 'nope.html' not in pages._pages
+
+
+def test_known_page(page_client):
+    response = page_client.get('/about.html')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/html'
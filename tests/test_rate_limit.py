@@ -0,0 +1,75 @@
+"""Token bucket rate limiter: bursts, refill, separate keys and the 429 reply"""
+
+import pytest
+
+import rate_limit
+from rate_limit import RateLimiter
+
+
+class Clock:
+    def __init__(self, now):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock(1_000_000.0)
+    monkeypatch.setattr(rate_limit, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def limiter(tmp_path):
+    return RateLimiter({'path': str(tmp_path / 'rate_limit.bin'), 'ip_burst': 3, 'ip_per_minute': 6})
+
+
+def test_burst_then_retry_after(limiter, clock):
+    assert [limiter.check('quote', 'ip', '203.0.113.5') for _ in range(3)] == [0.0] * 3
+    # 6 a minute: the next token is 10 seconds away
+    assert limiter.check('quote', 'ip', '203.0.113.5') == pytest.approx(10.0)
+    clock.now += 4
+    assert limiter.check('quote', 'ip', '203.0.113.5') == pytest.approx(6.0)
+
+
+def test_bucket_refills(limiter, clock):
+    for _ in range(3):
+        limiter.check('quote', 'ip', '203.0.113.5')
+    clock.now += 10
+    assert limiter.check('quote', 'ip', '203.0.113.5') == 0.0
+    assert limiter.check('quote', 'ip', '203.0.113.5') > 0
+
+
+def test_keys_and_scopes_are_separate(limiter, clock):
+    for _ in range(3):
+        limiter.check('quote', 'ip', '203.0.113.5')
+    assert limiter.check('quote', 'ip', '203.0.113.5') > 0
+    assert limiter.check('quote', 'ip', '203.0.113.6') == 0.0
+    assert limiter.check('contact', 'ip', '203.0.113.5') == 0.0
+
+
+def test_table_is_shared_through_the_file(limiter, clock):
+    for _ in range(3):
+        limiter.check('quote', 'ip', '203.0.113.5')
+    other = RateLimiter(dict(limiter.config))
+    assert other.check('quote', 'ip', '203.0.113.5') > 0
+
+
+def test_disabled_or_missing_value_is_allowed(tmp_path, clock):
+    limiter = RateLimiter({'path': str(tmp_path / 'rate_limit.bin'), 'ip_burst': 1, 'enabled': False})
+    assert [limiter.check('quote', 'ip', '203.0.113.5') for _ in range(5)] == [0.0] * 5
+    limiter = RateLimiter({'path': str(tmp_path / 'rate_limit.bin'), 'email_burst': 1})
+    assert [limiter.check('quote', 'email', '') for _ in range(5)] == [0.0] * 5
+
+
+def test_too_many_posts_get_429_with_retry_after(client):
+    import app
+    app.limiter.config.update(ip_burst=2, ip_per_minute=6)
+    forms = [{'name': 'Somchai', 'email': f'user{i}@example.com', 'message': 'Hello'} for i in range(3)]
+    assert [client.post('/api/contact', json=form).status_code for form in forms[:2]] == [200, 200]
+    response = client.post('/api/contact', json=forms[2])
+    assert response.status_code == 429
+    assert response.get_json()['message'] == app.RATE_LIMIT_MESSAGE
+    assert 1 <= int(response.headers['Retry-After']) <= 10
@@ -0,0 +1,58 @@
+"""Full-text search: every match is ranked, and quotes and contacts are interleaved"""
+
+import pytest
+
+import search
+from database import CONTACT_COLUMNS, QUOTE_COLUMNS
+
+
+@pytest.fixture
+def sqlite_db(db):
+    if db.dialect != 'sqlite':
+        pytest.skip('full-text search is SQLite only')
+    return db
+
+
+def add(db, quotes=(), contacts=()):
+    with db.transaction() as cursor:
+        for values in quotes:
+            record = {column: '' for column in QUOTE_COLUMNS}
+            record.update(additional_services='[]', attachment_hash=None)
+            record.update(values)
+            db.insert_quote(cursor, record)
+        for values in contacts:
+            record = {column: '' for column in CONTACT_COLUMNS}
+            record.update(values)
+            db.insert_contact(cursor, record)
+
+
+def test_old_best_match_is_found(sqlite_db):
+    # The best match is the oldest row, behind thousands of newer weak ones
+    add(sqlite_db, [{'company_name': 'Freight Freight Co'}]
+        + [{'company_name': f'Company {i}', 'description': f'freight lot {i} and other general cargo'}
+           for i in range(3000)])
+    hits = search.search(sqlite_db, 'freight', tables=('quotes',), limit=1)
+    assert hits[0]['company_name'] == 'Freight Freight Co'
+    assert '<mark>' in hits[0]['snippet']
+
+
+def test_tables_are_interleaved(sqlite_db):
+    add(sqlite_db, quotes=[{'company_name': f'Siam Cargo {i}'} for i in range(3)],
+        contacts=[{'name': 'Somchai', 'message': 'cargo question'}])
+    hits = search.search(sqlite_db, 'cargo', limit=3)
+    assert [hit['type'] for hit in hits] == ['quotes', 'contacts', 'quotes']
+
+
+def test_short_terms_filter_ranked_matches(sqlite_db):
+    add(sqlite_db, [{'company_name': 'Acme Freight', 'origin': 'BK'},
+                    {'company_name': 'Acme Freight Freight', 'origin': 'TK'}])
+    hits = search.search(sqlite_db, 'freight BK', tables=('quotes',))
+    assert [hit['company_name'] for hit in hits] == ['Acme Freight']
+    hits = search.search(sqlite_db, 'TK', tables=('quotes',))
+    assert [hit['company_name'] for hit in hits] == ['Acme Freight Freight']
+
+
+def test_interleave():
+    assert search.interleave([[1, 2, 3], ['a']], 10) == [1, 'a', 2, 3]
+    assert search.interleave([[1, 2, 3], ['a', 'b']], 3) == [1, 'a', 2]
+    assert search.interleave([], 5) == []
@@ -0,0 +1,226 @@
+"""Storage layer on SQLite and PostgreSQL: migrations, transactions, paging and export"""
+
+import csv
+import io
+import json
+import threading
+import time
+
+import pytest
+
+import export
+import mail_queue
+import migrations
+import queries
+from database import QUOTE_COLUMNS, chain_hooks
+
+TABLES = ('quotes', 'contacts', 'email_outbox', 'attachments', 'submission_keys',
+          'quote_rollups', 'broken_links', 'schema_migrations')
+
+
+def quote(**values):
+    record = {column: '' for column in QUOTE_COLUMNS}
+    record.update(company_name='Acme', contact_name='Somchai', email='somchai@example.com',
+                  phone='0812345678', service_type='export', urgency='standard',
+                  additional_services='[]', attachment_hash=None)
+    record.update(values)
+    return record
+
+
+def add_quotes(db, created_at):
+    """Insert one quote per created_at value; returns their ids"""
+    ids = []
+    with db.transaction() as cursor:
+        for i, timestamp in enumerate(created_at):
+            db.insert_quote(cursor, quote(company_name=f'Company {i}'))
+            ids.append(cursor.lastrowid)
+            cursor.execute('UPDATE quotes SET created_at = ? WHERE id = ?', (timestamp, ids[-1]))
+    return ids
+
+
+def read_page(db, table, args):
+    return json.loads(''.join(queries.stream_page(db, table, args)))
+
+
+def test_migrations_create_every_table(empty_db):
+    versions = [version for version, _, _ in migrations.MIGRATIONS[empty_db.dialect]]
+    assert [version for version, _ in migrations.pending(empty_db)] == versions
+
+    assert migrations.migrate(empty_db, target=3) == versions[:3]
+    assert migrations.migrate(empty_db) == versions[3:]
+    assert migrations.pending(empty_db) == []
+    assert migrations.migrate(empty_db) == []
+
+    conn = empty_db.connection()
+    for table in TABLES:
+        assert conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0] >= 0
+
+
+def test_migrations_match_across_dialects():
+    sqlite = [(version, name) for version, name, _ in migrations.MIGRATIONS['sqlite']]
+    postgresql = [(version, name) for version, name, _ in migrations.MIGRATIONS['postgresql']]
+    assert sqlite == postgresql
+
+
+def test_placeholders_and_rows(db):
+    add_quotes(db, ['2024-01-01 10:00:00', '2024-01-02 10:00:00'])
+    # A literal '%' next to '?' placeholders must survive the translation to psycopg's '%s'
+    rows = db.connection().execute(
+        "SELECT id, company_name, created_at FROM quotes WHERE company_name LIKE ? AND email LIKE '%@%' "
+        'AND created_at >= ? ORDER BY id', ('Company%', '2024-01-02')).fetchall()
+    assert len(rows) == 1
+    assert rows[0]['company_name'] == rows[0][1] == 'Company 1'
+    assert rows[0]['created_at'] == '2024-01-02 10:00:00'
+
+
+def test_translate_escapes_percent():
+    postgres = pytest.importorskip('postgres')
+    assert postgres._translate("SELECT ? WHERE a LIKE '%x'") == "SELECT %s WHERE a LIKE '%%x'"
+
+
+def test_begin_immediate_serializes_writers(db):
+    conn = db.connection()
+    cursor = conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    acquired = []
+
+    def second_writer():
+        other = db.connection().cursor()
+        other.execute('BEGIN IMMEDIATE')
+        acquired.append(time.monotonic())
+        db.connection().commit()
+        db.release()
+
+    thread = threading.Thread(target=second_writer)
+    thread.start()
+    time.sleep(0.3)
+    assert acquired == []
+    committed = time.monotonic()
+    conn.commit()
+    thread.join(5)
+    assert acquired and acquired[0] >= committed
+
+
+def test_insert_many_returns_ids_in_order(db):
+    first = add_quotes(db, ['2024-01-01 00:00:00'])[0]
+    rows = [tuple(quote(company_name=f'Batch {i}').get(column, '') for column in QUOTE_COLUMNS) for i in range(5)]
+    with db.transaction() as cursor:
+        ids = db.insert_many(cursor, 'quotes', rows)
+    assert len(ids) == 5 and ids == sorted(ids) and ids[0] > first
+    names = dict(db.connection().execute('SELECT id, company_name FROM quotes').fetchall())
+    assert [names[row_id] for row_id in ids] == [f'Batch {i}' for i in range(5)]
+
+
+def test_save_quote_with_outbox_rows(db):
+    def enqueue(cursor, quote_id):
+        mail_queue.enqueue_email(cursor, 'sales@example.com', 'New quote', '<p>hi</p>', quote_id=quote_id)
+
+    def enqueue_held(cursor, quote_id):
+        mail_queue.enqueue_email(cursor, 'sales@example.com', 'New quote', '<p>hi</p>', quote_id=quote_id,
+                                 hold=True)
+
+    quote_id = db.save_quote(quote(), after_insert=chain_hooks(enqueue, enqueue_held))
+    conn = db.connection()
+    rows = conn.execute('SELECT quote_id, status FROM email_outbox ORDER BY id').fetchall()
+    assert [tuple(row) for row in rows] == [(quote_id, mail_queue.STATUS_PENDING), (quote_id, mail_queue.STATUS_HELD)]
+    assert mail_queue.count_pending(conn) == 1
+    assert mail_queue.count_held(conn) == 1
+
+
+def test_save_quote_rolls_back_with_its_hooks(db):
+    def fail(cursor, quote_id):
+        mail_queue.enqueue_email(cursor, 'sales@example.com', 'New quote', '<p>hi</p>', quote_id=quote_id)
+        raise RuntimeError('hook failed')
+
+    with pytest.raises(RuntimeError):
+        db.save_quote(quote(), after_insert=fail)
+    conn = db.connection()
+    assert conn.execute('SELECT COUNT(*) FROM quotes').fetchone()[0] == 0
+    assert conn.execute('SELECT COUNT(*) FROM email_outbox').fetchone()[0] == 0
+
+
+def test_keyset_pagination_walks_every_row_once(db):
+    # Repeated timestamps: the id breaks ties between pages
+    created_at = [f'2024-01-{day:02d} 12:00:00' for day in (1, 1, 1, 2, 3, 3, 4, 5, 5, 5, 5, 6)]
+    ids = add_quotes(db, created_at)
+    expected = [row_id for _, row_id in sorted(zip(created_at, ids), reverse=True)]
+
+    seen, args = [], {'limit': '5'}
+    while True:
+        page = read_page(db, 'quotes', args)
+        assert page['count'] == len(page['items']) <= 5
+        seen.extend(item['id'] for item in page['items'])
+        if page['next_cursor'] is None:
+            break
+        args = {'limit': '5', 'cursor': page['next_cursor']}
+    assert seen == expected
+
+    page = read_page(db, 'quotes', {'limit': '12'})
+    assert page['count'] == 12 and page['next_cursor'] is None
+
+
+def test_page_filters(db):
+    add_quotes(db, ['2024-01-01 00:00:00', '2024-02-01 00:00:00', '2024-03-01 00:00:00'])
+    page = read_page(db, 'quotes', {'created_from': '2024-01-15', 'created_to': '2024-03-01'})
+    assert [item['created_at'] for item in page['items']] == ['2024-02-01 00:00:00']
+    assert read_page(db, 'quotes', {'status': 'closed'})['items'] == []
+
+
+def test_page_streams_after_the_request_connection_is_released(db):
+    add_quotes(db, ['2024-01-01 00:00:00', '2024-01-02 00:00:00', '2024-01-03 00:00:00'])
+    chunks = queries.stream_page(db, 'quotes', {'limit': '2'})
+    first = next(chunks)
+    db.release()  # what teardown does before the response body is sent
+    page = json.loads(first + ''.join(chunks))
+    assert page['count'] == 2 and page['next_cursor'] is not None
+
+
+def test_page_reads_through_a_server_side_cursor(db, monkeypatch):
+    if db.dialect != 'postgresql':
+        pytest.skip('PostgreSQL only')
+    monkeypatch.setitem(queries.QUERY_CONFIG, 'fetch_size', 1)
+    add_quotes(db, ['2024-01-01 00:00:00', '2024-01-02 00:00:00', '2024-01-03 00:00:00'])
+
+    def cursor_sessions():
+        with db.pool().connection() as conn:
+            return conn.execute(
+                "SELECT COUNT(*) FROM pg_stat_activity WHERE datname = current_database() "
+                "AND pid <> pg_backend_pid() AND query LIKE '%jlk_batches%' AND query NOT LIKE 'CLOSE%'"
+            ).fetchone()[0]
+
+    chunks = queries.stream_page(db, 'quotes', {'limit': '2'})
+    first = next(chunks) + next(chunks)
+    db.release()
+    assert cursor_sessions() == 1  # rows are still being fetched, one batch at a time
+    page = json.loads(first + ''.join(chunks))
+    assert page['count'] == 2
+    assert cursor_sessions() == 0
+
+
+def test_export_csv_and_jsonl(db):
+    with db.transaction() as cursor:
+        db.insert_quote(cursor, quote(company_name='First', additional_services='["Insurance"]'))
+        db.insert_quote(cursor, quote(company_name='ลูกค้า', additional_services='["Customs clearance", "Insurance"]'))
+        db.insert_quote(cursor, quote(company_name='Third', additional_services=''))
+
+    text = b''.join(export.export_stream(db, 'quotes', 'csv')).decode('utf-8')
+    table = list(csv.reader(io.StringIO(text)))
+    header, rows = table[0], table[1:]
+    assert header[-2:] == ['additional_customs_clearance', 'additional_insurance']
+    assert 'additional_services' not in header
+    assert [row[header.index('company_name')] for row in rows] == ['First', 'ลูกค้า', 'Third']
+    assert [row[-2:] for row in rows] == [['False', 'True'], ['True', 'True'], ['False', 'False']]
+
+    lines = b''.join(export.export_stream(db, 'quotes', 'jsonl')).decode('utf-8').splitlines()
+    records = [json.loads(line) for line in lines]
+    assert [record['company_name'] for record in records] == ['First', 'ลูกค้า', 'Third']
+    assert records[1]['additional_customs_clearance'] is True
+    assert isinstance(records[0]['id'], int)
+
+
+def test_export_date_range(db):
+    add_quotes(db, ['2024-01-01 00:00:00', '2024-02-01 00:00:00', '2024-03-01 00:00:00'])
+    lines = b''.join(export.export_stream(db, 'quotes', 'jsonl', created_from='2024-02-01')).splitlines()
+    assert [json.loads(line)['created_at'] for line in lines] == ['2024-02-01 00:00:00', '2024-03-01 00:00:00']
+    with pytest.raises(export.InvalidExport):
+        export.export_stream(db, 'quotes', 'jsonl', created_from='yesterday')
@@ -0,0 +1,61 @@
+"""Which image URLs the quote notification links, decided when it is sent"""
+
+import os
+
+import pytest
+
+import attachments
+from email_templates import render_quote_email
+from uploads import StoredImage
+
+DIGEST = 'ab' * 32
+BASE_URL = 'https://jlk.example/'
+
+
+@pytest.fixture
+def blob_dir(tmp_path, monkeypatch):
+    monkeypatch.setitem(attachments.ATTACHMENT_CONFIG, 'blob_dir', str(tmp_path / 'blobs'))
+    return tmp_path / 'blobs'
+
+
+def write_variants(*suffixes):
+    for suffix in suffixes:
+        path = attachments.blob_path(DIGEST, suffix)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(b'jpeg')
+
+
+def email(image):
+    # What the request renders: the original upload, before any variant exists
+    return render_quote_email({'companyName': 'Acme'}, image.url, BASE_URL)
+
+
+def test_original_stays_linked_until_variants_exist(blob_dir):
+    image = StoredImage(DIGEST, 'png', 1024)
+    html = email(image)
+    assert attachments.link_variants(html) == html
+    assert f'src="https://jlk.example{image.url}"' in html
+
+
+def test_written_variants_are_linked_at_send_time(blob_dir):
+    image = StoredImage(DIGEST, 'png', 1024)
+    html = email(image)
+    write_variants(*attachments.VARIANT_SUFFIXES)
+    sent = attachments.link_variants(html)
+    assert f'src="https://jlk.example{image.thumbnail_url}"' in sent
+    assert f'href="https://jlk.example{image.web_url}"' in sent
+    assert image.url not in sent
+
+
+def test_half_written_variants_keep_the_original(blob_dir):
+    # Generation failed after the web variant, or the thumbnail is still being written
+    image = StoredImage(DIGEST, 'png', 1024)
+    html = email(image)
+    write_variants('_web.jpg')
+    assert attachments.link_variants(html) == html
+
+
+def test_email_without_an_image_is_unchanged(blob_dir):
+    html = render_quote_email({'companyName': 'Acme'}, None, BASE_URL)
+    assert attachments.link_variants(html) is html
@@ -0,0 +1,239 @@
+"""
+JLK Transservice - Image upload pipeline
+
+Uploads are streamed straight to a temporary file in the upload directory
+while the multipart body is parsed, counting and hashing bytes as they
+arrive, so an oversized attachment is rejected as soon as it crosses the
+limit instead of being spooled in full first. The hash names the file in
+the content-addressed blob store (see attachments.py).
+
+The real image type is read by Pillow from the file's magic bytes (only the
+header is decoded in the request). Generating the compressed web-sized
+variant and the small email thumbnail is handed to a process pool, so the
+request worker never decodes full images itself, nor waits for them: the
+notification is rendered with the original upload's URL, and switched to
+the variants when it is sent if their files exist by then (see
+attachments.link_variants). Each variant is written under a temporary
+name and renamed, so a variant file that exists is complete.
+"""
+
+import hashlib
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from flask import Request
+from PIL import Image, ImageOps, UnidentifiedImageError
+from werkzeug.exceptions import RequestEntityTooLarge
+
+import attachments
+
+logger = logging.getLogger(__name__)
+
+# Image hosting configuration
+IMAGE_UPLOAD_CONFIG = {
+    'max_size': 5 * 1024 * 1024,  # 5MB
+    'max_form_overhead': 256 * 1024,  # room for the text fields of a multipart post
+    'allowed_extensions': {'png', 'jpg', 'jpeg', 'gif', 'webp'},
+    'upload_dir': 'static/uploads',
+    'web_max_dimension': 1600,  # px, longest side of the web variant
+    'web_quality': 82,
+    'thumbnail_size': 320,  # px, longest side of the email thumbnail
+    'thumbnail_quality': 75,
+    'process_workers': int(os.environ.get('IMAGE_PROCESS_WORKERS', '2')),
+}
+
+# Pillow format -> file extension
+IMAGE_FORMATS = {
+    'JPEG': 'jpg',
+    'PNG': 'png',
+    'GIF': 'gif',
+    'WEBP': 'webp',
+}
+
+
+class UploadTooLarge(RequestEntityTooLarge):
+    """The attachment grew past IMAGE_UPLOAD_CONFIG['max_size'] while streaming"""
+
+
+class InvalidImage(ValueError):
+    """The attachment is not an image type we accept"""
+
+
+class _LimitedUploadFile:
+    """Temporary upload file that hashes its content and refuses to grow past a byte limit"""
+
+    def __init__(self, fileobj, limit):
+        self._file = fileobj
+        self.limit = limit
+        self.size = 0
+        self.sha256 = hashlib.sha256()
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.limit:
+            raise UploadTooLarge()
+        self.sha256.update(data)
+        return self._file.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+    def __iter__(self):
+        return iter(self._file)
+
+
+class UploadRequest(Request):
+    """Request class whose file parts stream to disk under a size limit"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        incoming = os.path.join(IMAGE_UPLOAD_CONFIG['upload_dir'], '.incoming')
+        os.makedirs(incoming, exist_ok=True)
+        # Deleted automatically when Werkzeug closes the request's files
+        fileobj = tempfile.NamedTemporaryFile(dir=incoming, prefix='upload-')
+        return _LimitedUploadFile(fileobj, IMAGE_UPLOAD_CONFIG['max_size'])
+
+
+def upload_digest(file):
+    """SHA-256 of an attachment's content (already computed if it was streamed by UploadRequest)"""
+    if isinstance(file.stream, _LimitedUploadFile):
+        return file.stream.sha256.hexdigest()
+    sha256 = hashlib.sha256()
+    file.stream.seek(0)
+    for chunk in iter(lambda: file.stream.read(64 * 1024), b''):
+        sha256.update(chunk)
+    file.stream.seek(0)
+    return sha256.hexdigest()
+
+
+def request_too_large(content_length):
+    """Cheap pre-check against the Content-Length header before parsing anything"""
+    limit = IMAGE_UPLOAD_CONFIG['max_size'] + IMAGE_UPLOAD_CONFIG['max_form_overhead']
+    return content_length is not None and content_length > limit
+
+
+def detect_image_format(path):
+    """Return the file extension for the image at path, judged by its content"""
+    try:
+        # Image.open only reads the header (magic bytes + dimensions)
+        with Image.open(path) as image:
+            image_format = image.format
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError):
+        raise InvalidImage('unrecognised image data')
+    extension = IMAGE_FORMATS.get(image_format)
+    if extension is None or extension not in IMAGE_UPLOAD_CONFIG['allowed_extensions']:
+        raise InvalidImage(f'unsupported image format {image_format}')
+    return extension
+
+
+def _save_variant(image, path, max_dimension, quality):
+    variant = image.copy()
+    variant.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    variant.save(temp_path, 'JPEG', quality=quality, optimize=True, progressive=True)
+    os.replace(temp_path, path)
+
+
+def generate_variants(source_path, web_path, thumbnail_path, config):
+    """Decode the upload and write the web-sized and thumbnail JPEGs (runs in the pool)"""
+    with Image.open(source_path) as image:
+        image.seek(0)  # first frame of animated GIF/WebP
+        image = ImageOps.exif_transpose(image)
+        if image.mode in ('RGBA', 'LA', 'P'):
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+
+        _save_variant(image, web_path, config['web_max_dimension'], config['web_quality'])
+        _save_variant(image, thumbnail_path, config['thumbnail_size'], config['thumbnail_quality'])
+    return web_path, thumbnail_path
+
+
+class ImageProcessor:
+    """Lazily created, fork-aware process pool for image variants"""
+
+    def __init__(self, workers):
+        self.workers = workers
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                # forkserver children do not inherit this worker's threads or sockets
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else None)
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+                self._pid = os.getpid()
+            return self._executor
+
+    def submit(self, source_path, web_path, thumbnail_path):
+        future = self._pool().submit(generate_variants, source_path, web_path, thumbnail_path,
+                                     dict(IMAGE_UPLOAD_CONFIG))
+        future.add_done_callback(_log_failure)
+        return future
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown(wait=wait)
+            self._executor = None
+
+
+def _log_failure(future):
+    error = future.exception()
+    if error is not None:
+        logger.error("Image variant generation failed: %s", error)
+
+
+processor = ImageProcessor(IMAGE_UPLOAD_CONFIG['process_workers'])
+
+
+class StoredImage:
+    """A stored upload: its content hash and the URLs of the blob and its variants"""
+
+    def __init__(self, digest, extension, size, future=None):
+        self.digest = digest
+        self.extension = extension
+        self.size = size
+        self.url = attachments.blob_url(digest, '.' + extension)
+        self.web_url = attachments.blob_url(digest, '_web.jpg')
+        self.thumbnail_url = attachments.blob_url(digest, '_thumb.jpg')
+        self.future = future
+
+
+def store_upload(file):
+    """Validate a streamed upload, store it by content hash and queue missing variants"""
+    spooled = None
+    if isinstance(file.stream, _LimitedUploadFile):
+        upload = file.stream
+    else:
+        # Not parsed through UploadRequest (e.g. a hand-built FileStorage); spool it ourselves
+        spooled = tempfile.NamedTemporaryFile(dir=IMAGE_UPLOAD_CONFIG['upload_dir'], prefix='upload-')
+        upload = _LimitedUploadFile(spooled, IMAGE_UPLOAD_CONFIG['max_size'])
+        file.save(upload)
+
+    try:
+        upload.flush()
+        extension = detect_image_format(upload.name)
+        digest = upload.sha256.hexdigest()
+        # Identical bytes are stored once; the temp name goes away when it is closed
+        attachments.store_blob(upload.name, digest, extension)
+    finally:
+        if spooled is not None:
+            spooled.close()
+
+    stored = StoredImage(digest, extension, upload.size)
+    web_path = attachments.blob_path(digest, '_web.jpg')
+    thumbnail_path = attachments.blob_path(digest, '_thumb.jpg')
+    if not (os.path.exists(web_path) and os.path.exists(thumbnail_path)):
+        stored.future = processor.submit(attachments.blob_path(digest, '.' + extension),
+                                         web_path, thumbnail_path)
+    return stored